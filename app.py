@@ -1,9 +1,19 @@
 import streamlit as st
 import os
 import time
+import hashlib
+import threading
 from datetime import datetime
 from pdf_processor_simple import PDFProcessorSimple
-from chat_agent.chat_agent import stream_graph_updates
+from model_registry import registry
+from ingestion_jobs import get_job_queue
+from chat_agent.chat_agent import (
+    astream_graph_events, get_prompt_cache_stats, get_response_cache_stats, get_thread_transcript
+)
+from background_loop import iterate_sync
+from chat_agent.weather_client import get_weather_client
+from startup import get_startup_profile, start_warmup
+from tracing import get_tracer, start_metrics_server
 import uuid
 
 st.set_page_config(page_title="AI Chatbot", page_icon="🤖", layout="wide")
@@ -15,20 +25,78 @@ def get_secret(key):
     except:
         return os.getenv(key)
 
+# Load the embedder, vector store, LLM and agent graph in the background while
+# the first page renders (once per process; STARTUP_WARMUP=0 to disable)
+start_warmup(get_secret("QDRANT_URL"), get_secret("VECTOR_NAME"))
+# Prometheus /metrics for the pipeline stage timings (METRICS_PORT, off by default)
+start_metrics_server()
+
+class SharedDocuments:
+    """Which sessions in this process hold each indexed document and upload file.
+    
+    Content dedup hands every session of a user the same document id and
+    every session the same file under uploads/, so one session deleting its
+    copy must not remove them while another session still lists them.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._holders = {}
+    
+    def acquire(self, key: str, session_id: str):
+        with self._lock:
+            self._holders.setdefault(key, set()).add(session_id)
+    
+    def release(self, key: str, session_id: str) -> bool:
+        """Drop session_id's hold on key; True if no other session holds it"""
+        with self._lock:
+            holders = self._holders.get(key, set())
+            holders.discard(session_id)
+            if holders:
+                return False
+            self._holders.pop(key, None)
+            return True
+
+def get_shared_documents() -> SharedDocuments:
+    return registry.get_or_create("shared_documents", (), SharedDocuments)
+
 def initialize_session_state():
     if 'chatbot_started' not in st.session_state:
         st.session_state.chatbot_started = False
     if 'messages' not in st.session_state:
         st.session_state.messages = []
+    if 'thread_id' not in st.session_state:
+        # The thread id lives in the URL so a reload or server restart resumes
+        # the same persisted agent state
+        thread_id = st.query_params.get("thread") or str(uuid.uuid4())
+        st.query_params["thread"] = thread_id
+        st.session_state.thread_id = thread_id
+        if not st.session_state.messages:
+            try:
+                transcript = get_thread_transcript(thread_id)
+            except Exception as e:
+                print(f"Could not restore thread {thread_id}: {str(e)}")
+                transcript = []
+            if transcript:
+                st.session_state.messages = transcript
+                st.session_state.chatbot_started = True
     if 'uploaded_documents' not in st.session_state:
         st.session_state.uploaded_documents = []
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
+    if 'user_id' not in st.session_state:
+        # Set APP_USER_ID per deployment/tenant to keep each user's documents separate
+        st.session_state.user_id = get_secret("APP_USER_ID") or "default_user"
+    if 'search_document_ids' not in st.session_state:
+        st.session_state.search_document_ids = []
     if 'pdf_processor' not in st.session_state:
         try:
             # Get Qdrant configuration from environment/secrets
             qdrant_url = get_secret("QDRANT_URL")
             collection_name = get_secret("VECTOR_NAME")
             
-            st.session_state.pdf_processor = PDFProcessorSimple(
+            # Shared across sessions: one warm embedder and Qdrant client per process
+            st.session_state.pdf_processor = PDFProcessorSimple.get_shared(
                 qdrant_url=qdrant_url,
                 collection_name=collection_name
             )
@@ -37,19 +105,31 @@ def initialize_session_state():
             st.session_state.pdf_processor = None
 
 def save_uploaded_file(uploaded_file):
-    """Save uploaded file and add to session state"""
+    """Save uploaded file and add to session state.
+    
+    Files are stored and identified by the hash of their bytes, so uploading
+    the same file again neither writes a new copy nor, for the same user,
+    re-indexes it.
+    """
     if uploaded_file is not None:
         # Create uploads directory if it doesn't exist
         if not os.path.exists("uploads"):
             os.makedirs("uploads")
         
-        # Save file with timestamp to avoid conflicts
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{uploaded_file.name}"
+        file_bytes = uploaded_file.getbuffer()
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+        
+        # Same content already in this session's list
+        for doc in st.session_state.uploaded_documents:
+            if doc.get("content_hash") == content_hash:
+                return True, doc
+        
+        filename = f"{content_hash[:16]}_{uploaded_file.name}"
         file_path = os.path.join("uploads", filename)
         
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        if not os.path.exists(file_path):
+            with open(file_path, "wb") as f:
+                f.write(file_bytes)
         
         # Add to uploaded documents list
         doc_info = {
@@ -59,41 +139,81 @@ def save_uploaded_file(uploaded_file):
             "type": uploaded_file.type,
             "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "processed": False,
-            "document_id": str(uuid.uuid4())
+            "document_id": str(uuid.uuid4()),
+            "content_hash": content_hash
         }
         
-        if doc_info not in st.session_state.uploaded_documents:
-            st.session_state.uploaded_documents.append(doc_info)
+        # Reuse this user's existing index entry if this content was processed before
+        if st.session_state.pdf_processor:
+            existing = st.session_state.pdf_processor.find_document_by_hash(content_hash, st.session_state.user_id)
+            if existing:
+                doc_info["document_id"] = existing["document_id"] or doc_info["document_id"]
+                doc_info["processed"] = True
+                doc_info["vector_ids"] = existing["point_ids"]
+                doc_info["already_indexed"] = True
+        
+        shared = get_shared_documents()
+        shared.acquire(doc_info["document_id"], st.session_state.session_id)
+        shared.acquire(file_path, st.session_state.session_id)
+        st.session_state.uploaded_documents.append(doc_info)
         
         return True, doc_info
     return False, None
 
-def process_document_with_qdrant(doc_info, user_id="default_user"):
-    """Process document using PDF processor with Qdrant"""
+def delete_uploaded_document(doc):
+    """Remove a document from this session, and from the index and disk once no other session holds it"""
+    shared = get_shared_documents()
+    session_id = st.session_state.session_id
+    if shared.release(doc["document_id"], session_id):
+        if doc.get("processed", False) and st.session_state.pdf_processor:
+            st.session_state.pdf_processor.delete_document(doc["document_id"])
+    if shared.release(doc["path"], session_id) and os.path.exists(doc["path"]):
+        os.remove(doc["path"])
+
+def queue_document_for_processing(doc_info, user_id="default_user"):
+    """Queue document for background ingestion into Qdrant"""
     try:
         if st.session_state.pdf_processor is None:
             st.error("PDF processor not available")
-            return False, []
+            return False, None
         
-        # Process with PDF processor
-        processed_ids = st.session_state.pdf_processor.process_pdf_file(
-            pdf_path=doc_info["path"],
+        job_id = get_job_queue().submit(
+            doc_info,
             user_id=user_id,
             document_category="user_upload",
-            document_id=doc_info["document_id"]
+            qdrant_url=st.session_state.pdf_processor.qdrant_url,
+            collection_name=st.session_state.pdf_processor.collection_name
         )
-        
-        # Mark as processed
-        for doc in st.session_state.uploaded_documents:
-            if doc["document_id"] == doc_info["document_id"]:
-                doc["processed"] = True
-                doc["vector_ids"] = processed_ids
-                break
-        
-        return True, processed_ids
+        doc_info["job_id"] = job_id
+        doc_info["job_status"] = "queued"
+        return True, job_id
     except Exception as e:
-        st.error(f"Error processing document: {str(e)}")
-        return False, []
+        st.error(f"Error queueing document: {str(e)}")
+        return False, None
+
+def sync_job_status():
+    """Copy background job state into this session's document list.
+    
+    Returns True while any of the session's documents is still queued or running.
+    """
+    queue = get_job_queue()
+    active = False
+    for doc in st.session_state.uploaded_documents:
+        if not doc.get("job_id") or doc.get("processed", False):
+            continue
+        job = queue.get_job(doc["job_id"])
+        if job is None:
+            continue
+        doc["job_status"] = job["status"]
+        doc["job_progress"] = (job["pages_done"], job["total_pages"], job["chunks_done"])
+        if job["status"] == "done":
+            doc["processed"] = True
+            doc["vector_ids"] = job["vector_ids"]
+        elif job["status"] == "failed":
+            doc["job_error"] = job["error"]
+        else:
+            active = True
+    return active
 
 def format_file_size(size_bytes):
     """Convert bytes to human readable format"""
@@ -106,23 +226,119 @@ def format_file_size(size_bytes):
     s = round(size_bytes / p, 2)
     return f"{s} {size_names[i]}"
 
-def get_chatbot_response(user_message):
-    """Get response from integrated chat agent"""
+def get_conversation_history():
+    """Convert session messages to conversation history format"""
+    conversation_history = []
+    for msg in st.session_state.messages:
+        if msg["role"] == "user":
+            conversation_history.append({"sender": "user", "message": msg["content"]})
+        elif msg["role"] == "assistant":
+            conversation_history.append({"sender": "system", "message": msg["content"]})
+    return conversation_history
+
+def get_search_scope():
+    """Document filter for retrieval: this user's documents when APP_USER_ID is set,
+    narrowed to the documents selected in the sidebar"""
+    scope = {}
+    if get_secret("APP_USER_ID"):
+        scope["user_id"] = st.session_state.user_id
+    if st.session_state.search_document_ids:
+        scope["document_ids"] = list(st.session_state.search_document_ids)
+    return scope
+
+def stream_chatbot_response(user_message, conversation_history, thread_id, tool_status, answer, search_scope=None):
+    """Stream the reply into the answer placeholder, showing tool activity in tool_status.
+    
+    Text the model streams before calling a tool is cleared when the tool
+    starts, so only the final assistant message stays on screen. Returns
+    that message.
+    """
+    text = ""
+    final = None
     try:
-        # Convert session messages to conversation history format
-        conversation_history = []
-        for msg in st.session_state.messages:
-            if msg["role"] == "user":
-                conversation_history.append({"sender": "user", "message": msg["content"]})
-            elif msg["role"] == "assistant":
-                conversation_history.append({"sender": "system", "message": msg["content"]})
-        
-        # Get response from chat agent
-        response = stream_graph_updates(user_message, conversation_history)
-        return response
+        # The async graph runs on the shared background loop so tool calls
+        # from one agent step execute concurrently
+        for event in iterate_sync(astream_graph_events(user_message, conversation_history, thread_id, search_scope)):
+            if event["type"] == "token":
+                text += event["content"]
+                answer.markdown(text + "▌")
+            elif event["type"] == "tool_start":
+                text = ""
+                answer.empty()
+                tool_status.caption(f"🔧 Running {event['name']}...")
+            elif event["type"] == "tool_end":
+                tool_status.caption(f"✅ {event['name']} finished")
+            elif event["type"] == "final":
+                final = event["content"]
     except Exception as e:
         st.error(f"Error getting chatbot response: {str(e)}")
-        return f"I encountered an error while processing your message: {str(e)}"
+        final = f"I encountered an error while processing your message: {str(e)}"
+    tool_status.empty()
+    final = final or text
+    answer.markdown(final)
+    return final
+
+def render_document_list():
+    """Render the uploaded document list with per-document actions"""
+    if not st.session_state.uploaded_documents:
+        st.info("No documents uploaded yet.")
+        return
+    
+    for i, doc in enumerate(st.session_state.uploaded_documents):
+        job_status = doc.get("job_status")
+        if doc.get("processed", False):
+            status_icon, status_text = "✅", "Processed"
+        elif job_status == "failed":
+            status_icon, status_text = "❌", f"Failed: {doc.get('job_error', 'unknown error')}"
+        elif job_status in ("queued", "running"):
+            status_icon, status_text = "🔄", job_status.capitalize()
+        else:
+            status_icon, status_text = "⏳", "Not processed"
+        
+        with st.expander(f"{status_icon} {doc['name']}", expanded=False):
+            st.write(f"**Size:** {format_file_size(doc['size'])}")
+            st.write(f"**Type:** {doc['type']}")
+            st.write(f"**Uploaded:** {doc['upload_time']}")
+            st.write(f"**Status:** {status_text}")
+            
+            if job_status == "running" and not doc.get("processed", False):
+                pages_done, total_pages, chunks_done = doc.get("job_progress", (0, 0, 0))
+                fraction = min(pages_done / total_pages, 1.0) if total_pages else 0.0
+                st.progress(fraction, text=f"Page {pages_done}/{total_pages} · {chunks_done} chunks indexed")
+            
+            if doc.get("processed", False):
+                st.write(f"**Vector IDs:** {len(doc.get('vector_ids', []))}")
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                if st.button("🗑️ Delete", key=f"delete_{i}"):
+                    delete_uploaded_document(doc)
+                    # Remove from session state
+                    st.session_state.uploaded_documents.pop(i)
+                    st.success("Document deleted!")
+                    st.rerun()
+            
+            with col2:
+                if not doc.get("processed", False) and job_status not in ("queued", "running"):
+                    if st.button("🔄 Process", key=f"process_{i}"):
+                        success, job_id = queue_document_for_processing(doc, st.session_state.user_id)
+                        if success:
+                            st.rerun()
+            
+            with col3:
+                if st.button("🔍 Search", key=f"search_{i}"):
+                    st.info("Search functionality in chat!")
+
+if hasattr(st, "fragment"):
+    @st.fragment(run_every=2)
+    def poll_document_list():
+        """Re-render only the document list every few seconds while jobs run"""
+        if not sync_job_status():
+            # Everything finished: one full rerun drops back to the static list
+            st.rerun()
+        render_document_list()
+else:
+    poll_document_list = None
 
 def main():
     st.title("🤖 AI Chatbot Assistant with Document Processing & Chat Agent")
@@ -145,6 +361,13 @@ def main():
                         st.write(f"**Model:** BGE-Small-EN-v1.5")
                         st.write(f"**Collection:** {collection_info.get('collection_name', 'Unknown')}")
                         st.write(f"**Qdrant URL:** {collection_info.get('qdrant_url', 'Unknown')}")
+                        cache_stats = collection_info.get('query_cache', {})
+                        if cache_stats:
+                            st.write(f"**Query cache:** {cache_stats['hit_rate']:.0%} hit rate "
+                                     f"({cache_stats['hits'] + cache_stats['disk_hits']} hits / {cache_stats['misses']} misses, "
+                                     f"{cache_stats['size']} cached)")
+                        for kind, stats in registry.get_stats().items():
+                            st.write(f"**{kind}:** {stats.get('hits', 0)} hits / {stats.get('misses', 0)} misses")
                     else:
                         st.write("No collection info available")
                 else:
@@ -165,7 +388,11 @@ def main():
                 if st.button("📤 Upload", type="primary"):
                     with st.spinner("Uploading document..."):
                         success, doc_info = save_uploaded_file(uploaded_file)
-                        if success:
+                        if success and doc_info.get("already_indexed"):
+                            st.info(f"✅ {uploaded_file.name} is already indexed ({len(doc_info['vector_ids'])} chunks)")
+                            time.sleep(1)
+                            st.rerun()
+                        elif success:
                             st.success(f"✅ {uploaded_file.name} uploaded!")
                             time.sleep(1)
                             st.rerun()
@@ -180,60 +407,40 @@ def main():
                             break
                     
                     if doc_to_process:
-                        with st.spinner("Processing with Qdrant..."):
-                            success, ids = process_document_with_qdrant(doc_to_process)
-                            if success:
-                                st.success(f"✅ Processed {len(ids)} chunks!")
-                                time.sleep(1)
-                                st.rerun()
+                        success, job_id = queue_document_for_processing(doc_to_process, st.session_state.user_id)
+                        if success:
+                            st.success("✅ Queued for processing!")
+                            st.rerun()
                     else:
                         st.warning("Please upload the document first!")
         
         st.markdown("---")
         
-        # Display uploaded documents
+        # Display uploaded documents, polling while background jobs run
         st.subheader("📋 Uploaded Documents")
-        if st.session_state.uploaded_documents:
-            for i, doc in enumerate(st.session_state.uploaded_documents):
-                status_icon = "✅" if doc.get("processed", False) else "⏳"
-                with st.expander(f"{status_icon} {doc['name']}", expanded=False):
-                    st.write(f"**Size:** {format_file_size(doc['size'])}")
-                    st.write(f"**Type:** {doc['type']}")
-                    st.write(f"**Uploaded:** {doc['upload_time']}")
-                    st.write(f"**Status:** {'Processed' if doc.get('processed', False) else 'Not processed'}")
-                    
-                    if doc.get("processed", False):
-                        st.write(f"**Vector IDs:** {len(doc.get('vector_ids', []))}")
-                    
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        if st.button("🗑️ Delete", key=f"delete_{i}"):
-                            # Delete from Qdrant if processed
-                            if doc.get("processed", False) and st.session_state.pdf_processor:
-                                st.session_state.pdf_processor.delete_document(doc["document_id"])
-                            
-                            # Remove file from filesystem
-                            if os.path.exists(doc['path']):
-                                os.remove(doc['path'])
-                            # Remove from session state
-                            st.session_state.uploaded_documents.pop(i)
-                            st.success("Document deleted!")
-                            st.rerun()
-                    
-                    with col2:
-                        if not doc.get("processed", False):
-                            if st.button("🔄 Process", key=f"process_{i}"):
-                                with st.spinner("Processing..."):
-                                    success, ids = process_document_with_qdrant(doc)
-                                    if success:
-                                        st.success(f"Processed {len(ids)} chunks!")
-                                        st.rerun()
-                    
-                    with col3:
-                        if st.button("🔍 Search", key=f"search_{i}"):
-                            st.info("Search functionality in chat!")
+        has_active_jobs = sync_job_status()
+        if has_active_jobs and poll_document_list is not None:
+            poll_document_list()
         else:
-            st.info("No documents uploaded yet.")
+            render_document_list()
+            if has_active_jobs and st.button("🔄 Refresh status"):
+                st.rerun()
+        
+        # Optionally restrict answers to some of the indexed documents
+        searchable = {
+            doc["document_id"]: doc["name"]
+            for doc in st.session_state.uploaded_documents if doc.get("processed")
+        }
+        if searchable:
+            st.session_state.search_document_ids = st.multiselect(
+                "🔎 Search only these documents",
+                options=list(searchable),
+                default=[doc_id for doc_id in st.session_state.search_document_ids if doc_id in searchable],
+                format_func=searchable.get,
+                help="Leave empty to search all documents"
+            )
+        else:
+            st.session_state.search_document_ids = []
         
         st.markdown("---")
         
@@ -241,17 +448,56 @@ def main():
         if st.session_state.uploaded_documents:
             if st.button("🗑️ Clear All Documents", type="secondary"):
                 for doc in st.session_state.uploaded_documents:
-                    # Delete from Qdrant if processed
-                    if doc.get("processed", False) and st.session_state.pdf_processor:
-                        st.session_state.pdf_processor.delete_document(doc["document_id"])
-                    
-                    # Delete file
-                    if os.path.exists(doc['path']):
-                        os.remove(doc['path'])
+                    delete_uploaded_document(doc)
                 
                 st.session_state.uploaded_documents = []
                 st.success("All documents cleared!")
                 st.rerun()
+        
+        # Prompt and answer caching across all chats in this process
+        with st.expander("⚡ Caches", expanded=False):
+            cache_stats = get_prompt_cache_stats()
+            st.write(f"**LLM calls:** {cache_stats['calls']}")
+            st.write(f"**Prompt tokens:** {cache_stats['input_tokens']}")
+            st.write(f"**Cached tokens:** {cache_stats['cached_tokens']} ({cache_stats['cached_ratio']:.0%})")
+            answer_stats = get_response_cache_stats()
+            st.write(f"**Answer cache:** {answer_stats['hit_rate']:.0%} hit rate "
+                     f"({answer_stats['hits']} hits / {answer_stats['misses']} misses, {answer_stats['size']} answers)")
+            weather_stats = get_weather_client().get_stats()
+            st.write(f"**Weather cache:** {weather_stats['weather_hit_rate']:.0%} hit rate "
+                     f"({weather_stats['requests']} API requests, {weather_stats['coalesced']} coalesced)")
+        
+        with st.expander("⏱️ Startup", expanded=False):
+            profile = get_startup_profile()
+            if not profile.done.is_set():
+                st.write("Warm-up still running...")
+            for row in profile.report():
+                st.write(f"**{row['component']}** ({row['phase']}): {row['seconds']:.2f}s"
+                         + ("" if row["status"] == "ok" else f" — {row['status']}"))
+        
+        # Stage timings of the last chat turn, and per stage across all sessions
+        with st.expander("📈 Latency", expanded=False):
+            tracer = get_tracer()
+            turns = tracer.recent_traces("chat.turn")
+            if turns:
+                turn = turns[0]
+                st.write(f"**Last turn:** {turn[0]['ms']:.0f} ms")
+                for stage in sorted(turn[1:], key=lambda row: row["started_at"]):
+                    share = stage["ms"] / turn[0]["ms"] if turn[0]["ms"] else 0.0
+                    st.write(f"{stage['name']}: {stage['ms']:.0f} ms ({share:.0%})")
+            else:
+                st.write("No chat turns yet")
+            for name, stats in sorted(tracer.get_stats().items()):
+                st.write(f"**{name}:** p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms ({stats['count']} runs)")
+        
+        # Jobs from every session in this process
+        with st.expander("⚙️ Ingestion Jobs", expanded=False):
+            jobs = get_job_queue().list_jobs(limit=10)
+            if jobs:
+                for job in jobs:
+                    st.write(f"**{job['document_name']}:** {job['status']} ({job['chunks_done']} chunks)")
+            else:
+                st.write("No ingestion jobs yet")
     
     # Main chat interface
     if not st.session_state.chatbot_started:
@@ -300,12 +546,15 @@ def main():
             with st.chat_message("user"):
                 st.markdown(prompt)
             
-            # Generate and display assistant response
+            # Generate and display assistant response, token by token
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    response = get_chatbot_response(prompt)
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
+                conversation_history = get_conversation_history()[:-1]
+                tool_status = st.empty()
+                response = stream_chatbot_response(
+                    prompt, conversation_history, st.session_state.thread_id, tool_status, st.empty(),
+                    search_scope=get_search_scope()
+                )
+                st.session_state.messages.append({"role": "assistant", "content": response})
         
         # Reset chatbot button
         st.markdown("---")
@@ -313,6 +562,9 @@ def main():
         with col2:
             if st.button("🔄 Reset Chat", type="secondary", use_container_width=True):
                 st.session_state.messages = []
+                # Start a fresh agent thread; the old one stays in the checkpoint DB
+                st.session_state.thread_id = str(uuid.uuid4())
+                st.query_params["thread"] = st.session_state.thread_id
                 st.session_state.chatbot_started = False
                 st.rerun()
 
@@ -0,0 +1,53 @@
+import asyncio
+import queue
+import threading
+from typing import AsyncIterator, Iterator
+
+from model_registry import registry
+
+_DONE = object()
+
+
+def _start_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True, name="async-agent-loop")
+    thread.start()
+    return loop
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Process-wide event loop running in a daemon thread.
+
+    Streamlit scripts are synchronous and rerun often; running async work on
+    one long-lived loop lets async HTTP and Qdrant clients be created once
+    and reused instead of being rebuilt with every asyncio.run().
+    """
+    return registry.get_or_create("event_loop", (), _start_loop)
+
+
+def run_sync(coro, timeout: float = None):
+    """Run a coroutine on the background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result(timeout)
+
+
+def iterate_sync(async_iterator: AsyncIterator) -> Iterator:
+    """Consume an async iterator on the background loop from synchronous code"""
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in async_iterator:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(_DONE)
+
+    asyncio.run_coroutine_threadsafe(pump(), get_background_loop())
+    while True:
+        item = items.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
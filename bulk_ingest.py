@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import time
+import uuid
+
+from document_extractors import supported_extensions
+from embedding_backends import BACKENDS
+from hybrid_retrieval import Bm25Encoder
+from pdf_processor_simple import DEFAULT_QDRANT_URL, PDFProcessorSimple
+from parallel_extraction import default_workers, iter_documents_parallel
+from payload_schema import (
+    CHUNK_INDEXES, SCHEMA_VERSION, TENANT_FIELDS, DocumentCatalog, catalog_entry, catalog_store, chunk_offsets,
+    chunk_payload, document_key, overlap_probe, payload_bytes
+)
+from vector_store import COLLECTION_PROFILES, copy_collection, create_vector_store
+
+SUPPORTED_EXTENSIONS = supported_extensions()
+
+
+class IngestManifest:
+    """Append-only JSONL record of finished files, used to resume interrupted runs.
+
+    A file counts as done only if its path and content hash both match a
+    "done" entry, so edited files are picked up again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line of a crashed run may be truncated
+                        continue
+                    if entry.get("status") == "done":
+                        self.done[entry["path"]] = entry["content_hash"]
+
+    def is_done(self, path: str, content_hash: str) -> bool:
+        return self.done.get(path) == content_hash
+
+    def record(self, **entry):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if entry.get("status") == "done":
+            self.done[entry["path"]] = entry["content_hash"]
+
+
+def find_files(root: str) -> list:
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def ingest_directory(root: str, workers: int = None, manifest_path: str = None,
+                     user_id: str = "bulk", document_category: str = "bulk_import",
+                     processor: PDFProcessorSimple = None) -> dict:
+    """Ingest every supported file under root and return throughput totals"""
+    processor = processor or PDFProcessorSimple.get_shared()
+    workers = workers or default_workers()
+    manifest = IngestManifest(manifest_path or os.path.join(root, ".ingest_manifest.jsonl"))
+
+    pending = []
+    skipped = 0
+    for path in find_files(root):
+        content_hash = PDFProcessorSimple.compute_file_hash(path)
+        if manifest.is_done(path, content_hash):
+            skipped += 1
+        else:
+            pending.append((path, content_hash))
+    print(f"📂 {len(pending)} files to ingest, {skipped} already done")
+
+    totals = {"files": 0, "failed": 0, "skipped": skipped, "pages": 0, "chunks": 0, "vectors": 0}
+    encoded_before = processor.encoded_count
+    started = time.perf_counter()
+
+    hashes = dict(pending)
+    if workers > 1:
+        # Whole documents are extracted in worker processes while this
+        # process embeds and uploads the previous ones
+        documents = iter_documents_parallel(
+            [path for path, _ in pending], workers, processor.chunk_size, processor.chunk_overlap
+        )
+    else:
+        documents = ((path, None, None) for path, _ in pending)
+
+    for path, pages, error in documents:
+        content_hash = hashes[path]
+        file_started = time.perf_counter()
+        try:
+            if error:
+                raise error
+            chunk_ids = processor.process_pdf_file(
+                pdf_path=path,
+                user_id=user_id,
+                document_category=document_category,
+                document_id=str(uuid.uuid5(uuid.NAMESPACE_OID, f"{user_id}:{content_hash}")),
+                content_hash=content_hash,
+                pages=pages
+            )
+            if not chunk_ids:
+                raise ValueError("No text could be extracted from the document")
+            page_count = len(pages) if pages is not None else processor._count_pages(path)
+            totals["files"] += 1
+            totals["pages"] += page_count
+            totals["chunks"] += len(chunk_ids)
+            manifest.record(path=path, content_hash=content_hash, status="done", pages=page_count,
+                            chunks=len(chunk_ids), seconds=round(time.perf_counter() - file_started, 3))
+        except Exception as e:
+            totals["failed"] += 1
+            manifest.record(path=path, content_hash=content_hash, status="failed", error=str(e))
+            print(f"❌ Failed {path}: {str(e)}")
+
+    elapsed = time.perf_counter() - started
+    totals["vectors"] = processor.encoded_count - encoded_before
+    totals["seconds"] = round(elapsed, 3)
+    for unit in ("pages", "chunks", "vectors"):
+        totals[f"{unit}_per_second"] = round(totals[unit] / elapsed, 2) if elapsed else 0.0
+    return totals
+
+
+def migrate_collection(qdrant_url: str, collection_name: str, profile: str,
+                       target_collection: str = None, target_url: str = None) -> dict:
+    """Rebuild a collection under another profile (or on another store) by copying its points.
+
+    The source is left untouched; point VECTOR_NAME / QDRANT_URL at the
+    target once the counts match.
+    """
+    api_key = os.getenv("QDRANT_API_KEY")
+    target_url = target_url or qdrant_url
+    target_collection = target_collection or f"{collection_name}_{profile}"
+    if (target_url, target_collection) == (qdrant_url, collection_name):
+        raise ValueError("Target must differ from the source collection")
+
+    source = create_vector_store(qdrant_url, collection_name, api_key)
+    target = create_vector_store(target_url, target_collection, api_key, profile)
+    sample, _ = source.scroll(limit=1, with_payload=False, with_vectors=True)
+    if not sample:
+        raise ValueError(f"Collection {collection_name} is empty")
+
+    started = time.perf_counter()
+    # Compact collections bring their document catalog along
+    source_catalog = catalog_store(qdrant_url, collection_name, api_key)
+    if source_catalog.collection_exists():
+        target_catalog = DocumentCatalog(catalog_store(target_url, target_collection, api_key))
+        target_catalog.create()
+        copy_collection(source_catalog, target_catalog.store, vector_size=1)
+    # Points written before hybrid search get their BM25 vector on the way
+    copied = copy_collection(source, target, vector_size=len(sample[0].vector),
+                             sparse_encoder=Bm25Encoder().encode_document)
+    return {
+        "source_points": source.info()["points_count"],
+        "target_points": target.info()["points_count"],
+        "copied": copied,
+        "target_url": target_url,
+        "target_collection": target_collection,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def migrate_payloads(qdrant_url: str, collection_name: str, target_collection: str = None,
+                     batch_size: int = 256) -> dict:
+    """Copy a schema 1 collection into a compact schema 2 collection and its document catalog.
+
+    Points keep their ids, vectors, page, chunk index and text and gain
+    character offsets; document attributes move to the catalog. The source
+    is left untouched; point VECTOR_NAME at the target once the counts match.
+    Returns point counts and the payload bytes before and after.
+    """
+    api_key = os.getenv("QDRANT_API_KEY")
+    target_collection = target_collection or f"{collection_name}_v{SCHEMA_VERSION}"
+    if target_collection == collection_name:
+        raise ValueError("Target must differ from the source collection")
+    if catalog_store(qdrant_url, collection_name, api_key).collection_exists():
+        raise ValueError(f"{collection_name} already uses payload schema {SCHEMA_VERSION}")
+
+    source = create_vector_store(qdrant_url, collection_name, api_key)
+    target = create_vector_store(qdrant_url, target_collection, api_key)
+    catalog = DocumentCatalog(catalog_store(qdrant_url, target_collection, api_key))
+    started = time.perf_counter()
+
+    # Pass 1: document attributes, and the chunk boundaries of every page for
+    # the offsets (only each chunk's ends are kept, see overlap_probe)
+    documents, pages = {}, {}
+    payload_bytes_before = 0
+    offset = None
+    while True:
+        records, offset = source.scroll(limit=batch_size, offset=offset, with_payload=True)
+        for record in records:
+            payload = record.payload
+            payload_bytes_before += payload_bytes(payload)
+            document_id = payload.get("document_id")
+            if document_id not in documents:
+                documents[document_id] = catalog_entry(
+                    document_id, payload.get("document_name"), payload.get("document_category"),
+                    payload.get("user_id"), payload.get("content_hash"), payload.get("embedding_model"),
+                    chunks=0, pages=0
+                )
+            document = documents[document_id]
+            document["chunks"] += 1
+            document["pages"] = max(document["pages"], payload.get("page_number") or 0)
+            text = payload.get("page_content", "")
+            pages.setdefault((document_id, payload.get("page_number")), []).append(
+                (payload.get("chunk_index", 0), str(record.id), len(text), overlap_probe(text))
+            )
+        if offset is None:
+            break
+
+    offsets = {}
+    for chunks in pages.values():
+        chunks.sort()
+        page_offsets = chunk_offsets([probe for *_, probe in chunks], [length for _, _, length, _ in chunks])
+        for (_, point_id, _, _), chunk_offset in zip(chunks, page_offsets):
+            offsets[point_id] = chunk_offset
+
+    # Pass 2: rewrite every point in the compact schema
+    encoder = Bm25Encoder()
+    payload_bytes_after = 0
+    copied = 0
+    offset = None
+    while True:
+        records, offset = source.scroll(limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+        if records:
+            if not target.collection_exists():
+                target.create_collection(len(records[0].vector))
+            payloads, sparse = [], []
+            for record in records:
+                payload = record.payload
+                text = payload.get("page_content", "")
+                payloads.append(chunk_payload(
+                    document_key(payload.get("document_id")), payload.get("page_number"),
+                    payload.get("chunk_index", 0), offsets.get(str(record.id), (0, len(text))), text,
+                    payload.get("chunk_hash") or PDFProcessorSimple.compute_text_hash(text)
+                ))
+                sparse.append(record.sparse if record.sparse is not None else encoder.encode_document(text))
+            payload_bytes_after += sum(payload_bytes(payload) for payload in payloads)
+            target.upsert([record.id for record in records], [record.vector for record in records], payloads,
+                          wait=offset is None, sparse_vectors=sparse)
+            copied += len(records)
+            print(f"✅ Rewrote {copied} points")
+        if offset is None:
+            break
+
+    for field in CHUNK_INDEXES[SCHEMA_VERSION]:
+        target.create_payload_index(field, is_tenant=field in TENANT_FIELDS)
+    # The catalog marks the target as schema 2, so it is written last
+    catalog.create()
+    catalog.put_many(list(documents.values()))
+    catalog_bytes = sum(payload_bytes(document) for document in documents.values())
+
+    total_after = payload_bytes_after + catalog_bytes
+    return {
+        "source_points": source.info()["points_count"],
+        "target_points": target.info()["points_count"] if copied else 0,
+        "copied": copied,
+        "documents": len(documents),
+        "payload_bytes_before": payload_bytes_before,
+        "payload_bytes_after": payload_bytes_after,
+        "catalog_bytes": catalog_bytes,
+        "saved_percent": round(100 * (1 - total_after / payload_bytes_before), 1) if payload_bytes_before else 0.0,
+        "target_collection": target_collection,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="python -m pdf_processor_simple")
+    subcommands = parser.add_subparsers(dest="command")
+
+    ingest = subcommands.add_parser("ingest", help="Ingest every supported document under a directory")
+    ingest.add_argument("directory")
+    ingest.add_argument("--workers", type=int, default=None,
+                        help="Extraction processes (default: INGEST_PROCESSES or CPU count)")
+    ingest.add_argument("--manifest", default=None,
+                        help="Resume manifest path (default: <directory>/.ingest_manifest.jsonl)")
+    ingest.add_argument("--user-id", default="bulk")
+    ingest.add_argument("--category", default="bulk_import")
+    ingest.add_argument("--qdrant-url", default=None)
+    ingest.add_argument("--collection", default=None)
+    ingest.add_argument("--embedding-backend", default=None, choices=BACKENDS,
+                        help="Default: EMBEDDING_BACKEND or torch")
+
+    migrate = subcommands.add_parser("migrate", help="Rebuild a collection under another Qdrant profile")
+    migrate.add_argument("--profile", required=True, choices=list(COLLECTION_PROFILES))
+    migrate.add_argument("--qdrant-url", default=None)
+    migrate.add_argument("--collection", default=None)
+    migrate.add_argument("--target", default=None, help="Target collection (default: <collection>_<profile>)")
+    migrate.add_argument("--target-url", default=None, help="Target store URL (default: same as source)")
+
+    migrate_payloads_parser = subcommands.add_parser(
+        "migrate-payloads", help="Copy a collection into the compact payload schema with a document catalog"
+    )
+    migrate_payloads_parser.add_argument("--qdrant-url", default=None)
+    migrate_payloads_parser.add_argument("--collection", default=None)
+    migrate_payloads_parser.add_argument("--target", default=None,
+                                         help=f"Target collection (default: <collection>_v{SCHEMA_VERSION})")
+
+    subcommands.add_parser("test", help="Run the single-file smoke test")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        processor = PDFProcessorSimple.get_shared(
+            qdrant_url=args.qdrant_url, collection_name=args.collection, embedding_backend=args.embedding_backend
+        )
+        totals = ingest_directory(
+            args.directory,
+            workers=args.workers,
+            manifest_path=args.manifest,
+            user_id=args.user_id,
+            document_category=args.category,
+            processor=processor
+        )
+        print("=" * 40)
+        print(f"✅ Ingested {totals['files']} files ({totals['failed']} failed, {totals['skipped']} skipped) "
+              f"in {totals['seconds']}s")
+        print(f"   {totals['pages']} pages   {totals['pages_per_second']} pages/s")
+        print(f"   {totals['chunks']} chunks  {totals['chunks_per_second']} chunks/s")
+        print(f"   {totals['vectors']} vectors {totals['vectors_per_second']} vectors/s")
+        return 1 if totals["failed"] else 0
+
+    if args.command == "migrate":
+        result = migrate_collection(
+            args.qdrant_url or os.getenv("QDRANT_URL", DEFAULT_QDRANT_URL),
+            args.collection or os.getenv("VECTOR_NAME", "documents"),
+            args.profile,
+            target_collection=args.target,
+            target_url=args.target_url
+        )
+        print("=" * 40)
+        print(f"✅ Copied {result['copied']} points to {result['target_collection']} in {result['seconds']}s "
+              f"(source {result['source_points']}, target {result['target_points']})")
+        if result["source_points"] != result["target_points"]:
+            print("❌ Point counts differ, keep using the source collection")
+            return 1
+        print(f"   Set VECTOR_NAME={result['target_collection']} and QDRANT_PROFILE={args.profile} to switch")
+        return 0
+
+    if args.command == "migrate-payloads":
+        result = migrate_payloads(
+            args.qdrant_url or os.getenv("QDRANT_URL", DEFAULT_QDRANT_URL),
+            args.collection or os.getenv("VECTOR_NAME", "documents"),
+            target_collection=args.target
+        )
+        print("=" * 40)
+        print(f"✅ Rewrote {result['copied']} points of {result['documents']} documents into "
+              f"{result['target_collection']} in {result['seconds']}s")
+        print(f"   Payload bytes: {result['payload_bytes_before']} -> {result['payload_bytes_after']} "
+              f"+ {result['catalog_bytes']} catalog ({result['saved_percent']}% smaller)")
+        if result["source_points"] != result["target_points"]:
+            print("❌ Point counts differ, keep using the source collection")
+            return 1
+        print(f"   Set VECTOR_NAME={result['target_collection']} to switch")
+        return 0
+
+    from pdf_processor_simple import test_processing
+    test_processing()
+    return 0
@@ -1,103 +1,417 @@
 import os
+import json
+import asyncio
+import sqlite3
 from typing import Annotated
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START
-from langgraph.graph.message import add_messages
-from langchain.chat_models import init_chat_model
 from chat_agent.tools import ToolsProvider
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
 from chat_agent.tools import PromptProvider
+from chat_agent.history import HistoryManager
+from chat_agent.prompt_assembly import PromptAssembler
+from chat_agent.response_cache import SemanticResponseCache
+from model_registry import registry
+from pdf_processor_simple import PDFProcessorSimple
+from tracing import span, traced
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI
-apiKey = os.environ.get("OPENAI_API_KEY")
-if not apiKey:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
+# LangChain/LangGraph, the OpenAI client and the graph are imported and built
+# on first use (or by the startup warm-up thread), not when this module loads
 
-llm = init_chat_model("openai:gpt-4.1")
+def get_llm():
+    """Chat model shared by the agent and the history summarizer"""
+    def factory():
+        from langchain.chat_models import init_chat_model
+        if not os.environ.get("OPENAI_API_KEY"):
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
+        # stream_usage reports token usage (including cached prompt tokens) when streaming
+        return init_chat_model("openai:gpt-4.1", stream_usage=True)
 
-# Set up tools
-tools = ToolsProvider.get_tools()
-llm_with_tools = llm.bind_tools(tools)
-tool_node = ToolNode(tools)
+    return registry.get_or_create("chat_llm", (), factory)
 
-class State(TypedDict):
-    """State type for the conversation graph."""
-    messages: Annotated[list, add_messages]
+def get_llm_with_tools():
+    return registry.get_or_create("chat_llm_with_tools", (), lambda: get_llm().bind_tools(ToolsProvider.get_tools()))
+
+@traced("llm.summarize")
+def summarize_history(previous_summary: str, messages: list) -> str:
+    """Fold messages into the running conversation summary using the LLM"""
+    from langgraph.constants import TAG_NOSTREAM
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    # nostream keeps summary tokens out of the chat's token stream
+    response = get_llm().with_config(tags=[TAG_NOSTREAM]).invoke([
+        {"role": "system", "content": PromptProvider.get_summary_prompt()},
+        {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"}
+    ])
+    return response.content
+
+history_manager = HistoryManager.from_env(summarizer=summarize_history)
+prompt_assembler = PromptAssembler(PromptProvider.get_agent_system_prompt(), history_manager)
+
+def get_prompt_cache_stats() -> dict:
+    """Prompt and cached-prefix token totals across LLM calls in this process"""
+    return prompt_assembler.get_stats()
    
-def agent(state: State):
+def agent(state: dict):
     """
     Agent function that processes the conversation state.
    
     Args:
-        state (State): Current conversation state
+        state (dict): Current conversation state
        
     Returns:
         dict: Updated messages
     """
     try:
-        response = llm_with_tools.invoke(state["messages"])
+        with span("node.agent"):
+            response = get_llm_with_tools().invoke(prompt_assembler.assemble(state["messages"]))
+            prompt_assembler.record_usage(response)
         return {"messages": [response]}
     except Exception as e:
         print(f"Error in agent: {str(e)}")
         return {"messages": [{"role": "assistant", "content": "I encountered an error. Could you please rephrase your request?"}]}
 
-# Build the conversation graph
-graph_builder = StateGraph(State)
-graph_builder.add_node("agent", agent)
-graph_builder.add_node("tools", tool_node)
-graph_builder.add_edge(START, "agent")
-graph_builder.add_conditional_edges("agent", tools_condition, "tools")
-graph_builder.add_edge("tools", "agent")
-graph = graph_builder.compile()
+async def aagent(state: dict):
+    """Async version of agent, used when the graph runs under astream."""
+    try:
+        with span("node.agent"):
+            messages = await asyncio.to_thread(prompt_assembler.assemble, state["messages"])
+            response = await get_llm_with_tools().ainvoke(messages)
+            prompt_assembler.record_usage(response)
+        return {"messages": [response]}
+    except Exception as e:
+        print(f"Error in agent: {str(e)}")
+        return {"messages": [{"role": "assistant", "content": "I encountered an error. Could you please rephrase your request?"}]}
 
-def stream_graph_updates(query: str, conversation_history: list = None):
-    """
-    Stream updates from the conversation graph.
-   
-    Args:
-        query (str): New message to process
-        conversation_history (list): Previous conversation messages (optional)
-       
-    Returns:
-        str: Last response from the assistant
-    """
-    last_response = None
+def _get_graph_builder():
+    """The conversation graph, before compilation"""
+    def factory():
+        from langgraph.graph import StateGraph, START
+        from langgraph.graph.message import add_messages
+        from langgraph.prebuilt import ToolNode, tools_condition
+        from langchain_core.runnables import RunnableLambda
+
+        class State(TypedDict):
+            """State type for the conversation graph."""
+            messages: Annotated[list, add_messages]
+
+        graph_builder = StateGraph(State)
+        graph_builder.add_node("agent", RunnableLambda(agent, afunc=aagent, name="agent"))
+        graph_builder.add_node("tools", ToolNode(ToolsProvider.get_tools()))
+        graph_builder.add_edge(START, "agent")
+        graph_builder.add_conditional_edges("agent", tools_condition, "tools")
+        graph_builder.add_edge("tools", "agent")
+        return graph_builder
+
+    return registry.get_or_create("graph_builder", (), factory)
+
+def get_graph():
+    """Graph without persistence, for one-off turns"""
+    return registry.get_or_create("graph", (), lambda: _get_graph_builder().compile())
+
+# Sessions: graph state persisted per thread_id, so a turn only sends the new message
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+
+def get_session_graph():
+    """Graph with a SqliteSaver checkpointer"""
+    def factory():
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        checkpointer = SqliteSaver(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False))
+        return _get_graph_builder().compile(checkpointer=checkpointer)
+
+    return registry.get_or_create("session_graph", (CHECKPOINT_DB,), factory)
+
+async def _get_async_session_graph():
+    """Session graph with an AsyncSqliteSaver bound to the running loop (its connection closes with the loop)"""
+    async def factory():
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        graph_builder = await asyncio.to_thread(_get_graph_builder)
+        conn = await aiosqlite.connect(CHECKPOINT_DB)
+        return graph_builder.compile(checkpointer=AsyncSqliteSaver(conn))
+
+    return await registry.aget_or_create_for_loop(
+        "async_session_graph", (CHECKPOINT_DB,), factory, close=lambda graph: graph.checkpointer.conn.close()
+    )
+
+def _thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+def _run_config(thread_id: str = None, search_scope: dict = None) -> dict:
+    """Graph config: the checkpoint thread plus the document search scope read by the retrieval tool"""
+    configurable = {key: value for key, value in (search_scope or {}).items() if value}
+    if thread_id:
+        configurable["thread_id"] = thread_id
+    return {"configurable": configurable} if configurable else None
+
+def _build_messages(query: str, conversation_history: list = None) -> list:
+    """Assemble prior turns and the new user message.
     
-    # Add system prompt
-    system_prompt = PromptProvider.get_agent_system_prompt(query)
-    formatted_messages = [system_prompt]
-   
+    The system prompt is not stored in graph state; the agent node prepends
+    the current one on every call.
+    """
     # Add conversation history if provided
+    history = []
     if conversation_history:
         for msg in conversation_history:
             if isinstance(msg, dict):
                 role = "assistant" if msg.get("sender") == "system" else "user"
-                formatted_messages.append({
+                history.append({
                     "role": role,
                     "content": msg.get("message", "")
                 })
    
     # Add the new message
-    formatted_messages.append({
+    new_message = {
         "role": "user",
         "content": query
-    })
-   
-    # Process the conversation through the graph
+    }
+    return history + [new_message]
+
+def _turn_input(query: str, conversation_history: list, existing_messages: list) -> dict:
+    """Graph input for a turn: only the new message if the thread already has state"""
+    if existing_messages:
+        return {"messages": [{"role": "user", "content": query}]}
+    return {"messages": _build_messages(query, conversation_history)}
+
+def _is_opening_question(conversation_history: list, existing_messages: list) -> bool:
+    """True if no earlier user message exists; assistant-only greetings don't count"""
+    if any(getattr(message, "type", None) == "human" for message in existing_messages or []):
+        return False
+    return not any(isinstance(msg, dict) and msg.get("sender") != "system" for msg in conversation_history or [])
+
+def get_thread_transcript(thread_id: str) -> list:
+    """User/assistant messages stored for a thread, for redisplay after a restart"""
+    messages = get_session_graph().get_state(_thread_config(thread_id)).values.get("messages", [])
+    transcript = []
+    for message in messages:
+        if message.type in ("human", "ai") and isinstance(message.content, str) and message.content:
+            transcript.append({"role": "user" if message.type == "human" else "assistant", "content": message.content})
+    return transcript
+
+# Answers to document questions, reused for near-duplicate questions
+response_cache = SemanticResponseCache.from_env()
+PDFProcessorSimple.add_change_listener(
+    lambda qdrant_url, collection_name: response_cache.invalidate(f"{qdrant_url}/{collection_name}")
+)
+
+def get_response_cache_stats() -> dict:
+    return response_cache.get_stats()
+
+def _answer_cache_context(search_scope: dict = None):
+    """(scope, embed) for the shared document collection, using the warm BGE model"""
+    processor = PDFProcessorSimple.get_shared()
+    scope = f"{processor.qdrant_url}/{processor.collection_name}"
+    search_filter = PDFProcessorSimple.build_search_filter(**(search_scope or {}))
+    if search_filter:
+        # Answers are only reused for the same user / document selection
+        scope += "?" + json.dumps(search_filter, sort_keys=True)
+    
+    def embed(text):
+        return processor.query_cache.get_or_compute(text, processor.embedding_key, processor.sentence_transformer.encode)
+    
+    return scope, embed
+
+def _lookup_cached_answer(query: str, search_scope: dict = None) -> str:
+    try:
+        scope, embed = _answer_cache_context(search_scope)
+        return response_cache.lookup(query, scope, embed)
+    except Exception as e:
+        print(f"Error in answer cache lookup: {str(e)}")
+        return None
+
+def _store_answer(query: str, answer: str, tools_used: set, search_scope: dict = None):
+    # Only answers grounded purely in the documents are reusable; weather goes stale
+    if tools_used != {"retrive_from_qdrant"}:
+        return
     try:
-        for event in graph.stream({"messages": formatted_messages}):
-            for value in event.values():
-                last_response = value["messages"][-1].content
-                print("Assistant:", last_response)
+        scope, embed = _answer_cache_context(search_scope)
+        response_cache.store(query, answer, scope, embed)
     except Exception as e:
-        print(f"Error in stream_graph_updates: {str(e)}")
-        last_response = "I apologize, but I encountered an error processing your message. Could you please rephrase your question?"
+        print(f"Error storing answer in cache: {str(e)}")
+
+def _cached_turn(query: str, answer: str) -> dict:
+    """State update recording a cache-answered turn in the thread"""
+    return {"messages": [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]}
+
+def _translate_chunk(mode: str, chunk):
+    """Turn one graph.stream/astream chunk into UI events.
+    
+    Returns (events, last_response) where last_response is the newest
+    node message content, or None if the chunk carried none.
+    """
+    from langchain_core.messages import AIMessageChunk, ToolMessage
+    events = []
+    last_response = None
+    if mode == "messages":
+        message, metadata = chunk
+        if metadata.get("langgraph_node") == "agent" and isinstance(message, AIMessageChunk) and message.content:
+            events.append({"type": "token", "content": message.content})
+        return events, None
+   
+    for node, update in chunk.items():
+        for message in (update or {}).get("messages", []):
+            if node == "agent":
+                for tool_call in getattr(message, "tool_calls", None) or []:
+                    events.append({"type": "tool_start", "name": tool_call["name"], "args": tool_call["args"]})
+            elif isinstance(message, ToolMessage):
+                events.append({"type": "tool_end", "name": message.name, "content": message.content})
+            last_response = message["content"] if isinstance(message, dict) else message.content
+    return events, last_response
 
+def stream_graph_events(query: str, conversation_history: list = None, thread_id: str = None,
+                        search_scope: dict = None):
+    """
+    Stream a conversation turn as it happens.
+   
+    Args:
+        query (str): New message to process
+        conversation_history (list): Previous conversation messages (optional, only
+            used to seed a thread that has no stored state yet)
+        thread_id (str): Persist and resume graph state for this thread (optional)
+        search_scope (dict): Restrict document retrieval with user_id, document_ids
+            and/or document_category (optional)
+       
+    Yields:
+        dict: {"type": "token", "content": str} for each LLM token,
+              {"type": "tool_start", "name": str, "args": dict} when the agent calls a tool,
+              {"type": "tool_end", "name": str, "content": str} when a tool returns,
+              {"type": "final", "content": str} once, with the last assistant message
+    
+    Near-duplicates of earlier document questions are answered from the
+    semantic answer cache without running the graph. Only the opening
+    question of a conversation (no earlier user message; a greeting from
+    the assistant is fine) is looked up or stored: later questions can
+    refer to earlier turns ("explain that in more detail").
+    
+    The turn is traced as a chat.turn span; graph nodes, tools and
+    retrieval run inside it and are recorded as its children.
+    """
+    last_response = None
+    tools_used = set()
+   
+    with span("chat.turn", query_chars=len(query)) as turn:
+        try:
+            config = _run_config(thread_id, search_scope)
+            if thread_id:
+                run_graph = get_session_graph()
+                existing = run_graph.get_state(config).values.get("messages")
+            else:
+                run_graph, existing = get_graph(), None
+            
+            standalone = _is_opening_question(conversation_history, existing)
+            cached = _lookup_cached_answer(query, search_scope) if standalone else None
+            turn.set(answer_cache_hit=cached is not None)
+            if cached is not None:
+                turn.set(response_chars=len(cached))
+                if thread_id:
+                    run_graph.update_state(_thread_config(thread_id), _cached_turn(query, cached), as_node="agent")
+                yield {"type": "token", "content": cached}
+                yield {"type": "final", "content": cached}
+                return
+           
+            inputs = _turn_input(query, conversation_history, existing)
+            for mode, chunk in run_graph.stream(inputs, config=config, stream_mode=["messages", "updates"]):
+                events, response = _translate_chunk(mode, chunk)
+                last_response = response if response is not None else last_response
+                for event in events:
+                    if event["type"] == "tool_start":
+                        tools_used.add(event["name"])
+                    yield event
+            if standalone:
+                _store_answer(query, last_response, tools_used, search_scope)
+        except Exception as e:
+            print(f"Error in stream_graph_events: {str(e)}")
+            turn.status = "error"
+            last_response = "I apologize, but I encountered an error processing your message. Could you please rephrase your question?"
+        turn.set(tools=len(tools_used), response_chars=len(last_response or ""))
+   
+    yield {"type": "final", "content": last_response}
+
+async def astream_graph_events(query: str, conversation_history: list = None, thread_id: str = None,
+                               search_scope: dict = None):
+    """
+    Async version of stream_graph_events.
+   
+    Tool calls requested in the same agent step run concurrently, so a
+    multi-tool turn takes as long as its slowest tool.
+    """
+    last_response = None
+    tools_used = set()
+   
+    with span("chat.turn", query_chars=len(query)) as turn:
+        try:
+            config = _run_config(thread_id, search_scope)
+            if thread_id:
+                run_graph = await _get_async_session_graph()
+                existing = (await run_graph.aget_state(config)).values.get("messages")
+            else:
+                run_graph, existing = await asyncio.to_thread(get_graph), None
+            
+            standalone = _is_opening_question(conversation_history, existing)
+            cached = await asyncio.to_thread(_lookup_cached_answer, query, search_scope) if standalone else None
+            turn.set(answer_cache_hit=cached is not None)
+            if cached is not None:
+                turn.set(response_chars=len(cached))
+                if thread_id:
+                    await run_graph.aupdate_state(_thread_config(thread_id), _cached_turn(query, cached), as_node="agent")
+                yield {"type": "token", "content": cached}
+                yield {"type": "final", "content": cached}
+                return
+           
+            inputs = _turn_input(query, conversation_history, existing)
+            async for mode, chunk in run_graph.astream(inputs, config=config, stream_mode=["messages", "updates"]):
+                events, response = _translate_chunk(mode, chunk)
+                last_response = response if response is not None else last_response
+                for event in events:
+                    if event["type"] == "tool_start":
+                        tools_used.add(event["name"])
+                    yield event
+            if standalone:
+                await asyncio.to_thread(_store_answer, query, last_response, tools_used, search_scope)
+        except Exception as e:
+            print(f"Error in astream_graph_events: {str(e)}")
+            turn.status = "error"
+            last_response = "I apologize, but I encountered an error processing your message. Could you please rephrase your question?"
+        turn.set(tools=len(tools_used), response_chars=len(last_response or ""))
+   
+    yield {"type": "final", "content": last_response}
+
+def stream_graph_updates(query: str, conversation_history: list = None, thread_id: str = None,
+                         search_scope: dict = None):
+    """
+    Stream updates from the conversation graph.
+   
+    Args:
+        query (str): New message to process
+        conversation_history (list): Previous conversation messages (optional)
+        thread_id (str): Persist and resume graph state for this thread (optional)
+        search_scope (dict): Restrict document retrieval (optional, see stream_graph_events)
+       
+    Returns:
+        str: Last response from the assistant
+    """
+    last_response = None
+    for event in stream_graph_events(query, conversation_history, thread_id, search_scope):
+        if event["type"] == "final":
+            last_response = event["content"]
+            print("Assistant:", last_response)
+    return last_response
+
+async def astream_graph_updates(query: str, conversation_history: list = None, thread_id: str = None,
+                                search_scope: dict = None):
+    """
+    Async version of stream_graph_updates.
+   
+    Returns:
+        str: Last response from the assistant
+    """
+    last_response = None
+    async for event in astream_graph_events(query, conversation_history, thread_id, search_scope):
+        if event["type"] == "final":
+            last_response = event["content"]
+            print("Assistant:", last_response)
     return last_response
 
 def get_tools():
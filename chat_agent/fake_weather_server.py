@@ -0,0 +1,129 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# name -> (lat, lon, country)
+CITIES = {
+    "chennai": (13.0827, 80.2707, "IN"),
+    "london": (51.5073, -0.1276, "GB"),
+    "new york": (40.7127, -74.0060, "US"),
+    "paris": (48.8589, 2.3200, "FR"),
+    "tokyo": (35.6828, 139.7594, "JP"),
+}
+
+
+class FakeWeatherServer:
+    """Local stand-in for the OpenWeatherMap geocoding and weather endpoints.
+
+    Answers deterministically from CITIES, with an optional per-request delay
+    and a number of initial 503s to exercise retries. Counts the requests it
+    served per path.
+
+        with FakeWeatherServer(delay=0.05) as server:
+            client = WeatherClient("test", base_url=server.url)
+    """
+
+    def __init__(self, port: int = 0, delay: float = 0.0, fail_first: int = 0):
+        self.delay = delay
+        self.fail_first = fail_first
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                with server._lock:
+                    server.requests[url.path] = server.requests.get(url.path, 0) + 1
+                    failing = server.fail_first > 0
+                    if failing:
+                        server.fail_first -= 1
+                if server.delay:
+                    time.sleep(server.delay)
+                if failing:
+                    return self._send(503, {"cod": 503, "message": "service unavailable"})
+                if not params.get("appid"):
+                    return self._send(401, {"cod": 401, "message": "Invalid API key."})
+
+                if url.path == "/geo/1.0/direct":
+                    return self._send(200, server.geocode(params.get("q", "")))
+                if url.path == "/data/2.5/weather":
+                    return self._send(200, server.weather(float(params["lat"]), float(params["lon"])))
+                return self._send(404, {"cod": 404, "message": "not found"})
+
+        return Handler
+
+    @staticmethod
+    def geocode(query: str) -> list:
+        name = query.split(",")[0].strip().lower()
+        if name not in CITIES:
+            return []
+        lat, lon, country = CITIES[name]
+        return [{"name": name.title(), "lat": lat, "lon": lon, "country": country}]
+
+    @staticmethod
+    def weather(lat: float, lon: float) -> dict:
+        name = next((city.title() for city, (clat, clon, _) in CITIES.items()
+                     if abs(clat - lat) < 0.01 and abs(clon - lon) < 0.01), "")
+        temp = round(288.15 + (30 - abs(lat)) / 3, 2)
+        return {
+            "coord": {"lat": lat, "lon": lon},
+            "weather": [{"id": 800, "main": "Clear", "description": "clear sky"}],
+            "main": {"temp": temp, "feels_like": temp, "humidity": 60, "pressure": 1013},
+            "wind": {"speed": 3.5, "deg": 180},
+            "name": name,
+            "cod": 200,
+        }
+
+    def start(self) -> "FakeWeatherServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-weather")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    # python -m chat_agent.fake_weather_server 8081
+    # then run the app with OPENWEATHER_BASE_URL=http://127.0.0.1:8081
+    server = FakeWeatherServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8081)
+    print(f"🌤️ Fake weather server on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
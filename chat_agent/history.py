@@ -0,0 +1,204 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+import tiktoken
+
+from model_registry import registry
+
+# Role/separator tokens OpenAI adds around every chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class _ApproximateEncoding:
+    """~4 characters per token; used when the tiktoken BPE files cannot be loaded (offline hosts)"""
+
+    def encode(self, text: str) -> list:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+
+def get_encoding(model: str = "gpt-4.1"):
+    """Tokenizer for model, loaded once per process on first use"""
+    def factory():
+        try:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"❌ Could not load tokenizer for {model}, approximating token counts: {str(e)}")
+            return _ApproximateEncoding()
+
+    return registry.get_or_create("tokenizer", (model,), factory)
+
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+
+
+def as_dict(message) -> dict:
+    """{"role", "content"} view of a chat message given as a dict or a LangChain message"""
+    if isinstance(message, dict):
+        return {"role": message.get("role"), "content": str(message.get("content") or "")}
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if not content and tool_calls:
+        content = "; ".join(f"called {call['name']}({call['args']})" for call in tool_calls)
+    return {"role": _ROLES.get(message.type, message.type), "content": content}
+
+
+class HistoryManager:
+    """Token-aware conversation history with a rolling summary.
+
+    At least the last keep_last_turns user turns are sent verbatim;
+    everything older is folded into a summary, fold_every_turns turns at a
+    time, so the summary (which sits right after the system prompt) changes
+    once per block instead of every turn and the prompt prefix stays
+    cacheable in between. Summaries are cached by a hash of the messages
+    they cover, so each fold only summarizes the newly folded messages
+    instead of re-summarizing the whole prefix.
+    """
+
+    def __init__(self, summarizer: Callable = None, max_context_tokens: int = 8000,
+                 keep_last_turns: int = 6, summary_max_tokens: int = 500,
+                 model: str = "gpt-4.1", cache_size: int = 256, fold_every_turns: int = None):
+        self.summarizer = summarizer
+        self.max_context_tokens = max_context_tokens
+        self.keep_last_turns = keep_last_turns
+        self.fold_every_turns = max(fold_every_turns or keep_last_turns, 1)
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        return get_encoding(self.model)
+
+    @classmethod
+    def from_env(cls, summarizer: Callable = None) -> "HistoryManager":
+        return cls(
+            summarizer=summarizer,
+            max_context_tokens=int(os.getenv("HISTORY_TOKEN_BUDGET", "8000")),
+            keep_last_turns=int(os.getenv("HISTORY_KEEP_TURNS", "6")),
+            summary_max_tokens=int(os.getenv("HISTORY_SUMMARY_TOKENS", "500")),
+            fold_every_turns=int(os.getenv("HISTORY_FOLD_TURNS", "0")) or None,
+        )
+
+    def count_tokens(self, messages: list) -> int:
+        return sum(
+            len(self.encoding.encode(as_dict(message)["content"])) + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+    @staticmethod
+    def _prefix_hashes(messages: List[dict]) -> List[str]:
+        """hashes[i] identifies messages[:i + 1]"""
+        hashes = []
+        digest = hashlib.sha1()
+        for message in map(as_dict, messages):
+            digest.update(f"{message['role']}\x00{message['content']}\x01".encode("utf-8"))
+            hashes.append(digest.copy().hexdigest())
+        return hashes
+
+    def _summarize(self, previous_summary: str, messages: list) -> str:
+        messages = [as_dict(message) for message in messages]
+        if self.summarizer is not None:
+            try:
+                return self._truncate(self.summarizer(previous_summary, messages), self.summary_max_tokens)
+            except Exception as e:
+                print(f"❌ Error summarizing history: {str(e)}")
+
+        # Fallback: keep the beginning of each folded message
+        lines = [previous_summary] if previous_summary else []
+        lines += [f"{m['role']}: {m['content'][:200]}" for m in messages]
+        return self._truncate("\n".join(lines), self.summary_max_tokens)
+
+    def summarize_prefix(self, messages: list) -> str:
+        """Summary of messages, built incrementally from the longest cached prefix"""
+        if not messages:
+            return ""
+        hashes = self._prefix_hashes(messages)
+
+        with self._lock:
+            start, summary = 0, ""
+            for i in range(len(hashes) - 1, -1, -1):
+                if hashes[i] in self._summaries:
+                    start, summary = i + 1, self._summaries[hashes[i]]
+                    self._summaries.move_to_end(hashes[i])
+                    break
+        if start == len(messages):
+            return summary
+
+        summary = self._summarize(summary, messages[start:])
+        with self._lock:
+            self._summaries[hashes[-1]] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _split_turns(self, history: list) -> List[list]:
+        turns = []
+        for message in history:
+            if as_dict(message)["role"] == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def compact(self, system_messages: list, history: list, new_messages: list) -> list:
+        """Return system + [summary] + recent history + new messages within the token budget.
+
+        Messages may be dicts or LangChain messages. Turns start at a user
+        message, so an assistant tool call and its tool results are always
+        folded or kept together.
+        """
+        turns = self._split_turns(history)
+        # Fold whole blocks of turns only, keeping the summary stable between folds
+        folded_turns = max(len(turns) - self.keep_last_turns, 0)
+        keep = len(turns) - folded_turns + folded_turns % self.fold_every_turns
+        fixed_tokens = self.count_tokens(system_messages) + self.count_tokens(new_messages)
+
+        while True:
+            folded = [m for turn in turns[:len(turns) - keep] for m in turn]
+            recent = [m for turn in turns[len(turns) - keep:] for m in turn]
+            summary = self.summarize_prefix(folded)
+            summary_messages = (
+                [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+                if summary else []
+            )
+            summary_tokens = self.count_tokens(summary_messages)
+            recent_tokens = self.count_tokens(recent)
+            total = fixed_tokens + summary_tokens + recent_tokens
+            # Fold the oldest verbatim turn into the summary until we fit
+            if total <= self.max_context_tokens or keep == 0:
+                break
+            keep -= 1
+
+        print(f"📏 Context tokens: fixed={fixed_tokens} summary={summary_tokens} "
+              f"recent={recent_tokens} ({keep} turns, {len(folded)} msgs folded) "
+              f"total={total}/{self.max_context_tokens}")
+        return system_messages + summary_messages + recent + new_messages
+
+    def compact_state(self, messages: list) -> list:
+        """compact() for a full graph state: leading system messages, earlier turns, current turn"""
+        system_count = 0
+        while system_count < len(messages) and as_dict(messages[system_count])["role"] == "system":
+            system_count += 1
+        rest = messages[system_count:]
+
+        current_start = 0
+        for i, message in enumerate(rest):
+            if as_dict(message)["role"] == "user":
+                current_start = i
+        return self.compact(messages[:system_count], rest[:current_start], rest[current_start:])
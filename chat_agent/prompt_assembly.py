@@ -0,0 +1,54 @@
+import threading
+
+from chat_agent.history import HistoryManager, as_dict
+from tracing import current_span
+
+
+class PromptAssembler:
+    """Builds the message list for each LLM call with a byte-stable prefix.
+
+    Order is: the fixed system prompt, then (sent separately by the API) the
+    tool schemas, then the conversation summary and older turns, then the
+    current turn. Turns are folded into the summary in blocks (see
+    HistoryManager.fold_every_turns), so between folds each prompt extends
+    the previous one and OpenAI's automatic prefix caching reuses it.
+    """
+
+    def __init__(self, system_prompt: dict, history_manager: HistoryManager):
+        self.system_prompt = system_prompt
+        self.history_manager = history_manager
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+
+    def assemble(self, messages: list) -> list:
+        """Prompt for a graph state, replacing any stored system prompt with the current one"""
+        start = 0
+        # Threads created before the prompt was made stable still carry their
+        # own per-query system prompt; drop it in favour of the shared one
+        while start < len(messages) and as_dict(messages[start])["role"] == "system":
+            start += 1
+        return self.history_manager.compact_state([self.system_prompt] + list(messages[start:]))
+
+    def record_usage(self, response):
+        """Log prompt and cached-prefix token counts from the response usage metadata"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+        current_span().add(input_tokens=input_tokens, cached_tokens=cached_tokens,
+                           output_tokens=usage.get("output_tokens", 0))
+        print(f"💾 Prompt tokens: {input_tokens} ({cached_tokens} cached)")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_ratio": self.cached_tokens / self.input_tokens if self.input_tokens else 0.0,
+            }
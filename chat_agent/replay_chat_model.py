@@ -0,0 +1,68 @@
+import json
+import time
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_ANSWER = "I don't have a recorded answer for that."
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that replays recorded turns instead of calling an API.
+
+    script is a list of {"query", "tool_calls": [{"name", "args"}], "answer"}
+    turns, matched against the latest user message. The first call of a turn
+    returns its tool calls (if any), the call after the tool results returns
+    its answer. Text streams word by word, token_delay seconds apart, so the
+    graph's streaming paths run as they do with a real model.
+
+        registry.put("chat_llm", (), ReplayChatModel(script=[...]))
+    """
+
+    script: List[dict]
+    token_delay: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs) -> "ReplayChatModel":
+        # Tool calls come from the script, so the schemas are not needed
+        return self
+
+    def _turn(self, messages: list) -> dict:
+        query = next((message.content for message in reversed(messages) if isinstance(message, HumanMessage)), "")
+        query = query.lower() if isinstance(query, str) else ""
+        return next((turn for turn in self.script if turn["query"].lower() in query), {"answer": DEFAULT_ANSWER})
+
+    def _reply(self, messages: list) -> AIMessage:
+        self.calls += 1
+        turn = self._turn(messages)
+        if turn.get("tool_calls") and not isinstance(messages[-1], ToolMessage):
+            return AIMessage(content="", tool_calls=[
+                {"name": call["name"], "args": call["args"], "id": f"call_{self.calls}_{index}"}
+                for index, call in enumerate(turn["tool_calls"])
+            ])
+        return AIMessage(content=turn.get("answer", DEFAULT_ANSWER))
+
+    def _generate(self, messages: list, stop: List[str] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages: list, stop: List[str] = None, run_manager=None, **kwargs: Any):
+        reply = self._reply(messages)
+        words = reply.content.split(" ") if reply.content else []
+        for index, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if index == len(words) - 1 else word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        if reply.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(reply.tool_calls)
+            ]))
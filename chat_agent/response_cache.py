@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+
+class SemanticResponseCache:
+    """Answers to document questions, looked up by question embedding similarity.
+
+    Entries are scoped to a document set (Qdrant URL + collection + any
+    search filters), so an answer is only reused for the same documents.
+    PDFProcessorSimple notifies the cache when ingestion or deletion changes
+    a collection and every entry for that collection is dropped. Changes made
+    by other processes (e.g. the bulk CLI) are only picked up after ttl_seconds.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 500,
+                 ttl_seconds: float = 86400, enabled: bool = True):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "SemanticResponseCache":
+        return cls(
+            threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "500")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+            enabled=os.getenv("RESPONSE_CACHE_ENABLED", "1") != "0",
+        )
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self):
+        if self.ttl_seconds:
+            cutoff = time.monotonic() - self.ttl_seconds
+            self._entries = [entry for entry in self._entries if entry["created"] >= cutoff]
+
+    def lookup(self, question: str, scope: str, embed: Callable) -> str:
+        """Cached answer for a near-duplicate question in the same scope, or None"""
+        if not self.enabled:
+            return None
+        vector = self._normalize(embed(question))
+        with self._lock:
+            self._expire()
+            candidates = [entry for entry in self._entries if entry["scope"] == scope]
+            if candidates:
+                similarities = np.stack([entry["vector"] for entry in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    print(f"⚡ Answer cache hit ({similarities[best]:.3f}): {candidates[best]['question']}")
+                    return candidates[best]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, answer: str, scope: str, embed: Callable):
+        if not self.enabled or not answer:
+            return
+        vector = self._normalize(embed(question))
+        with self._lock:
+            self._entries.append({
+                "vector": vector,
+                "question": question,
+                "answer": answer,
+                "scope": scope,
+                "created": time.monotonic(),
+            })
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+
+    def invalidate(self, collection_scope: str = None):
+        """Drop every entry for collection_scope, with or without search filters (all entries by default)"""
+        with self._lock:
+            before = len(self._entries)
+            self._entries = [
+                entry for entry in self._entries
+                if collection_scope is not None and entry["scope"].split("?", 1)[0] != collection_scope
+            ]
+            if len(self._entries) != before:
+                self.invalidations += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,99 @@
+import os
+import re
+from typing import List
+
+from chat_agent.history import get_encoding
+from payload_schema import overlap_length
+
+
+def _clean(text: str) -> str:
+    """Collapse the line breaks and space runs PDF extraction leaves between words"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def merge_overlapping(previous: str, following: str, overlap: int = None) -> str:
+    """Join two chunks, dropping the text the splitter repeated at the start of following.
+
+    overlap comes from the chunks' stored offsets when known; otherwise the
+    longest suffix/prefix match is used.
+    """
+    if overlap is None:
+        overlap = overlap_length(previous, following)
+    if overlap > 0:
+        return previous + following[overlap:]
+    return previous + " " + following
+
+
+class RetrievalContextBuilder:
+    """Turn search results into one compact, cited context block for the agent.
+
+    Chunks from the same document page are grouped, sorted by position and
+    adjacent ones merged without their overlap. Groups keep the rank of their
+    best chunk and are added until max_tokens is reached; the last one that
+    fits only partially is truncated.
+    """
+
+    def __init__(self, max_tokens: int = 1500, model: str = "gpt-4.1"):
+        self.max_tokens = max_tokens
+        self.model = model
+
+    @property
+    def encoding(self):
+        return get_encoding(self.model)
+
+    @classmethod
+    def from_env(cls) -> "RetrievalContextBuilder":
+        return cls(max_tokens=int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", "1500")))
+
+    def _group(self, results: List[dict]) -> List[dict]:
+        groups = {}
+        for result in results:
+            metadata = result.get("metadata", {})
+            key = (metadata.get("document_id"), metadata.get("page_number"))
+            group = groups.setdefault(key, {
+                "document_name": metadata.get("document_name") or "document",
+                "page_number": metadata.get("page_number"),
+                "chunks": {},
+            })
+            group["chunks"].setdefault(
+                metadata.get("chunk_index", len(group["chunks"])),
+                (result.get("content", ""), metadata.get("start"), metadata.get("end"))
+            )
+
+        merged = []
+        for group in groups.values():
+            text, last_index, last_end = "", None, None
+            for index in sorted(group["chunks"]):
+                chunk, start, end = group["chunks"][index]
+                if not text:
+                    text = chunk
+                elif last_index is not None and index == last_index + 1:
+                    overlap = max(last_end - start, 0) if last_end is not None and start is not None else None
+                    text = merge_overlapping(text, chunk, overlap)
+                else:
+                    text += " … " + chunk
+                last_index, last_end = index, end
+            merged.append({"document_name": group["document_name"], "page_number": group["page_number"],
+                           "text": _clean(text)})
+        return merged
+
+    def build(self, query: str, results: List[dict]) -> str:
+        if not results:
+            return f"No relevant information found in the uploaded documents for: {query}"
+
+        blocks = []
+        used = 0
+        for number, group in enumerate(self._group(results), start=1):
+            header = f"[{number}] {group['document_name']}, page {group['page_number']}"
+            block = f"{header}\n{group['text']}"
+            tokens = len(self.encoding.encode(block))
+            if used + tokens > self.max_tokens:
+                remaining = self.max_tokens - used - len(self.encoding.encode(header)) - 2
+                if remaining > 50:
+                    text = self.encoding.decode(self.encoding.encode(group["text"])[:remaining])
+                    blocks.append(f"{header}\n{text} …")
+                break
+            blocks.append(block)
+            used += tokens + 2
+
+        return "Sources (cite as [n]):\n\n" + "\n\n".join(blocks)
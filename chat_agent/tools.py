@@ -1,53 +1,75 @@
-import requests
+import asyncio
 from dotenv import load_dotenv
-import os
+from langchain_core.runnables import RunnableConfig
 from pdf_processor_simple import PDFProcessorSimple
+from chat_agent.retrieval_context import RetrievalContextBuilder
+from chat_agent.weather_client import get_weather_client
+from tracing import current_span, traced
 
 load_dotenv()
 
+def search_scope(config: RunnableConfig = None) -> dict:
+    """user_id / document_ids / document_category the chat restricted retrieval to"""
+    configurable = (config or {}).get("configurable", {})
+    return {key: configurable.get(key) for key in ("user_id", "document_ids", "document_category")}
+
 class ToolsProvider:
-    api_key = os.getenv("OPENWEATHER_API_KEY")  # Replace with your OpenWeatherMap API key
+    context_builder = RetrievalContextBuilder.from_env()
     @staticmethod
+    @traced("tool.weatherapi_get")
     def weatherapi_get(location: str):
         """Get weather information for a specific location."""
-        api_key = ToolsProvider.api_key  # Replace with your OpenWeatherMap API key
-
-        # Step 1: Get latitude and longitude from location name
-        geo_url = f"https://api.openweathermap.org/geo/1.0/direct?q={location}&limit=1&appid={api_key}"
-        geo_response = requests.get(geo_url)
-        geo_data = geo_response.json()
-
-        if not geo_data:
-            return {"error": f"Location '{location}' not found."}
-
-        lat = geo_data[0]["lat"]
-        lon = geo_data[0]["lon"]
+        result = get_weather_client().weather_for(location)
+        current_span().set(result_bytes=len(str(result)))
+        return result
 
-        # Step 2: Get weather data using lat and lon
-        weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}"
-        weather_response = requests.get(weather_url)
-        weather_data = weather_response.json()
-
-        return weather_data
+    @staticmethod
+    @traced("tool.weatherapi_get")
+    async def aweatherapi_get(location: str):
+        """Get weather information for a specific location."""
+        # Same pooled client and caches as the sync tool; concurrent calls for
+        # one location are coalesced into a single request
+        result = await asyncio.to_thread(get_weather_client().weather_for, location)
+        current_span().set(result_bytes=len(str(result)))
+        return result
 
 
-    def retrive_from_qdrant(query: str):
+    @traced("tool.retrive_from_qdrant")
+    def retrive_from_qdrant(query: str, config: RunnableConfig = None):
         """Retrieve information from Qdrant."""
         print(f"Retrieving information from Qdrant for query: {query}")
-        processor = PDFProcessorSimple()
-        results = processor.search_documents(query, user_id="user123", k=7)
-        print(results)
-
-        # Implement the logic to retrieve information from Qdrant
-        # For example, you might need to connect to a Qdrant client and search for the query
-        # Here's a placeholder implementation:
-        return f"Retrieved information for query: {query}"
+        processor = PDFProcessorSimple.get_shared()
+        results = processor.search_documents(query, **search_scope(config))
+        print(f"✅ Retrieved {len(results)} chunks")
+        context = ToolsProvider.context_builder.build(query, results)
+        current_span().set(chunks=len(results), result_bytes=len(str(context)))
+        return context
+
+    @traced("tool.retrive_from_qdrant")
+    async def aretrive_from_qdrant(query: str, config: RunnableConfig = None):
+        """Retrieve information from Qdrant."""
+        print(f"Retrieving information from Qdrant for query: {query}")
+        processor = await asyncio.to_thread(PDFProcessorSimple.get_shared)
+        results = await processor.asearch_documents(query, **search_scope(config))
+        print(f"✅ Retrieved {len(results)} chunks")
+        context = ToolsProvider.context_builder.build(query, results)
+        current_span().set(chunks=len(results), result_bytes=len(str(context)))
+        return context
     
 
     def get_tools():
+        # Each tool carries a sync and an async implementation; the graph
+        # picks the async one under astream, running tool calls concurrently
+        from langchain_core.tools import StructuredTool
         return [
-            ToolsProvider.weatherapi_get,
-            ToolsProvider.retrive_from_qdrant,
+            StructuredTool.from_function(
+                func=ToolsProvider.weatherapi_get,
+                coroutine=ToolsProvider.aweatherapi_get
+            ),
+            StructuredTool.from_function(
+                func=ToolsProvider.retrive_from_qdrant,
+                coroutine=ToolsProvider.aretrive_from_qdrant
+            ),
         ]   
 
 
@@ -66,15 +88,17 @@ class PromptProvider:
         return {"role": "assistant", "content": message}
    
     @staticmethod
-    def get_agent_system_prompt(query: str):
-            
+    def get_agent_system_prompt(query: str = None):
+        # Must stay byte-identical across turns so the provider can cache the
+        # prompt prefix; the user query arrives as the last message instead.
+        # (query is accepted for backwards compatibility and ignored.)
         return {
             "role": "system",
-            "content": f'''
+            "content": '''
             You are and intelligent assistant that can answer any question and help the user with their queries.
             you have to run acorinng to the user query step by step with the prompt 
 
-            - Evalute the user query {query}
+            - Evalute the latest user query
             - if the user query is related to weather then use the weatherapi_get tool
                 if no location is provided then ask the user to provide the location
             - if the user query is related to any other topic then use the retrive_from_qdrant tool
@@ -83,10 +107,16 @@ class PromptProvider:
         IMPORTANT INSTRUCTIONS:
         - IF THERE IS NO RELEVANT ANSWER FROM THE QDRANT THEN DONT MAKE UP AN ANSWER SAY THE USER THAT YOU DONT KNOW THE ANSWER
         - IF THE USER ASKS ABOUT THE DOCUMENTS YOU HAVE UPLOADED THEN USE THE RETRIVE_FROM_QDRANT TOOL
+        - THE RETRIVE_FROM_QDRANT TOOL RETURNS NUMBERED SOURCES, CITE THE ONES YOU USE AS [1], [2]
         - IF THE WHTHER RESULTS IS NOT RELEVANT THEN SAY THE USER THAT YOU DONT KNOW THE ANSWER
         '''
         }
 
-
-
-
+    @staticmethod
+    def get_summary_prompt():
+        return '''
+        You maintain a running summary of a conversation between a user and an assistant.
+        Update the current summary with the new messages. Keep names, numbers, locations,
+        document titles and open questions. Drop greetings and filler. Reply with the
+        updated summary only, in at most a few short paragraphs.
+        '''
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from model_registry import registry
+from tracing import span
+
+DEFAULT_BASE_URL = "https://api.openweathermap.org"
+
+
+class WeatherClient:
+    """OpenWeatherMap client shared by every chat session in the process.
+
+    One keep-alive requests.Session with connect/read timeouts and retries on
+    connection errors, 429 and 5xx. Geocoding results never change, so they
+    are kept for the life of the process (misses included). Weather is cached
+    for weather_ttl seconds per location rounded to coordinate_precision
+    decimals (~1 km at 2), and concurrent identical lookups share one request.
+    """
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL, timeout: tuple = (3.05, 10),
+                 retries: int = 2, weather_ttl: float = 600, coordinate_precision: int = 2,
+                 max_locations: int = 1024, pool_size: int = 10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.weather_ttl = weather_ttl
+        self.coordinate_precision = coordinate_precision
+        self.max_locations = max_locations
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=0.3,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["GET"]),
+                      respect_retry_after_header=False, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._geocodes = OrderedDict()
+        self._weather = OrderedDict()
+        self._inflight = {}
+        self.stats = {"geocode_hits": 0, "geocode_misses": 0, "weather_hits": 0, "weather_misses": 0,
+                      "coalesced": 0, "requests": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "WeatherClient":
+        return cls(
+            api_key=os.getenv("OPENWEATHER_API_KEY"),
+            base_url=os.getenv("OPENWEATHER_BASE_URL", DEFAULT_BASE_URL),
+            timeout=(3.05, float(os.getenv("WEATHER_TIMEOUT", "10"))),
+            retries=int(os.getenv("WEATHER_RETRIES", "2")),
+            weather_ttl=float(os.getenv("WEATHER_CACHE_TTL", "600")),
+        )
+
+    def _get(self, path: str, params: dict):
+        with self._lock:
+            self.stats["requests"] += 1
+        with span("weather.http", path=path) as http_span:
+            response = self.session.get(f"{self.base_url}{path}", params={**params, "appid": self.api_key},
+                                        timeout=self.timeout)
+            http_span.set(http_status=str(response.status_code), response_bytes=len(response.content))
+            response.raise_for_status()
+            return response.json()
+
+    def _coalesced(self, key: tuple, fetch: Callable):
+        """Run fetch() once for concurrent callers asking for the same key"""
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _remember(self, cache: OrderedDict, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_locations:
+                cache.popitem(last=False)
+
+    def geocode(self, location: str) -> dict:
+        """{"lat", "lon", "name", "country"} for a place name, or None if unknown"""
+        key = " ".join(location.lower().split())
+        with self._lock:
+            if key in self._geocodes:
+                self.stats["geocode_hits"] += 1
+                self._geocodes.move_to_end(key)
+                return self._geocodes[key]
+            self.stats["geocode_misses"] += 1
+
+        def fetch():
+            data = self._get("/geo/1.0/direct", {"q": location, "limit": 1})
+            place = None
+            if data:
+                place = {field: data[0].get(field) for field in ("lat", "lon", "name", "country")}
+            self._remember(self._geocodes, key, place)
+            return place
+
+        return self._coalesced(("geocode", key), fetch)
+
+    def get_weather(self, lat: float, lon: float) -> dict:
+        """Current weather at (lat, lon), served from cache for weather_ttl seconds"""
+        key = (round(lat, self.coordinate_precision), round(lon, self.coordinate_precision))
+        with self._lock:
+            cached = self._weather.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.stats["weather_hits"] += 1
+                return cached[1]
+            self.stats["weather_misses"] += 1
+
+        def fetch():
+            data = self._get("/data/2.5/weather", {"lat": key[0], "lon": key[1]})
+            self._remember(self._weather, key, (time.monotonic() + self.weather_ttl, data))
+            return data
+
+        return self._coalesced(("weather",) + key, fetch)
+
+    def weather_for(self, location: str) -> dict:
+        """Geocode location and return its current weather, or {"error": ...}"""
+        try:
+            place = self.geocode(location)
+            if not place:
+                return {"error": f"Location '{location}' not found."}
+            return self.get_weather(place["lat"], place["lon"])
+        except requests.RequestException as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            # Error text includes the request URL; keep the API key out of logs and the chat
+            message = str(e).replace(self.api_key, "***") if self.api_key else str(e)
+            print(f"❌ Weather lookup failed for {location}: {message}")
+            return {"error": f"Weather service unavailable: {message}"}
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["weather_hits"] + self.stats["weather_misses"]
+            return {
+                **self.stats,
+                "weather_hit_rate": self.stats["weather_hits"] / lookups if lookups else 0.0,
+                "geocodes_cached": len(self._geocodes),
+                "locations_cached": len(self._weather),
+            }
+
+
+def get_weather_client() -> WeatherClient:
+    return registry.get_or_create("weather_client", (), WeatherClient.from_env)
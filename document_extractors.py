@@ -0,0 +1,380 @@
+import csv
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import zipfile
+from typing import Callable, Iterator
+from xml.etree.ElementTree import iterparse
+
+# Every extractor streams (page_number, text) pairs. "Pages" are real pages
+# for PDFs, slides for presentations and blocks of about TEXT_PAGE_CHARS
+# characters (or CSV_ROWS_PER_PAGE rows) for formats without pages, so
+# citations still point somewhere useful.
+TEXT_PAGE_CHARS = int(os.getenv("TEXT_PAGE_CHARS", "4000"))
+CSV_ROWS_PER_PAGE = int(os.getenv("CSV_ROWS_PER_PAGE", "50"))
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+# The formats the uploader accepts
+EXTENSION_MIME_TYPES = {
+    ".pdf": PDF_MIME,
+    ".txt": "text/plain",
+    ".csv": "text/csv",
+    ".docx": DOCX_MIME,
+    ".doc": "application/msword",
+    ".pptx": PPTX_MIME,
+    ".ppt": "application/vnd.ms-powerpoint",
+}
+
+_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DRAWING = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_RELATIONSHIPS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_PRESENTATION = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+
+
+# PDF text backends, fastest first:
+# pdfium:     PDFium's native text layer through pypdfium2
+# pypdf:      pure Python (the original extractor)
+# pdfplumber: pdfminer layout analysis, slowest
+class PdfTextBackend:
+    """Random access to the text of a PDF's pages"""
+
+    name = ""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def page_text(self, index: int) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PypdfBackend(PdfTextBackend):
+    name = "pypdf"
+
+    def __init__(self, file_path: str):
+        super().__init__(file_path)
+        from pypdf import PdfReader
+        self.reader = PdfReader(file_path)
+
+    def __len__(self) -> int:
+        return len(self.reader.pages)
+
+    def page_text(self, index: int) -> str:
+        return self.reader.pages[index].extract_text() or ""
+
+
+# PDFium is not thread-safe; ingestion jobs run in a thread pool
+_PDFIUM_LOCK = threading.Lock()
+
+
+class PdfiumBackend(PdfTextBackend):
+    name = "pdfium"
+
+    def __init__(self, file_path: str):
+        super().__init__(file_path)
+        import pypdfium2
+        with _PDFIUM_LOCK:
+            self.document = pypdfium2.PdfDocument(file_path)
+
+    def __len__(self) -> int:
+        return len(self.document)
+
+    def page_text(self, index: int) -> str:
+        with _PDFIUM_LOCK:
+            page = self.document[index]
+            text_page = page.get_textpage()
+            try:
+                text = text_page.get_text_range()
+            finally:
+                text_page.close()
+                page.close()
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def close(self):
+        with _PDFIUM_LOCK:
+            self.document.close()
+
+
+class PdfplumberBackend(PdfTextBackend):
+    name = "pdfplumber"
+
+    def __init__(self, file_path: str):
+        super().__init__(file_path)
+        import pdfplumber
+        self.document = pdfplumber.open(file_path)
+
+    def __len__(self) -> int:
+        return len(self.document.pages)
+
+    def page_text(self, index: int) -> str:
+        page = self.document.pages[index]
+        try:
+            return page.extract_text() or ""
+        finally:
+            # Parsed layout objects are cached per page otherwise
+            page.close()
+
+    def close(self):
+        self.document.close()
+
+
+PDF_BACKENDS = {backend.name: backend for backend in (PdfiumBackend, PypdfBackend, PdfplumberBackend)}
+DEFAULT_PDF_BACKEND = "pdfium"
+DEFAULT_PDF_FALLBACK = "pypdf"
+
+
+def open_pdf(file_path: str, backend: str = None) -> PdfTextBackend:
+    backend = backend or os.getenv("PDF_BACKEND", DEFAULT_PDF_BACKEND)
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend {backend!r}, expected one of {', '.join(PDF_BACKENDS)}")
+    return PDF_BACKENDS[backend](file_path)
+
+
+def count_pdf_pages(file_path: str, backend: str = None) -> int:
+    document = open_pdf(file_path, backend)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def iter_pdf_pages(file_path: str, start: int = 0, end: int = None, backend: str = None,
+                   fallback: str = None, stats: dict = None) -> Iterator[tuple]:
+    """Yield (page_number, text) for pages [start, end) with the selected backend.
+
+    Pages the backend returns no text for are extracted again with the
+    fallback backend (PDF_FALLBACK_BACKEND, "" to disable), which is only
+    opened when needed. stats, if given, counts pages, fallback pages and
+    pages that stayed empty.
+    """
+    backend = backend or os.getenv("PDF_BACKEND", DEFAULT_PDF_BACKEND)
+    if fallback is None:
+        fallback = os.getenv("PDF_FALLBACK_BACKEND", DEFAULT_PDF_FALLBACK)
+    stats = stats if stats is not None else {}
+    for key in ("pages", "fallback_pages", "empty_pages"):
+        stats.setdefault(key, 0)
+
+    document = open_pdf(file_path, backend)
+    second = None
+    try:
+        for index in range(start, min(end if end is not None else len(document), len(document))):
+            text = document.page_text(index)
+            if not text.strip() and fallback and fallback != backend:
+                if second is None:
+                    second = open_pdf(file_path, fallback)
+                text = second.page_text(index)
+                if text.strip():
+                    stats["fallback_pages"] += 1
+            if not text.strip():
+                stats["empty_pages"] += 1
+            stats["pages"] += 1
+            yield index + 1, text
+    finally:
+        document.close()
+        if second is not None:
+            second.close()
+
+
+def _paginate(pieces: Iterator[str], page_chars: int = None) -> Iterator[tuple]:
+    """Group text pieces into (page_number, text) pages of about page_chars characters.
+
+    Pages end at a line break once full (or at twice the size without one);
+    a form feed piece ("\\f") always starts a new page.
+    """
+    page_chars = page_chars or TEXT_PAGE_CHARS
+    page_number, buffer, size = 1, [], 0
+    for piece in pieces:
+        full = size >= page_chars and buffer[-1].endswith("\n") or size >= 2 * page_chars
+        if piece == "\f" or full:
+            if buffer:
+                yield page_number, "".join(buffer)
+                page_number += 1
+            buffer, size = [], 0
+            if piece == "\f":
+                continue
+        buffer.append(piece)
+        size += len(piece)
+    if buffer:
+        yield page_number, "".join(buffer)
+
+
+def iter_text_pages(file_path: str) -> Iterator[tuple]:
+    def lines():
+        with open(file_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            for line in f:
+                # Form feeds are page breaks in text exports
+                head, *rest = line.split("\f")
+                yield head
+                for part in rest:
+                    yield "\f"
+                    yield part
+
+    return _paginate(lines())
+
+
+def iter_csv_pages(file_path: str) -> Iterator[tuple]:
+    """CSV_ROWS_PER_PAGE rows per page, each row written as "column: value" pairs"""
+    with open(file_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample)
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if header is None:
+            return
+        page_number, rows = 1, []
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            rows.append(", ".join(f"{column}: {value}" for column, value in zip(header, row) if value.strip()))
+            if len(rows) >= CSV_ROWS_PER_PAGE:
+                yield page_number, "\n".join(rows)
+                page_number, rows = page_number + 1, []
+        if rows:
+            yield page_number, "\n".join(rows)
+
+
+def _docx_pieces(archive: zipfile.ZipFile) -> Iterator[str]:
+    """Paragraph text of word/document.xml, parsed incrementally, with "\\f" at page breaks"""
+    with archive.open("word/document.xml") as xml:
+        for event, element in iterparse(xml, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{_WORD}lastRenderedPageBreak" or (
+                        element.tag == f"{_WORD}br" and element.get(f"{_WORD}type") == "page"):
+                    yield "\f"
+                continue
+            if element.tag == f"{_WORD}t" and element.text:
+                yield element.text
+            elif element.tag == f"{_WORD}tab":
+                yield "\t"
+            elif element.tag in (f"{_WORD}br", f"{_WORD}cr") and element.get(f"{_WORD}type") != "page":
+                yield "\n"
+            elif element.tag == f"{_WORD}p":
+                yield "\n"
+                # Keep memory flat on large documents
+                element.clear()
+
+
+def iter_docx_pages(file_path: str) -> Iterator[tuple]:
+    """Pages as last rendered by Word when the file records them, else blocks of text"""
+    with zipfile.ZipFile(file_path) as archive:
+        yield from _paginate(_docx_pieces(archive))
+
+
+def _slide_names(archive: zipfile.ZipFile) -> list:
+    """Slide part names in presentation order"""
+    try:
+        targets = {}
+        with archive.open("ppt/_rels/presentation.xml.rels") as xml:
+            for _, element in iterparse(xml):
+                if element.tag == f"{_PACKAGE_RELATIONSHIPS}Relationship":
+                    targets[element.get("Id")] = element.get("Target")
+        names = []
+        with archive.open("ppt/presentation.xml") as xml:
+            for _, element in iterparse(xml):
+                if element.tag == f"{_PRESENTATION}sldId":
+                    target = targets[element.get(f"{_RELATIONSHIPS}id")]
+                    names.append(target.lstrip("/") if target.startswith("/") else f"ppt/{target}")
+        return names
+    except (KeyError, ValueError):
+        # Damaged or unusual package: fall back to the file numbering
+        slides = [name for name in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)]
+        return sorted(slides, key=lambda name: int(re.search(r"(\d+)\.xml$", name).group(1)))
+
+
+def iter_pptx_pages(file_path: str) -> Iterator[tuple]:
+    """One page per slide, one line per text paragraph"""
+    with zipfile.ZipFile(file_path) as archive:
+        for page_number, name in enumerate(_slide_names(archive), start=1):
+            paragraphs, current = [], []
+            with archive.open(name) as xml:
+                for _, element in iterparse(xml):
+                    if element.tag == f"{_DRAWING}t" and element.text:
+                        current.append(element.text)
+                    elif element.tag == f"{_DRAWING}p":
+                        if current:
+                            paragraphs.append("".join(current))
+                        current = []
+            yield page_number, "\n".join(paragraphs)
+
+
+def _convert_legacy(file_path: str, extension: str, extract: Callable) -> Iterator[tuple]:
+    """Extract a legacy binary Office file by converting it with LibreOffice first"""
+    soffice = shutil.which("soffice") or shutil.which("libreoffice")
+    if soffice is None:
+        raise ValueError(f"{os.path.basename(file_path)}: .doc and .ppt files need LibreOffice (soffice) "
+                         f"installed; save the file as .{extension} instead")
+    with tempfile.TemporaryDirectory() as directory:
+        subprocess.run(
+            [soffice, "--headless", "--convert-to", extension, "--outdir", directory, file_path],
+            check=True, capture_output=True, timeout=int(os.getenv("LIBREOFFICE_TIMEOUT", "120"))
+        )
+        converted = os.path.join(directory, os.path.splitext(os.path.basename(file_path))[0] + "." + extension)
+        yield from extract(converted)
+
+
+def iter_doc_pages(file_path: str) -> Iterator[tuple]:
+    return _convert_legacy(file_path, "docx", iter_docx_pages)
+
+
+def iter_ppt_pages(file_path: str) -> Iterator[tuple]:
+    return _convert_legacy(file_path, "pptx", iter_pptx_pages)
+
+
+# MIME type -> extractor(file_path) yielding (page_number, text)
+EXTRACTORS = {
+    PDF_MIME: lambda file_path: iter_pdf_pages(file_path),
+    "text/plain": iter_text_pages,
+    "text/csv": iter_csv_pages,
+    DOCX_MIME: iter_docx_pages,
+    "application/msword": iter_doc_pages,
+    PPTX_MIME: iter_pptx_pages,
+    "application/vnd.ms-powerpoint": iter_ppt_pages,
+}
+
+
+def register_extractor(mime_type: str, extractor: Callable, extensions: tuple = ()):
+    """Add or replace the extractor for a MIME type, optionally claiming file extensions"""
+    EXTRACTORS[mime_type] = extractor
+    for extension in extensions:
+        EXTENSION_MIME_TYPES[extension.lower()] = mime_type
+
+
+def supported_extensions() -> tuple:
+    return tuple(extension for extension, mime_type in EXTENSION_MIME_TYPES.items() if mime_type in EXTRACTORS)
+
+
+def detect_mime_type(file_path: str, declared: str = None) -> str:
+    """MIME type of a file: the declared one (e.g. from the browser) if supported, else by extension"""
+    if declared in EXTRACTORS:
+        return declared
+    extension = os.path.splitext(file_path)[1].lower()
+    return EXTENSION_MIME_TYPES.get(extension) or mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+
+def iter_document_pages(file_path: str, mime_type: str = None) -> Iterator[tuple]:
+    """Yield (page_number, text) for any supported document"""
+    mime_type = detect_mime_type(file_path, mime_type)
+    if mime_type not in EXTRACTORS:
+        raise ValueError(f"Unsupported document type {mime_type} for {os.path.basename(file_path)}")
+    return EXTRACTORS[mime_type](file_path)
+
+
+def is_pdf(file_path: str, mime_type: str = None) -> bool:
+    return detect_mime_type(file_path, mime_type) == PDF_MIME
@@ -0,0 +1,174 @@
+import os
+import re
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+# torch:      float32 PyTorch (the original behaviour)
+# torch-int8: PyTorch with Linear layers dynamically quantized to int8
+# onnx:       ONNX Runtime, float32
+# onnx-int8:  ONNX Runtime with a dynamically quantized int8 export
+# The ONNX backends need sentence-transformers>=3.2 with the onnx extra:
+#   pip install "sentence-transformers[onnx]"
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+# hash: no model at all, deterministic word-hashing vectors. Keyword-level
+# retrieval quality only; for offline benchmarks and smoke tests.
+OFFLINE_BACKENDS = ("hash",)
+
+
+def default_threads() -> int:
+    return int(os.getenv("EMBEDDING_THREADS", "0")) or (os.cpu_count() or 1)
+
+
+def _quantization_config() -> str:
+    """ONNX Runtime quantization preset matching this CPU"""
+    configured = os.getenv("EMBEDDING_QUANT_CONFIG")
+    if configured:
+        return configured
+    if os.uname().machine in ("aarch64", "arm64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def _session_options(threads: int):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+def _load_torch(model_name: str, threads: int, quantize: bool):
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if quantize:
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _load_onnx(model_name: str, threads: int, quantize: bool):
+    from sentence_transformers import SentenceTransformer
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": _session_options(threads)}
+    if not quantize:
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    config = _quantization_config()
+    export_dir = os.path.join(
+        os.getenv("EMBEDDING_EXPORT_DIR", ".cache/embedders"), re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+    )
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        # One-off export: float32 ONNX model, then dynamic int8 quantization
+        print(f"Exporting int8 ONNX model ({config}) to {export_dir}")
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save(export_dir)
+        export_dynamic_quantized_onnx_model(model, config, export_dir)
+    return SentenceTransformer(export_dir, backend="onnx", model_kwargs={**model_kwargs, "file_name": file_name})
+
+
+class HashingEmbedder:
+    """Stand-in for a SentenceTransformer that hashes words into a fixed-size vector"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        if not len(sentences):
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.stack([self._vector(sentence) for sentence in sentences])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+
+class EmbeddingEngine:
+    """A SentenceTransformer loaded with a given backend, thread count and batch size.
+
+    Exposes the encode() / get_sentence_embedding_dimension() subset the rest
+    of the code uses, so it can stand in for a plain SentenceTransformer.
+    """
+
+    def __init__(self, model_name: str, backend: str = DEFAULT_BACKEND, threads: int = None,
+                 batch_size=None):
+        if backend not in BACKENDS + OFFLINE_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS + OFFLINE_BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads or default_threads()
+
+        print(f"Loading model: {model_name} ({backend}, {self.threads} threads)")
+        if backend == "hash":
+            self.model = HashingEmbedder()
+        else:
+            loader = _load_onnx if backend.startswith("onnx") else _load_torch
+            self.model = loader(model_name, self.threads, quantize=backend.endswith("int8"))
+        print("✅ Model loaded")
+
+        batch_size = batch_size or os.getenv("EMBEDDING_BATCH_SIZE", "32")
+        self.batch_size = self.tune_batch_size() if batch_size == "auto" else int(batch_size)
+
+    @classmethod
+    def from_env(cls, model_name: str, backend: str = None) -> "EmbeddingEngine":
+        return cls(model_name, backend or os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND))
+
+    @property
+    def cache_key(self) -> str:
+        """Model identity for caches: vectors from different backends are not interchangeable"""
+        return self.model_name if self.backend == DEFAULT_BACKEND else f"{self.model_name}@{self.backend}"
+
+    def encode(self, sentences, **kwargs):
+        kwargs.setdefault("batch_size", self.batch_size)
+        return self.model.encode(sentences, **kwargs)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def tune_batch_size(self, texts: List[str] = None, candidates=(8, 16, 32, 64, 128)) -> int:
+        """Pick the batch size with the best throughput on this host"""
+        texts = texts or ["The quick brown fox jumps over the lazy dog. " * 10] * 256
+        best, best_rate = candidates[0], 0.0
+        self.model.encode(texts[:candidates[0]], batch_size=candidates[0])
+        for batch_size in candidates:
+            started = time.perf_counter()
+            self.model.encode(texts, batch_size=batch_size)
+            rate = len(texts) / (time.perf_counter() - started)
+            if rate > best_rate:
+                best, best_rate = batch_size, rate
+        print(f"✅ Embedding batch size {best} ({best_rate:.0f} texts/s)")
+        return best
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, queries_reference: np.ndarray,
+                queries_candidate: np.ndarray, k: int = 5) -> float:
+    """Overlap of the top-k neighbours found with candidate vs reference embeddings"""
+    def top_k(corpus, queries):
+        corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        return np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+
+    expected, found = top_k(reference, queries_reference), top_k(candidate, queries_candidate)
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
@@ -0,0 +1,112 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from bulk_ingest import find_files
+from embedding_backends import BACKENDS, EmbeddingEngine, recall_at_k
+from parallel_extraction import _extract_document
+
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
+
+
+def load_chunks(directory: str, limit: int = 2000, chunk_size: int = 500, chunk_overlap: int = 100) -> list:
+    """Chunk texts from the PDFs under directory, split the same way as ingestion"""
+    chunks = []
+    for path in find_files(directory):
+        for _, page_chunks in _extract_document(path, chunk_size, chunk_overlap):
+            chunks.extend(page_chunks)
+            if len(chunks) >= limit:
+                return chunks[:limit]
+    return chunks
+
+
+def make_queries(chunks: list, count: int = 50) -> list:
+    """Short query-like snippets: the opening words of evenly spaced chunks"""
+    step = max(1, len(chunks) // count)
+    return [" ".join(chunk.split()[:12]) for chunk in chunks[::step][:count]]
+
+
+def run_benchmark(chunks: list, backends=BACKENDS, model_name: str = MODEL_NAME, k: int = 5,
+                  threads: int = None, batch_size=None) -> list:
+    """Throughput and recall of each backend; the first backend is the reference"""
+    queries = make_queries(chunks)
+    results = []
+    reference = None
+
+    for backend in backends:
+        try:
+            started = time.perf_counter()
+            engine = EmbeddingEngine(model_name, backend, threads=threads, batch_size=batch_size)
+            load_seconds = time.perf_counter() - started
+
+            # Warm up before timing
+            engine.encode(chunks[:engine.batch_size])
+            started = time.perf_counter()
+            corpus = np.asarray(engine.encode(chunks), dtype=np.float32)
+            encode_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            query_vectors = np.asarray([engine.encode(query) for query in queries], dtype=np.float32)
+            query_ms = (time.perf_counter() - started) / len(queries) * 1000
+        except Exception as e:
+            print(f"❌ {backend}: {str(e)}")
+            results.append({"backend": backend, "error": str(e)})
+            continue
+
+        if reference is None:
+            reference = (corpus, query_vectors)
+        unit = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+        reference_unit = reference[0] / np.linalg.norm(reference[0], axis=1, keepdims=True)
+
+        results.append({
+            "backend": backend,
+            "threads": engine.threads,
+            "batch_size": engine.batch_size,
+            "load_seconds": round(load_seconds, 2),
+            "chunks_per_second": round(len(chunks) / encode_seconds, 1),
+            "query_ms": round(query_ms, 2),
+            f"recall_at_{k}": round(recall_at_k(reference[0], corpus, reference[1], query_vectors, k), 4),
+            "mean_cosine_to_reference": round(float(np.mean(np.sum(unit * reference_unit, axis=1))), 4),
+        })
+    return results
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Compare embedding backends on PDF chunks")
+    parser.add_argument("directory", nargs="?", default="uploads")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS,
+                        help="The first backend is the reference for recall")
+    parser.add_argument("--limit", type=int, default=2000, help="Maximum chunks to embed")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--batch-size", default=None, help="Integer or 'auto'")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    chunks = load_chunks(args.directory, args.limit)
+    if not chunks:
+        print(f"❌ No PDF chunks found under {args.directory}")
+        return 1
+    print(f"📄 Benchmarking {len(chunks)} chunks")
+
+    results = run_benchmark(chunks, args.backends, k=args.k, threads=args.threads, batch_size=args.batch_size)
+    print("=" * 40)
+    for row in results:
+        if "error" in row:
+            print(f"{row['backend']:<11} failed: {row['error']}")
+            continue
+        print(f"{row['backend']:<11} {row['chunks_per_second']:>8} chunks/s  {row['query_ms']:>7} ms/query  "
+              f"recall@{args.k}={row[f'recall_at_{args.k}']}  cos={row['mean_cosine_to_reference']}  "
+              f"(batch {row['batch_size']}, {row['threads']} threads)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"chunks": len(chunks), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, use one directory per process
+    fcntl = None
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivially different queries share a key"""
+    return " ".join(query.lower().split())
+
+
+class _DiskVectorStore:
+    """Append-only memory-mapped float32 store for one embedding model.
+
+    Vectors live in ``<model>.f32`` as a flat row-major matrix and the
+    key -> row mapping in ``<model>.idx``, an append-only log of
+    ``key<TAB>row`` lines after a ``#dim<TAB>n`` header. Writers take an
+    exclusive lock on ``<model>.lock`` (POSIX only), pick the row from the
+    vectors file size and append, so several processes can share one
+    directory; readers pick up other processes' rows by re-reading the
+    log's tail on a miss. Embeddings of a fixed model never go stale, so
+    this layer has no expiry.
+    """
+
+    def __init__(self, directory: str, model_name: str):
+        os.makedirs(directory, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.vectors_path = os.path.join(directory, f"{safe_name}.f32")
+        self.log_path = os.path.join(directory, f"{safe_name}.idx")
+        self.lock_path = os.path.join(directory, f"{safe_name}.lock")
+        self.dim = None
+        self.index = {}
+        self._log_offset = 0
+        self._mmap = None
+        self._mmap_rows = 0
+        self._refresh()
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Read log lines appended since the last call (by any process)"""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # A line still being written by another process is read next time
+        complete = data[:data.rfind(b"\n") + 1]
+        self._log_offset += len(complete)
+        for line in complete.decode("utf-8").splitlines():
+            key, _, value = line.partition("\t")
+            if key == "#dim":
+                self.dim = int(value)
+            elif value:
+                self.index[key] = int(value)
+
+    def _rows_on_disk(self) -> int:
+        if not self.dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def get(self, key: str):
+        row = self.index.get(key)
+        if row is None:
+            self._refresh()
+            row = self.index.get(key)
+            if row is None:
+                return None
+        if self._mmap is None or row >= self._mmap_rows:
+            self._mmap_rows = self._rows_on_disk()
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                   shape=(self._mmap_rows, self.dim))
+        return np.array(self._mmap[row])
+
+    def put(self, key: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        with self._locked():
+            self._refresh()
+            if key in self.index:
+                return
+            header = ""
+            if self.dim is None:
+                self.dim = int(vector.shape[0])
+                header = f"#dim\t{self.dim}\n"
+            if vector.shape[0] != self.dim:
+                return
+            with open(self.vectors_path, "ab") as f:
+                # Drop a partial row left by a writer that died mid-append
+                row_bytes = 4 * self.dim
+                size = os.fstat(f.fileno()).st_size
+                f.truncate(size - size % row_bytes)
+                row = size // row_bytes
+                f.write(vector.tobytes())
+            with open(self.log_path, "a") as f:
+                f.write(f"{header}{key}\t{row}\n")
+            self._refresh()
+
+    def __len__(self):
+        return len(self.index)
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU/TTL cache of query embeddings, keyed by normalized text and model.
+
+    An optional on-disk layer (``persist_dir``) keeps embeddings across
+    restarts and, on POSIX, between processes sharing the same directory.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, persist_dir: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_dir = persist_dir
+        self._entries = OrderedDict()
+        self._disk_stores = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "QueryEmbeddingCache":
+        return cls(
+            max_entries=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+            persist_dir=os.getenv("QUERY_CACHE_DIR") or None,
+        )
+
+    def _disk_store(self, model_name: str):
+        if not self.persist_dir:
+            return None
+        if model_name not in self._disk_stores:
+            self._disk_stores[model_name] = _DiskVectorStore(self.persist_dir, model_name)
+        return self._disk_stores[model_name]
+
+    @staticmethod
+    def _disk_key(normalized: str) -> str:
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: tuple, vector: np.ndarray):
+        self._entries[key] = (vector, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, query: str, model_name: str):
+        normalized = normalize_query(query)
+        key = (model_name, normalized)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    self.evictions += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+
+            disk = self._disk_store(model_name)
+            if disk is not None:
+                vector = disk.get(self._disk_key(normalized))
+                if vector is not None:
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, model_name: str, vector):
+        normalized = normalize_query(query)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember((model_name, normalized), vector)
+            disk = self._disk_store(model_name)
+            if disk is not None:
+                try:
+                    disk.put(self._disk_key(normalized), vector)
+                except OSError as e:
+                    print(f"❌ Error persisting query embedding: {str(e)}")
+
+    def get_or_compute(self, query: str, model_name: str, encode):
+        """Return the cached embedding for query, calling encode(query) on a miss"""
+        vector = self.get(query, model_name)
+        if vector is None:
+            vector = np.asarray(encode(query), dtype=np.float32)
+            self.put(query, model_name, vector)
+        return vector
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "disk_size": sum(len(store) for store in self._disk_stores.values()),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
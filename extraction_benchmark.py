@@ -0,0 +1,96 @@
+import argparse
+import json
+import time
+
+from bulk_ingest import find_files
+from document_extractors import DEFAULT_PDF_BACKEND, PDF_BACKENDS, is_pdf, iter_pdf_pages
+
+
+def _words(text: str) -> set:
+    return set(text.lower().split())
+
+
+def run_benchmark(paths: list, backends=tuple(PDF_BACKENDS), fallback: str = "", rounds: int = 3) -> list:
+    """Pages/s of each PDF backend over paths; the first backend is the reference for word overlap"""
+    results = []
+    reference = None
+
+    for backend in backends:
+        try:
+            # Warm-up: imports and library initialization are not timed
+            for _ in iter_pdf_pages(paths[0], end=1, backend=backend, fallback=fallback):
+                pass
+
+            best = None
+            for _ in range(rounds):
+                stats = {}
+                texts = []
+                started = time.perf_counter()
+                for path in paths:
+                    texts.extend(text for _, text in iter_pdf_pages(path, backend=backend, fallback=fallback,
+                                                                    stats=stats))
+                seconds = time.perf_counter() - started
+                if best is None or seconds < best[0]:
+                    best = (seconds, stats, texts)
+        except Exception as e:
+            print(f"❌ {backend}: {str(e)}")
+            results.append({"backend": backend, "error": str(e)})
+            continue
+
+        seconds, stats, texts = best
+        if reference is None:
+            reference = texts
+        # Share of the reference's words each page recovers (1.0 = nothing missing)
+        overlaps = [len(_words(text) & _words(expected)) / len(_words(expected))
+                    for text, expected in zip(texts, reference) if _words(expected)]
+
+        results.append({
+            "backend": backend,
+            "pages": stats["pages"],
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(stats["pages"] / seconds, 1) if seconds else 0.0,
+            "characters": sum(len(text) for text in texts),
+            "empty_pages": stats["empty_pages"],
+            "fallback_pages": stats["fallback_pages"],
+            "word_overlap_with_reference": round(sum(overlaps) / len(overlaps), 4) if overlaps else 0.0,
+        })
+    return results
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Compare PDF text extraction backends")
+    parser.add_argument("directory", nargs="?", default="uploads")
+    parser.add_argument("--backends", nargs="+", default=list(PDF_BACKENDS), choices=list(PDF_BACKENDS),
+                        help="The first backend is the reference for word overlap")
+    parser.add_argument("--fallback", default="", choices=[""] + list(PDF_BACKENDS),
+                        help="Fallback backend for empty pages (default: none, to time each backend alone)")
+    parser.add_argument("--rounds", type=int, default=3, help="Best of this many passes is reported")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    paths = [path for path in find_files(args.directory) if is_pdf(path)]
+    if not paths:
+        print(f"❌ No PDFs found under {args.directory}")
+        return 1
+    print(f"📄 Benchmarking {len(paths)} PDFs")
+
+    results = run_benchmark(paths, args.backends, fallback=args.fallback, rounds=args.rounds)
+    print("=" * 40)
+    for row in results:
+        if "error" in row:
+            print(f"{row['backend']:<11} failed: {row['error']}")
+            continue
+        print(f"{row['backend']:<11} {row['pages_per_second']:>8} pages/s  {row['pages']} pages  "
+              f"{row['characters']} chars  empty={row['empty_pages']}  fallback={row['fallback_pages']}  "
+              f"overlap={row['word_overlap_with_reference']}")
+    print(f"(default backend: {DEFAULT_PDF_BACKEND}, set PDF_BACKEND to change)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"files": len(paths), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
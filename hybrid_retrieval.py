@@ -0,0 +1,141 @@
+import math
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from model_registry import registry
+
+DEFAULT_RERANKER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Words too common to help keyword matching; dropping them keeps postings small
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my not of on or our
+she so than that the their them then there these they this to was we were what when where which who
+will with you your
+""".split())
+
+# Keeps figures, versions and clause numbers such as 4.2, 12,000 or 3(b) together
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,/\-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def term_id(token: str) -> int:
+    """Stable 31-bit id for a token, used as the sparse vector index"""
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+class Bm25Encoder:
+    """BM25 sparse vectors: term-frequency saturation on the document side,
+    IDF on the query side (Qdrant's IDF modifier or the local index).
+
+    Chunks are ingested one batch at a time, so document length is normalized
+    against a fixed average instead of the collection's.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_tokens: float = 80.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_tokens = avg_doc_tokens
+
+    def encode_document(self, text: str) -> tuple:
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_doc_tokens)
+        ids, weights = [], []
+        for token, tf in counts.items():
+            ids.append(term_id(token))
+            weights.append(tf * (self.k1 + 1) / (tf + norm))
+        return ids, weights
+
+    def encode_query(self, text: str) -> tuple:
+        ids = sorted({term_id(token) for token in tokenize(text)})
+        return ids, [1.0] * len(ids)
+
+
+def bm25_idf(document_count: int, document_frequency: int) -> float:
+    return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def reciprocal_rank_fusion(rankings: List[list], k: int = 60) -> List[tuple]:
+    """Fuse ranked lists of records by id; returns [(record, score)] best first"""
+    scores = {}
+    records = {}
+    for ranking in rankings:
+        for rank, record in enumerate(ranking):
+            scores[record.id] = scores.get(record.id, 0.0) + 1.0 / (k + rank + 1)
+            records.setdefault(record.id, record)
+    return sorted(((records[point_id], score) for point_id, score in scores.items()),
+                  key=lambda item: item[1], reverse=True)
+
+
+class RetrievalSettings:
+    """Toggles and per-stage latency budgets for search_documents"""
+
+    def __init__(self, hybrid: bool = True, rerank: bool = False, top_k: int = 5, candidates: int = 20,
+                 sparse_budget_ms: float = 150, rerank_budget_ms: float = 300,
+                 reranker_model: str = DEFAULT_RERANKER):
+        self.hybrid = hybrid
+        self.rerank = rerank
+        self.top_k = top_k
+        self.candidates = candidates
+        self.sparse_budget_ms = sparse_budget_ms
+        self.rerank_budget_ms = rerank_budget_ms
+        self.reranker_model = reranker_model
+
+    @classmethod
+    def from_env(cls) -> "RetrievalSettings":
+        return cls(
+            hybrid=os.getenv("RETRIEVAL_HYBRID", "1") == "1",
+            rerank=os.getenv("RETRIEVAL_RERANK", "0") == "1",
+            top_k=int(os.getenv("RETRIEVAL_TOP_K", "5")),
+            candidates=int(os.getenv("RETRIEVAL_CANDIDATES", "20")),
+            sparse_budget_ms=float(os.getenv("RETRIEVAL_SPARSE_BUDGET_MS", "150")),
+            rerank_budget_ms=float(os.getenv("RETRIEVAL_RERANK_BUDGET_MS", "300")),
+            reranker_model=os.getenv("RETRIEVAL_RERANKER", DEFAULT_RERANKER),
+        )
+
+
+def get_retrieval_pool() -> ThreadPoolExecutor:
+    """Threads for running the sparse search next to the dense one"""
+    return registry.get_or_create(
+        "retrieval_pool", (), lambda: ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+    )
+
+
+def get_reranker(model_name: str = DEFAULT_RERANKER):
+    def factory():
+        from sentence_transformers import CrossEncoder
+        print(f"Loading reranker: {model_name}")
+        model = CrossEncoder(model_name, device="cpu")
+        print("✅ Reranker loaded")
+        return model
+
+    return registry.get_or_create("reranker", (model_name,), factory)
+
+
+def rerank(query: str, candidates: List[tuple], text_of: Callable, model_name: str,
+           budget_ms: float, batch_size: int = 8) -> tuple:
+    """Re-order fused (record, score) candidates with a cross-encoder.
+
+    Candidates are scored best-first in small batches until the budget runs
+    out; anything left unscored keeps its fused order after the scored ones.
+    Returns (candidates, scored_count).
+    """
+    model = get_reranker(model_name)
+    deadline = time.perf_counter() + budget_ms / 1000
+    scored = []
+    for start in range(0, len(candidates), batch_size):
+        if scored and time.perf_counter() >= deadline:
+            break
+        batch = candidates[start:start + batch_size]
+        scores = model.predict([(query, text_of(record)) for record, _ in batch], batch_size=batch_size)
+        scored.extend((record, float(score)) for (record, _), score in zip(batch, scores))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored + candidates[len(scored):], len(scored)
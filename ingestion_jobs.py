@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from model_registry import registry
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class IngestionJobQueue:
+    """Background worker pool for document ingestion with a persistent job table.
+
+    Jobs are recorded in SQLite with their status (queued, running, done,
+    failed), progress and result, so they outlive Streamlit reruns and are
+    visible to every session in the process. Jobs left queued or running by
+    a previous process are picked up again on start.
+    """
+
+    def __init__(self, db_path: str = "ingestion_jobs.db", max_workers: int = 2):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                document_name TEXT,
+                path TEXT NOT NULL,
+                user_id TEXT,
+                document_category TEXT,
+                content_hash TEXT,
+                qdrant_url TEXT,
+                collection_name TEXT,
+                status TEXT NOT NULL,
+                pages_done INTEGER DEFAULT 0,
+                total_pages INTEGER DEFAULT 0,
+                chunks_done INTEGER DEFAULT 0,
+                vector_ids TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        self._conn.commit()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._resume_unfinished()
+
+    @classmethod
+    def from_env(cls) -> "IngestionJobQueue":
+        return cls(
+            db_path=os.getenv("INGEST_JOBS_DB", "ingestion_jobs.db"),
+            max_workers=int(os.getenv("INGEST_WORKERS", "2")),
+        )
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", tuple(fields.values()) + (job_id,))
+
+    def _resume_unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATUSES
+            ).fetchall()
+        for row in rows:
+            print(f"Resuming ingestion job {row['job_id']}")
+            self._update(row["job_id"], status="queued")
+            self._executor.submit(self._run, row["job_id"])
+
+    def submit(self, doc_info: dict, user_id: str, document_category: str,
+               qdrant_url: str = None, collection_name: str = None) -> str:
+        """Queue a document for ingestion and return its job id.
+
+        A document that already has a queued or running job is not queued twice.
+        """
+        existing = self.get_active_job(doc_info["document_id"])
+        if existing:
+            return existing["job_id"]
+
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._execute(
+            """INSERT INTO jobs (job_id, document_id, document_name, path, user_id, document_category,
+                                 content_hash, qdrant_url, collection_name, status, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)""",
+            (job_id, doc_info["document_id"], doc_info.get("name"), doc_info["path"], user_id,
+             document_category, doc_info.get("content_hash"), qdrant_url, collection_name, now, now)
+        )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id: str):
+        job = self.get_job(job_id)
+        if job is None:
+            return
+        self._update(job_id, status="running", error=None)
+        try:
+            from pdf_processor_simple import PDFProcessorSimple
+            processor = PDFProcessorSimple.get_shared(
+                qdrant_url=job["qdrant_url"], collection_name=job["collection_name"]
+            )
+
+            def report_progress(pages_done, total_pages, chunks_done):
+                self._update(job_id, pages_done=pages_done, total_pages=total_pages, chunks_done=chunks_done)
+
+            vector_ids = processor.process_pdf_file(
+                pdf_path=job["path"],
+                user_id=job["user_id"],
+                document_category=job["document_category"],
+                document_id=job["document_id"],
+                content_hash=job["content_hash"],
+                progress_callback=report_progress
+            )
+            if not vector_ids:
+                raise ValueError("No text could be extracted from the document")
+            self._update(job_id, status="done", chunks_done=len(vector_ids), vector_ids=json.dumps(vector_ids))
+            print(f"✅ Ingestion job {job_id} done ({len(vector_ids)} chunks)")
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e))
+            print(f"❌ Ingestion job {job_id} failed: {str(e)}")
+
+    @staticmethod
+    def _row_to_dict(row) -> dict:
+        job = dict(row)
+        job["vector_ids"] = json.loads(job["vector_ids"]) if job["vector_ids"] else []
+        return job
+
+    def get_job(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_active_job(self, document_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE document_id = ? AND status IN (?, ?) ORDER BY created_at DESC",
+                (document_id,) + ACTIVE_STATUSES
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def has_active_jobs(self, job_ids: list = None) -> bool:
+        if job_ids is not None:
+            return any((job := self.get_job(job_id)) and job["status"] in ACTIVE_STATUSES for job_id in job_ids)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchone()
+        return row[0] > 0
+
+
+def get_job_queue() -> IngestionJobQueue:
+    """Process-wide job queue shared by every Streamlit session"""
+    return registry.get_or_create("ingestion_queue", (), IngestionJobQueue.from_env)
@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+import weakref
+from typing import Callable
+
+# QDRANT_URL for Qdrant's embedded in-memory mode (nothing is persisted)
+MEMORY_URL = ":memory:"
+
+
+class _LoopResources:
+    """Resources bound to one event loop, closed when that loop shuts down.
+
+    asyncio.run() (and anything else calling loop.shutdown_asyncgens())
+    closes every suspended async generator of the loop before closing it;
+    a generator parked here runs the close callbacks at that point.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.resources = {}
+        self.locks = {}
+        self.closers = []
+        self._shutdown_hook = self._close_on_shutdown()
+        # Advance it to its first yield so the loop tracks it
+        asyncio.ensure_future(self._shutdown_hook.__anext__(), loop=loop)
+
+    async def _close_on_shutdown(self):
+        try:
+            yield
+        finally:
+            for resource, close in reversed(self.closers):
+                try:
+                    await close(resource)
+                except Exception as e:
+                    print(f"❌ Error closing {type(resource).__name__}: {str(e)}")
+            self.closers.clear()
+            self.resources.clear()
+            # The generator references the loop; let both be collected
+            self._shutdown_hook = None
+
+
+class ModelRegistry:
+    """Process-wide, thread-safe cache of embedding models and Qdrant clients.
+
+    Every Streamlit session, agent tool call and script in the process shares
+    the same warm SentenceTransformer and the same pooled QdrantClient, so the
+    expensive construction (model load, connection setup, collection check)
+    happens once per process instead of once per call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._resources = {}
+        self._stats = {}
+        # Keyed by the loop object, not id(): ids of finished loops are reused
+        self._loop_resources = weakref.WeakKeyDictionary()
+
+    def _key_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _count(self, kind: str, hit: bool, seconds: float = 0.0):
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+            if not hit:
+                # Time spent building resources of this kind, for the startup report
+                stats["build_seconds"] = stats.get("build_seconds", 0.0) + seconds
+
+    def get_or_create(self, kind: str, key: tuple, factory: Callable):
+        """Return the cached resource for (kind, key), building it once with factory()"""
+        full_key = (kind,) + tuple(key)
+        if full_key in self._resources:
+            self._count(kind, hit=True)
+            return self._resources[full_key]
+
+        # Per-key lock so a slow model load does not block unrelated lookups
+        with self._key_lock(full_key):
+            if full_key in self._resources:
+                self._count(kind, hit=True)
+                return self._resources[full_key]
+            started = time.perf_counter()
+            resource = factory()
+            self._resources[full_key] = resource
+            self._count(kind, hit=False, seconds=time.perf_counter() - started)
+            return resource
+
+    def _for_loop(self) -> _LoopResources:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            resources = self._loop_resources.get(loop)
+            if resources is None:
+                resources = self._loop_resources[loop] = _LoopResources(loop)
+            return resources
+
+    def get_or_create_for_loop(self, kind: str, key: tuple, factory: Callable, close: Callable = None):
+        """get_or_create for resources bound to the running event loop (async clients).
+
+        Each loop gets its own instance, dropped with the loop; close(resource)
+        is awaited when the loop shuts down. Call from the loop's thread.
+        """
+        resources = self._for_loop()
+        full_key = (kind,) + tuple(key)
+        if full_key in resources.resources:
+            self._count(kind, hit=True)
+            return resources.resources[full_key]
+        # No await between the check and the insert, so coroutines of one loop cannot race here
+        started = time.perf_counter()
+        resource = resources.resources[full_key] = factory()
+        if close:
+            resources.closers.append((resource, close))
+        self._count(kind, hit=False, seconds=time.perf_counter() - started)
+        return resource
+
+    async def aget_or_create_for_loop(self, kind: str, key: tuple, factory: Callable, close: Callable = None):
+        """get_or_create_for_loop with an async factory, built once even when coroutines ask concurrently"""
+        resources = self._for_loop()
+        full_key = (kind,) + tuple(key)
+        lock = resources.locks.setdefault(full_key, asyncio.Lock())
+        async with lock:
+            if full_key in resources.resources:
+                self._count(kind, hit=True)
+                return resources.resources[full_key]
+            started = time.perf_counter()
+            resource = resources.resources[full_key] = await factory()
+            if close:
+                resources.closers.append((resource, close))
+            self._count(kind, hit=False, seconds=time.perf_counter() - started)
+            return resource
+
+    def put(self, kind: str, key: tuple, resource):
+        """Install resource for (kind, key), replacing any cached one (e.g. a stand-in model for benchmarks)"""
+        full_key = (kind,) + tuple(key)
+        with self._key_lock(full_key):
+            self._resources[full_key] = resource
+
+    def get_embedder(self, model_name: str, backend: str = None):
+        """EmbeddingEngine for model_name; backend defaults to EMBEDDING_BACKEND or torch"""
+        import os
+        backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+
+        def factory():
+            from embedding_backends import EmbeddingEngine
+            return EmbeddingEngine(model_name, backend)
+
+        return self.get_or_create("embedder", (model_name, backend), factory)
+
+    def get_qdrant_client(self, qdrant_url: str, api_key: str = None):
+        def factory():
+            import os
+            from qdrant_client import QdrantClient
+            print(f"Connecting to Qdrant at: {qdrant_url}")
+            # gRPC sends vectors as packed float32 instead of JSON numbers
+            prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "0") == "1"
+            if qdrant_url == MEMORY_URL:
+                # Embedded in-process Qdrant, e.g. for offline benchmarks
+                client = QdrantClient(location=MEMORY_URL)
+            elif api_key:
+                # Connect to hosted Qdrant with API key
+                client = QdrantClient(url=qdrant_url, api_key=api_key, prefer_grpc=prefer_grpc)
+            else:
+                # Connect without API key (for self-hosted or public instances)
+                client = QdrantClient(url=qdrant_url, prefer_grpc=prefer_grpc)
+            print("✅ Qdrant connected")
+            return client
+
+        return self.get_or_create("qdrant_client", (qdrant_url, api_key), factory)
+
+    def get_async_qdrant_client(self, qdrant_url: str, api_key: str = None):
+        """AsyncQdrantClient for the running event loop (async clients are loop-bound)"""
+        def factory():
+            from qdrant_client import AsyncQdrantClient
+            if api_key:
+                return AsyncQdrantClient(url=qdrant_url, api_key=api_key)
+            return AsyncQdrantClient(url=qdrant_url)
+
+        return self.get_or_create_for_loop("async_qdrant_client", (qdrant_url, api_key), factory,
+                                           close=lambda client: client.close())
+
+    def get_vector_store(self, qdrant_url: str, collection_name: str, api_key: str = None, profile: str = None):
+        """Vector store for a collection: remote Qdrant, or the embedded index for local:<dir> URLs"""
+        def factory():
+            from vector_store import create_vector_store
+            return create_vector_store(qdrant_url, collection_name, api_key, profile)
+
+        return self.get_or_create("vector_store", (qdrant_url, collection_name, api_key, profile), factory)
+
+    def get_query_cache(self):
+        def factory():
+            from embedding_cache import QueryEmbeddingCache
+            return QueryEmbeddingCache.from_env()
+
+        return self.get_or_create("query_cache", (), factory)
+
+    def ensure_collection(self, qdrant_url: str, collection_name: str, check: Callable):
+        """Run the collection existence check once per (url, collection).
+
+        check() should return True on success; failures are not cached so the
+        next caller retries.
+        """
+        full_key = ("collection", qdrant_url, collection_name)
+        with self._key_lock(full_key):
+            if full_key in self._resources:
+                self._count("collection", hit=True)
+                return True
+            started = time.perf_counter()
+            ok = check()
+            self._count("collection", hit=False, seconds=time.perf_counter() - started)
+            if ok:
+                self._resources[full_key] = True
+                return True
+            return False
+
+    def get_stats(self) -> dict:
+        """Hit/miss counters and number of cached resources per kind"""
+        with self._lock:
+            stats = {kind: dict(counts) for kind, counts in self._stats.items()}
+            for key in self._resources:
+                stats.setdefault(key[0], {"hits": 0, "misses": 0})
+                stats[key[0]]["cached"] = stats[key[0]].get("cached", 0) + 1
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._resources.clear()
+            self._loop_resources.clear()
+            self._key_locks.clear()
+            self._stats.clear()
+
+
+registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    return registry
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bulk_ingest import find_files
+from model_registry import MEMORY_URL
+from tracing import get_tracer
+
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
+COLLECTION = "benchmark"
+
+# Recorded agent turns replayed by the fake chat model; the tools really run
+# against the in-memory collection and the stub weather server
+DEFAULT_SCRIPT = [
+    {
+        "query": "What do the approval rules say about previous loan defaults?",
+        "tool_calls": [{"name": "retrive_from_qdrant", "args": {"query": "approval rules previous loan defaults"}}],
+        "answer": "Every approval rule starts with previous_loan_defaults_on_file = No, so applicants with an "
+                  "earlier default are never approved [1].",
+    },
+    {
+        "query": "What's the weather in London right now?",
+        "tool_calls": [{"name": "weatherapi_get", "args": {"location": "London"}}],
+        "answer": "It is clear in London at about 22°C with a light southerly wind.",
+    },
+    {
+        "query": "Compare the weather in Paris and Tokyo, and remind me how data preprocessing helped the model.",
+        "tool_calls": [
+            {"name": "weatherapi_get", "args": {"location": "Paris"}},
+            {"name": "weatherapi_get", "args": {"location": "Tokyo"}},
+            {"name": "retrive_from_qdrant", "args": {"query": "importance of data preprocessing"}},
+        ],
+        "answer": "Both cities are clear; Tokyo is slightly warmer. Preprocessing converted categorical "
+                  "variables to factors so RIPPER could learn rules from them [1].",
+    },
+    {
+        "query": "Thanks, that's all!",
+        "answer": "You're welcome! Ask me about your documents or the weather any time.",
+    },
+]
+
+# Stage metric compared between runs, and whether higher is better
+_KEY_METRICS = (("per_second", True), ("p50_ms", False))
+
+
+def configure_environment(work_dir: str, weather_url: str, embedding_backend: str):
+    """Point every component at local stand-ins. Must run before the app modules are imported."""
+    os.environ.pop("QDRANT_API_KEY", None)
+    os.environ.update({
+        "QDRANT_URL": MEMORY_URL,
+        "VECTOR_NAME": COLLECTION,
+        "EMBEDDING_BACKEND": embedding_backend,
+        "HF_HUB_OFFLINE": "1",
+        "CHECKPOINT_DB": os.path.join(work_dir, "checkpoints.sqlite"),
+        "QUERY_CACHE_DIR": "",
+        "RESPONSE_CACHE_ENABLED": "0",
+        "STARTUP_WARMUP": "0",
+        "RETRIEVAL_RERANK": "0",
+        "OPENAI_API_KEY": "offline-benchmark",
+        "OPENWEATHER_API_KEY": "offline-benchmark",
+        "OPENWEATHER_BASE_URL": weather_url,
+    })
+
+
+def throughput(count: int, seconds: float, unit: str, **extra) -> dict:
+    return {unit: count, "seconds": round(seconds, 4), "per_second": round(count / seconds, 1) if seconds else 0.0,
+            **extra}
+
+
+def latency(samples: list, **extra) -> dict:
+    samples_ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(samples_ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(samples_ms, 95)), 2),
+        "max_ms": round(float(samples_ms.max()), 2),
+        **extra,
+    }
+
+
+def best_of(rounds: int, func) -> tuple:
+    """(fastest seconds, result) of running func() rounds times"""
+    best = None
+    for _ in range(max(rounds, 1)):
+        started = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - started
+        if best is None or seconds < best[0]:
+            best = (seconds, result)
+    return best
+
+
+def bench_pipeline(paths: list, embedding_backend: str, rounds: int = 3) -> tuple:
+    """Extraction, chunking, embedding and upsert measured one stage at a time (best of rounds)"""
+    from document_extractors import iter_document_pages
+    from hybrid_retrieval import Bm25Encoder
+    from model_registry import registry
+    from parallel_extraction import _make_splitter
+    from payload_schema import chunk_offsets, chunk_payload, document_key
+    from pdf_processor_simple import PDFProcessorSimple
+    from vector_store import create_vector_store
+
+    stages = {}
+    seconds, documents = best_of(rounds, lambda: [(path, list(iter_document_pages(path))) for path in paths])
+    pages = sum(len(document_pages) for _, document_pages in documents)
+    stages["extraction"] = throughput(pages, seconds, "pages", files=len(paths))
+
+    splitter = _make_splitter(500, 100)
+    seconds, chunked = best_of(rounds, lambda: [
+        (path, page_number, splitter.split_text(text))
+        for path, document_pages in documents for page_number, text in document_pages
+    ])
+    chunks = [chunk for _, _, page_chunks in chunked for chunk in page_chunks]
+    stages["chunking"] = throughput(len(chunks), seconds, "chunks")
+
+    started = time.perf_counter()
+    embedder = registry.get_embedder(MODEL_NAME, embedding_backend)
+    load_seconds = time.perf_counter() - started
+    embedder.encode(chunks[:embedder.batch_size])
+    seconds, vectors = best_of(rounds, lambda: np.asarray(embedder.encode(chunks), dtype=np.float32))
+    stages["embedding"] = throughput(len(chunks), seconds, "chunks", backend=embedding_backend,
+                                     load_seconds=round(load_seconds, 3))
+
+    store = create_vector_store(MEMORY_URL, f"{COLLECTION}_upsert")
+    store.create_collection(vectors.shape[1])
+    bm25 = Bm25Encoder()
+    payloads = []
+    for path, page_number, page_chunks in chunked:
+        for index, (chunk, offsets) in enumerate(zip(page_chunks, chunk_offsets(page_chunks))):
+            payloads.append(chunk_payload(document_key(path), page_number, index, offsets, chunk,
+                                          PDFProcessorSimple.compute_text_hash(chunk)))
+    sparse = [bm25.encode_document(chunk) for chunk in chunks]
+
+    def upsert():
+        # Same ids every round, so later rounds overwrite the first
+        for start in range(0, len(chunks), 64):
+            end = start + 64
+            store.upsert(list(range(start, min(end, len(chunks)))), vectors[start:end], payloads[start:end],
+                         wait=end >= len(chunks), sparse_vectors=sparse[start:end])
+
+    seconds, _ = best_of(rounds, upsert)
+    stages["upsert"] = throughput(len(chunks), seconds, "points")
+    return stages, chunks
+
+
+def bench_ingest(paths: list) -> tuple:
+    """End-to-end process_pdf_file into the collection the agent searches"""
+    from pdf_processor_simple import PDFProcessorSimple
+    processor = PDFProcessorSimple.get_shared()
+    chunk_count, pages, skipped = 0, 0, 0
+    started = time.perf_counter()
+    for index, path in enumerate(paths):
+        content_hash = PDFProcessorSimple.compute_file_hash(path)
+        if processor.find_document_by_hash(content_hash):
+            # Identical content is not indexed twice
+            skipped += 1
+            continue
+        progress = []
+        chunk_count += len(processor.process_pdf_file(path, "benchmark", "benchmark", f"doc-{index}",
+                                                      content_hash=content_hash,
+                                                      progress_callback=lambda *args: progress.append(args)))
+        pages += progress[-1][1] if progress else 0
+    seconds = time.perf_counter() - started
+    return throughput(chunk_count, seconds, "chunks", pages=pages, files=len(paths) - skipped,
+                      duplicates_skipped=skipped), processor
+
+
+def bench_search(processor, queries: list) -> dict:
+    def run(**kwargs) -> list:
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            processor.search_documents(query, **kwargs)
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    # First pass embeds every query; the second one is served from the query cache
+    return {
+        "search_cold": latency(run(), queries=len(queries)),
+        "search_warm": latency(run(), queries=len(queries)),
+        "search_dense": latency(run(hybrid=False), queries=len(queries)),
+    }
+
+
+def bench_agent(script: list, rounds: int, token_delay: float) -> dict:
+    """stream_graph_updates per recorded turn, through the real graph, tools and checkpointer"""
+    from chat_agent import chat_agent
+    from chat_agent.replay_chat_model import ReplayChatModel
+    from model_registry import registry
+
+    model = ReplayChatModel(script=script, token_delay=token_delay)
+    registry.put("chat_llm", (), model)
+    # Untimed turn: compiles the graphs and opens the checkpointer and tokenizer
+    chat_agent.stream_graph_updates(script[-1]["query"], thread_id="benchmark-warmup")
+    model.calls = 0
+
+    turns, first_tokens, tool_calls = [], [], 0
+    for round_index in range(rounds):
+        thread_id = f"benchmark-{round_index}"
+        for turn in script:
+            started = time.perf_counter()
+            first_token = None
+            for event in chat_agent.stream_graph_events(turn["query"], thread_id=thread_id):
+                if event["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif event["type"] == "tool_start":
+                    tool_calls += 1
+            turns.append(time.perf_counter() - started)
+            first_tokens.append(first_token if first_token is not None else turns[-1])
+    results = {
+        "agent_turn": latency(turns, turns_per_round=len(script), rounds=rounds, tool_calls=tool_calls,
+                              llm_calls=model.calls),
+        "agent_first_token": latency(first_tokens),
+    }
+
+    async def run_async() -> list:
+        samples = []
+        for turn in script:
+            started = time.perf_counter()
+            async for _ in chat_agent.astream_graph_events(turn["query"]):
+                pass
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    samples = []
+    for _ in range(rounds):
+        samples.extend(asyncio.run(run_async()))
+    results["agent_turn_async"] = latency(samples)
+    return results
+
+
+def run_suite(paths: list, embedding_backend: str = "torch", rounds: int = 3, queries: int = 30,
+              token_delay: float = 0.0, weather_delay: float = 0.0, script: list = None) -> dict:
+    """Run every stage offline and return the results document"""
+    from chat_agent.fake_weather_server import FakeWeatherServer
+
+    script = script or DEFAULT_SCRIPT
+    with tempfile.TemporaryDirectory() as work_dir, FakeWeatherServer(delay=weather_delay) as weather:
+        configure_environment(work_dir, weather.url, embedding_backend)
+        get_tracer().reset()
+        started = time.perf_counter()
+        stages, chunks = bench_pipeline(paths, embedding_backend, rounds)
+        stages["ingest"], processor = bench_ingest(paths)
+
+        from embedding_benchmark import make_queries
+        stages.update(bench_search(processor, make_queries(chunks, queries)))
+        stages.update(bench_agent(script, rounds, token_delay))
+        stages["agent_turn"]["weather_requests"] = sum(weather.requests.values())
+
+        return {
+            "version": _git_version(),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "settings": {
+                "files": [os.path.basename(path) for path in paths],
+                "embedding_backend": embedding_backend,
+                "rounds": rounds,
+                "queries": queries,
+                "token_delay": token_delay,
+                "weather_delay": weather_delay,
+            },
+            "stages": stages,
+            # Per-stage breakdown from the tracing spans, for finding where time went
+            "spans": get_tracer().get_stats(),
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+
+
+def _git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare(previous: dict, current: dict, tolerance: float = 0.25) -> list:
+    """(stage, metric, before, after, change, regressed) for each stage's key metric"""
+    rows = []
+    for stage, results in current["stages"].items():
+        before = previous.get("stages", {}).get(stage)
+        if not before:
+            continue
+        for metric, higher_is_better in _KEY_METRICS:
+            if metric in results and before.get(metric):
+                change = results[metric] / before[metric] - 1
+                regressed = change < -tolerance if higher_is_better else change > tolerance
+                rows.append((stage, metric, before[metric], results[metric], change, regressed))
+                break
+    return rows
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of ingestion, retrieval and agent turns")
+    parser.add_argument("directory", nargs="?", default="uploads")
+    parser.add_argument("--embedding-backend", default="torch",
+                        help="torch, torch-int8, onnx, onnx-int8 (model must be cached) or hash (no model)")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Repetitions of each pipeline stage (best is kept) and passes over the agent turns")
+    parser.add_argument("--queries", type=int, default=30, help="Search queries per search stage")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between replayed tokens")
+    parser.add_argument("--weather-delay", type=float, default=0.0, help="Stub weather server latency (s)")
+    parser.add_argument("--script", default=None, help="JSON file of recorded turns (default: built-in)")
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    parser.add_argument("--compare", default=None, help="Earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing")
+    args = parser.parse_args(argv)
+
+    paths = find_files(args.directory)
+    if not paths:
+        print(f"❌ No documents found under {args.directory}")
+        return 1
+    script = None
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+
+    results = run_suite(paths, args.embedding_backend, rounds=args.rounds, queries=args.queries,
+                        token_delay=args.token_delay, weather_delay=args.weather_delay, script=script)
+    print("=" * 40)
+    for stage, row in results["stages"].items():
+        if "per_second" in row:
+            print(f"{stage:<18} {row['per_second']:>10} /s  ({row['seconds']}s)")
+        else:
+            print(f"{stage:<18} p50 {row['p50_ms']:>8} ms  p95 {row['p95_ms']:>8} ms  ({row['count']} samples)")
+    print(f"Total {results['seconds']}s at {results['version'] or 'unknown version'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+        print(f"Compared with {previous.get('version') or args.compare}:")
+        regressions = 0
+        for stage, metric, before, after, change, regressed in compare(previous, results, args.tolerance):
+            regressions += regressed
+            print(f"{'❌' if regressed else '✅'} {stage:<18} {metric:<10} {before} -> {after} ({change:+.0%})")
+        if regressions:
+            print(f"❌ {regressions} stage(s) slower than the {args.tolerance:.0%} tolerance")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import contextvars
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List
+
+from document_extractors import iter_document_pages, iter_pdf_pages
+from model_registry import registry
+
+_SENTINEL = object()
+
+
+def _make_splitter(chunk_size: int, chunk_overlap: int):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+
+def _extract_page_range(file_path: str, start: int, end: int,
+                        chunk_size: int, chunk_overlap: int) -> List[tuple]:
+    """Worker: extract and split PDF pages [start, end) -> [(page_number, chunks), ...]"""
+    splitter = _make_splitter(chunk_size, chunk_overlap)
+    return [(page_number, splitter.split_text(text))
+            for page_number, text in iter_pdf_pages(file_path, start, end)]
+
+
+def _extract_document(file_path: str, chunk_size: int, chunk_overlap: int) -> List[tuple]:
+    """Worker: extract and split a whole document of any supported type"""
+    splitter = _make_splitter(chunk_size, chunk_overlap)
+    return [(page_number, splitter.split_text(text))
+            for page_number, text in iter_document_pages(file_path)]
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared worker pool. Uses spawn so workers never inherit torch or client threads."""
+    return registry.get_or_create(
+        "process_pool", (workers,),
+        lambda: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    )
+
+
+def default_workers() -> int:
+    return int(os.getenv("INGEST_PROCESSES", "0")) or (os.cpu_count() or 1)
+
+
+def iter_pages_parallel(file_path: str, total_pages: int, workers: int, chunk_size: int,
+                        chunk_overlap: int, pages_per_task: int = 8) -> Iterator[tuple]:
+    """Yield (page_number, chunks) in page order, extracting ranges of pages in worker processes.
+
+    At most 2 * workers ranges are in flight, so results never pile up
+    faster than the consumer reads them.
+    """
+    pool = get_process_pool(workers)
+    ranges = deque(range(0, total_pages, pages_per_task))
+    in_flight = deque()
+
+    while ranges or in_flight:
+        while ranges and len(in_flight) < 2 * workers:
+            start = ranges.popleft()
+            in_flight.append(pool.submit(
+                _extract_page_range, file_path, start, start + pages_per_task, chunk_size, chunk_overlap
+            ))
+        # Futures are consumed in submission order, which keeps page order
+        for page in in_flight.popleft().result():
+            yield page
+
+
+def iter_documents_parallel(file_paths: Iterable[str], workers: int, chunk_size: int,
+                            chunk_overlap: int) -> Iterator[tuple]:
+    """Yield (file_path, pages, error) per document, one document per worker, in input order"""
+    pool = get_process_pool(workers)
+    paths = deque(file_paths)
+    in_flight = deque()
+
+    while paths or in_flight:
+        while paths and len(in_flight) < 2 * workers:
+            path = paths.popleft()
+            in_flight.append((path, pool.submit(_extract_document, path, chunk_size, chunk_overlap)))
+        path, future = in_flight.popleft()
+        try:
+            yield path, future.result(), None
+        except Exception as e:
+            yield path, [], e
+
+
+def prefetch(iterator: Iterator, maxsize: int) -> Iterator:
+    """Run iterator in a background thread feeding a bounded queue.
+
+    Lets extraction keep running while the consumer embeds, without letting
+    it get more than maxsize items ahead. Exceptions are re-raised in the
+    consumer.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                buffer.put(item)
+        except Exception as e:
+            buffer.put(e)
+        finally:
+            buffer.put(_SENTINEL)
+
+    # Run in a copy of the caller's context so tracing spans opened by the
+    # consumer still parent the work done here
+    context = contextvars.copy_context()
+    producer = threading.Thread(target=context.run, args=(produce,), daemon=True, name="extract-prefetch")
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _SENTINEL:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while producer.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                producer.join(timeout=0.1)
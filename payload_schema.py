@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import List
+
+from model_registry import registry
+from vector_store import VectorStore, create_vector_store
+
+# Version 1: every chunk point repeats its document's name, category, user,
+#   content hash and embedding model next to page_content.
+# Version 2: chunk points carry a document key, page, chunk index, character
+#   offsets and text. Document attributes are stored once per document in the
+#   "<collection>_catalog" collection and joined into search results.
+SCHEMA_VERSION = 2
+CATALOG_SUFFIX = "_catalog"
+
+# Indexed payload fields per schema version, with the tenant-style field
+# Qdrant co-locates on disk
+CHUNK_INDEXES = {
+    1: ("user_id", "document_id", "document_category", "content_hash", "chunk_hash"),
+    2: ("doc", "chunk_hash"),
+}
+TENANT_FIELDS = ("user_id", "doc")
+CATALOG_INDEXES = ("doc", "document_id", "user_id", "document_category", "content_hash")
+
+# Splitter overlap is at most chunk_overlap (100) plus a partial word
+MAX_OVERLAP_CHARS = 160
+MIN_OVERLAP_CHARS = 8
+
+
+def document_key(document_id: str) -> str:
+    """Short stable key for a document: the first 64 bits of SHA-1, in hex"""
+    return hashlib.sha1(str(document_id).encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_text(payload: dict) -> str:
+    """Chunk text from a payload of either schema version"""
+    return payload.get("text", payload.get("page_content", ""))
+
+
+def overlap_length(previous: str, following: str, max_chars: int = MAX_OVERLAP_CHARS,
+                   min_chars: int = MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of previous that following starts with (0 if shorter than min_chars)"""
+    for size in range(min(len(previous), len(following), max_chars), min_chars - 1, -1):
+        if previous.endswith(following[:size]):
+            return size
+    return 0
+
+
+def overlap_probe(text: str) -> str:
+    """The parts of a chunk overlap_length looks at: its first and last MAX_OVERLAP_CHARS characters"""
+    if len(text) <= 2 * MAX_OVERLAP_CHARS:
+        return text
+    return text[:MAX_OVERLAP_CHARS] + text[-MAX_OVERLAP_CHARS:]
+
+
+def chunk_offsets(chunks: List[str], lengths: List[int] = None) -> List[tuple]:
+    """(start, end) character offsets of consecutive chunks of one page.
+
+    Offsets index the page text as rebuilt from the chunks: each chunk starts
+    where its overlap with the previous one begins, or one separator after it.
+    chunks may be overlap_probe() strings when lengths gives the full sizes.
+    """
+    offsets = []
+    previous, end = None, 0
+    for i, chunk in enumerate(chunks):
+        if previous is None:
+            start = 0
+        else:
+            overlap = overlap_length(previous, chunk)
+            start = end - overlap if overlap else end + 1
+        end = start + (lengths[i] if lengths else len(chunk))
+        offsets.append((start, end))
+        previous = chunk
+    return offsets
+
+
+def chunk_payload(doc_key: str, page_number: int, chunk_index: int, offsets: tuple,
+                  text: str, chunk_hash: str) -> dict:
+    return {
+        "doc": doc_key,
+        "page": page_number,
+        "chunk": chunk_index,
+        "start": offsets[0],
+        "end": offsets[1],
+        "text": text,
+        "chunk_hash": chunk_hash,
+    }
+
+
+def catalog_entry(document_id: str, document_name: str, document_category: str, user_id: str,
+                  content_hash: str, embedding_model: str, chunks: int, pages: int) -> dict:
+    return {
+        "doc": document_key(document_id),
+        "schema": SCHEMA_VERSION,
+        "document_id": document_id,
+        "document_name": document_name,
+        "document_category": document_category,
+        "user_id": user_id,
+        "content_hash": content_hash,
+        "embedding_model": embedding_model,
+        "chunks": chunks,
+        "pages": pages,
+    }
+
+
+def result_metadata(payload: dict, document: dict = None) -> dict:
+    """Search-result metadata in the version 1 shape, joined with the document's catalog entry"""
+    if "text" not in payload:
+        return {key: value for key, value in payload.items() if key != "page_content"}
+    metadata = {key: value for key, value in (document or {}).items() if key not in ("doc", "schema", "chunks", "pages")}
+    metadata.update({
+        "page_number": payload.get("page"),
+        "chunk_index": payload.get("chunk"),
+        "start": payload.get("start"),
+        "end": payload.get("end"),
+        "chunk_hash": payload.get("chunk_hash"),
+    })
+    if document is None:
+        metadata["doc"] = payload.get("doc")
+    return metadata
+
+
+def payload_bytes(payload: dict) -> int:
+    """Size of a payload as JSON, the way it is sent to Qdrant"""
+    return len(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+class DocumentCatalog:
+    """Document-level attributes for a version 2 collection, one record per document.
+
+    Records live in their own payload-only collection next to the chunks, so
+    every process using the store sees them. Reads are served from an
+    in-memory copy that is reloaded after ttl_seconds; records written by this
+    process are visible immediately, those written by other processes (e.g.
+    the bulk CLI) once the copy is reloaded.
+    """
+
+    def __init__(self, store: VectorStore, ttl_seconds: float = 30):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._entries = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _point_id(doc_key: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, f"document:{doc_key}"))
+
+    def exists(self) -> bool:
+        return self.store.collection_exists()
+
+    def create(self):
+        if not self.store.collection_exists():
+            # Payload-only records; Qdrant still needs a vector per point
+            self.store.create_collection(1)
+        for field in CATALOG_INDEXES:
+            self.store.create_payload_index(field)
+
+    def _load(self, force: bool = False) -> dict:
+        with self._lock:
+            if force or self._entries is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+                entries = {}
+                offset = None
+                while True:
+                    records, offset = self.store.scroll(limit=1024, offset=offset, with_payload=True)
+                    for record in records:
+                        entries[record.payload["doc"]] = record.payload
+                    if offset is None:
+                        break
+                self._entries = entries
+                self._loaded_at = time.monotonic()
+            return self._entries
+
+    def put(self, entry: dict):
+        self.store.upsert([self._point_id(entry["doc"])], [[1.0]], [entry], wait=True)
+        with self._lock:
+            if self._entries is not None:
+                self._entries[entry["doc"]] = entry
+
+    def put_many(self, entries: List[dict]):
+        for start in range(0, len(entries), 256):
+            batch = entries[start:start + 256]
+            self.store.upsert([self._point_id(entry["doc"]) for entry in batch], [[1.0]] * len(batch), batch,
+                              wait=True)
+        with self._lock:
+            self._entries = None
+
+    def get(self, doc_key: str) -> dict:
+        entries = self._load()
+        if doc_key not in entries and time.monotonic() - self._loaded_at > 1.0:
+            # Possibly added by another process since the last load
+            entries = self._load(force=True)
+        return entries.get(doc_key)
+
+    def find(self, **criteria) -> List[dict]:
+        """Entries whose fields equal the given values (a list value matches any of its items)"""
+        criteria = {key: value for key, value in criteria.items() if value}
+        matches = []
+        for entry in self._load().values():
+            for key, value in criteria.items():
+                if isinstance(value, (list, tuple, set)):
+                    if entry.get(key) not in value:
+                        break
+                elif entry.get(key) != value:
+                    break
+            else:
+                matches.append(entry)
+        return matches
+
+    def find_stored(self, **criteria) -> List[dict]:
+        """Like find(), but read from the store instead of the cached copy"""
+        records, _ = self.store.scroll(filter=criteria, limit=1024, with_payload=True)
+        return [record.payload for record in records]
+
+    def delete(self, doc_key: str):
+        self.store.delete({"doc": doc_key})
+        with self._lock:
+            if self._entries is not None:
+                self._entries.pop(doc_key, None)
+
+
+def catalog_store(qdrant_url: str, collection_name: str, api_key: str = None) -> VectorStore:
+    # Always the default profile: the catalog is small and payload-only
+    return create_vector_store(qdrant_url, collection_name + CATALOG_SUFFIX, api_key, "default")
+
+
+def get_document_catalog(qdrant_url: str, collection_name: str, api_key: str = None) -> DocumentCatalog:
+    return registry.get_or_create(
+        "document_catalog", (qdrant_url, collection_name, api_key),
+        lambda: DocumentCatalog(catalog_store(qdrant_url, collection_name, api_key),
+                                ttl_seconds=float(os.getenv("DOCUMENT_CATALOG_TTL", "30")))
+    )
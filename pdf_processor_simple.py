@@ -1,210 +1,679 @@
 import os
 import uuid
-from typing import List
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import pdfplumber
-from sentence_transformers import SentenceTransformer
+import asyncio
+import hashlib
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+import numpy as np
+from typing import Callable, Iterable, Iterator, List
 from dotenv import load_dotenv
+from model_registry import registry
+from document_extractors import count_pdf_pages, is_pdf, iter_document_pages
+from hybrid_retrieval import Bm25Encoder, RetrievalSettings, get_retrieval_pool, reciprocal_rank_fusion, rerank
+from parallel_extraction import _make_splitter, iter_pages_parallel, prefetch
+from payload_schema import (
+    CHUNK_INDEXES, SCHEMA_VERSION, TENANT_FIELDS, catalog_entry, chunk_offsets, chunk_payload, chunk_text,
+    document_key, get_document_catalog, payload_bytes, result_metadata
+)
+from tracing import current_span, get_tracer, span, traced
 
 load_dotenv()
 
+DEFAULT_QDRANT_URL = "https://815b76de-079e-4147-b21a-147bb5198e47.europe-west3-0.gcp.cloud.qdrant.io:6333"
+
 class PDFProcessorSimple:
-    def __init__(self, qdrant_url: str = None, collection_name: str = None):
+    # Called with (qdrant_url, collection_name) after ingestion or deletion
+    # changes a collection, e.g. to invalidate cached answers
+    _change_listeners = []
+    
+    def __init__(self, qdrant_url: str = None, collection_name: str = None, embedding_backend: str = None):
         # Get Qdrant URL from environment or use default
-        self.qdrant_url = qdrant_url or os.getenv("QDRANT_URL", "https://815b76de-079e-4147-b21a-147bb5198e47.europe-west3-0.gcp.cloud.qdrant.io:6333")
+        self.qdrant_url = qdrant_url or os.getenv("QDRANT_URL", DEFAULT_QDRANT_URL)
         self.collection_name = collection_name or os.getenv("VECTOR_NAME", "documents")
         self.model_name = "BAAI/bge-small-en-v1.5"
+        self.batch_size = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        self.parallel_workers = int(os.getenv("INGEST_PROCESSES", "0"))
+        # An unfinished ingest that has not progressed for this long is treated as crashed
+        self.ingest_stale_seconds = float(os.getenv("INGEST_STALE_SECONDS", "600"))
+        self.encoded_count = 0
+        self.reused_count = 0
         
-        print(f"Loading model: {self.model_name}")
-        self.sentence_transformer = SentenceTransformer(self.model_name)
-        print("✅ Model loaded")
+        # Model and vector store are shared process-wide, so only the first
+        # processor pays for loading them
+        # embedding_backend: torch, torch-int8, onnx or onnx-int8 (default: EMBEDDING_BACKEND)
+        self.sentence_transformer = registry.get_embedder(self.model_name, embedding_backend)
+        self.embedding_backend = self.sentence_transformer.backend
+        self.embedding_key = self.sentence_transformer.cache_key
+        self.query_cache = registry.get_query_cache()
         
-        print(f"Connecting to Qdrant at: {self.qdrant_url}")
+        # Get API key for hosted Qdrant. A local:<directory> URL selects the
+        # embedded index instead (no network needed)
+        self.qdrant_api_key = os.getenv("QDRANT_API_KEY")
+        self.vector_store = registry.get_vector_store(self.qdrant_url, self.collection_name, self.qdrant_api_key)
+        self.qdrant_client = getattr(self.vector_store, "client", None)
+        # Document attributes of compact (schema 2) collections, see payload_schema
+        self.catalog = get_document_catalog(self.qdrant_url, self.collection_name, self.qdrant_api_key)
         
-        # Get API key for hosted Qdrant
-        qdrant_api_key = os.getenv("QDRANT_API_KEY")
-        
-        if qdrant_api_key:
-            # Connect to hosted Qdrant with API key
-            self.qdrant_client = QdrantClient(
-                url=self.qdrant_url,
-                api_key=qdrant_api_key
-            )
-        else:
-            # Connect without API key (for self-hosted or public instances)
-            self.qdrant_client = QdrantClient(url=self.qdrant_url)
+        # Hybrid dense + BM25 retrieval and optional reranking (RETRIEVAL_* env)
+        self.retrieval = RetrievalSettings.from_env()
+        self.bm25 = Bm25Encoder()
+        self.last_search_timings = {}
         
-        print("✅ Qdrant connected")
+        self.chunk_size = 500
+        self.chunk_overlap = 100
+        self.text_splitter = _make_splitter(self.chunk_size, self.chunk_overlap)
         
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=100,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+        registry.ensure_collection(self.qdrant_url, self.collection_name, self._create_collection_if_not_exists)
+    
+    @classmethod
+    def get_shared(cls, qdrant_url: str = None, collection_name: str = None,
+                   embedding_backend: str = None) -> "PDFProcessorSimple":
+        """Return the process-wide processor for this Qdrant URL, collection and embedding backend"""
+        qdrant_url = qdrant_url or os.getenv("QDRANT_URL", DEFAULT_QDRANT_URL)
+        collection_name = collection_name or os.getenv("VECTOR_NAME", "documents")
+        embedding_backend = embedding_backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        return registry.get_or_create(
+            "processor", (qdrant_url, collection_name, embedding_backend),
+            lambda: cls(qdrant_url=qdrant_url, collection_name=collection_name,
+                        embedding_backend=embedding_backend)
         )
-        
-        self._create_collection_if_not_exists()
     
-    def _create_collection_if_not_exists(self):
+    @classmethod
+    def add_change_listener(cls, callback: Callable):
+        if callback not in cls._change_listeners:
+            cls._change_listeners.append(callback)
+    
+    def _notify_collection_changed(self):
+        for callback in list(self._change_listeners):
+            try:
+                callback(self.qdrant_url, self.collection_name)
+            except Exception as e:
+                print(f"❌ Error in collection change listener: {str(e)}")
+    
+    def _create_collection_if_not_exists(self) -> bool:
         try:
-            collections = self.qdrant_client.get_collections()
-            collection_names = [col.name for col in collections.collections]
-            
-            if self.collection_name not in collection_names:
+            if not self.vector_store.collection_exists():
                 sample_embedding = self.sentence_transformer.encode("test")
                 vector_size = len(sample_embedding)
                 
-                self.qdrant_client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=models.VectorParams(
-                        size=vector_size,
-                        distance=models.Distance.COSINE
-                    )
-                )
+                self.vector_store.create_collection(vector_size)
+                # New collections use the compact payload schema
+                self.catalog.create()
                 print(f"✅ Created collection: {self.collection_name} with {vector_size}D vectors")
             else:
                 print(f"✅ Collection {self.collection_name} already exists")
+            
+            # Also indexes collections created before the indexes existed
+            for field in CHUNK_INDEXES[self.payload_schema]:
+                self.vector_store.create_payload_index(field, is_tenant=field in TENANT_FIELDS)
+            if self.payload_schema >= 2:
+                self.catalog.create()
+            else:
+                print(f"ℹ️ {self.collection_name} uses payload schema 1; "
+                      f"python -m pdf_processor_simple migrate-payloads converts it to the compact schema")
+            return True
         except Exception as e:
             print(f"❌ Error creating collection: {str(e)}")
+            return False
 
-    def process_pdf_file(self, pdf_path: str, user_id: str, document_category: str, document_id: str) -> List[str]:
-        """Process PDF file from path"""
+    @property
+    def payload_schema(self) -> int:
+        """1 for collections with per-chunk document metadata, 2 for compact ones with a catalog"""
+        return registry.get_or_create(
+            "payload_schema", (self.qdrant_url, self.collection_name),
+            lambda: SCHEMA_VERSION if self.catalog.exists() else 1
+        )
+    
+    @staticmethod
+    def compute_file_hash(file_path: str) -> str:
+        """SHA-256 of the file bytes, read in blocks"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def compute_text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def _scan_points(self, point_filter: dict) -> dict:
+        """document_id -> {"point_ids", "chunks", "updated_at"} of the points matching point_filter.
+        
+        chunks is the document's chunk count from its completion marker (the
+        last chunk of a schema 1 document carries document_chunks), or None.
+        updated_at is the newest indexed_at of its schema 1 points (0 if unset).
+        """
+        documents = {}
+        offset = None
+        while True:
+            records, offset = self.vector_store.scroll(
+                filter=point_filter,
+                limit=256,
+                offset=offset,
+                with_payload=["document_id", "document_chunks", "indexed_at"],
+                with_vectors=False
+            )
+            for record in records:
+                document = documents.setdefault(record.payload.get("document_id"),
+                                                {"point_ids": [], "chunks": None, "updated_at": 0})
+                document["point_ids"].append(str(record.id))
+                document["chunks"] = record.payload.get("document_chunks") or document["chunks"]
+                document["updated_at"] = max(document["updated_at"], record.payload.get("indexed_at") or 0)
+            if offset is None:
+                break
+        return documents
+    
+    def find_document_by_hash(self, content_hash: str, user_id: str = None) -> dict:
+        """Return {"document_id", "point_ids"} if a file with this hash is completely indexed.
+        
+        With user_id only that user's copy counts: another user's document
+        could never be retrieved by this one. A document only counts once its
+        completion marker (the catalog entry, or on schema 1 collections the
+        chunk count on its last point) is stored and all its points are found,
+        so a crash mid-ingest does not leave a half-indexed "done" document.
+        Schema 2 documents being ingested have a catalog entry with 0 chunks.
+        """
+        try:
+            point_filter = {"content_hash": content_hash}
+            if user_id:
+                point_filter["user_id"] = user_id
+            if self.payload_schema >= 2:
+                # Read the store rather than the cached catalog so concurrent
+                # ingesters see each other's documents
+                for document in self.catalog.find_stored(**point_filter):
+                    scanned = self._scan_points({"doc": document["doc"]}).values()
+                    point_ids = [point_id for points in scanned for point_id in points["point_ids"]]
+                    if document.get("chunks") and len(point_ids) >= document["chunks"]:
+                        return {"document_id": document["document_id"], "point_ids": point_ids}
+                return None
+            
+            for document_id, document in self._scan_points(point_filter).items():
+                if document["chunks"] and len(document["point_ids"]) >= document["chunks"]:
+                    return {"document_id": document_id, "point_ids": document["point_ids"]}
+            return None
+        except Exception as e:
+            print(f"❌ Error looking up document hash: {str(e)}")
+            return None
+    
+    def _discard_partial(self, content_hash: str, user_id: str, document_id: str):
+        """Delete points left by interrupted ingests of this file, before it is indexed again.
+        
+        Besides document_id's own points, only unfinished documents whose
+        progress marker is older than ingest_stale_seconds are removed: a
+        fresh one is another session's ingest of the same file still running.
+        """
+        stale_before = time.time() - self.ingest_stale_seconds
+        try:
+            if self.payload_schema >= 2:
+                for document in self.catalog.find_stored(content_hash=content_hash, user_id=user_id):
+                    if document["document_id"] == document_id or (
+                            not document.get("chunks") and document.get("updated_at", 0) < stale_before):
+                        self.vector_store.delete({"doc": document["doc"]})
+                        self.catalog.delete(document["doc"])
+                self.vector_store.delete({"doc": document_key(document_id)})
+                return
+            partial = {document_id}
+            for partial_id, document in self._scan_points({"content_hash": content_hash, "user_id": user_id}).items():
+                if not document["chunks"] and document["updated_at"] < stale_before:
+                    partial.add(partial_id)
+            for partial_id in partial - {None}:
+                self.vector_store.delete({"document_id": partial_id})
+        except Exception as e:
+            print(f"❌ Error removing partially indexed points: {str(e)}")
+    
+    def _find_chunk_vectors(self, chunk_hashes: List[str]) -> dict:
+        """Map chunk_hash -> stored vector for chunks already indexed with this model and backend.
+        
+        Vectors from other backends (e.g. onnx-int8 vs torch) are not
+        interchangeable, so only points whose embedding_model (per point, or
+        per document in the catalog) equals embedding_key are reused.
+        """
+        vectors = {}
+        unique_hashes = list(dict.fromkeys(chunk_hashes))
+        compact = self.payload_schema >= 2
+        # Schema 2 points carry no model; their document's catalog entry is checked instead
+        scope = {} if compact else {"embedding_model": self.embedding_key}
+        try:
+            for start in range(0, len(unique_hashes), 256):
+                pending = set(unique_hashes[start:start + 256])
+                offset = None
+                # Stop paging as soon as every hash in the batch has a vector
+                while pending:
+                    records, offset = self.vector_store.scroll(
+                        filter={"chunk_hash": list(pending), **scope},
+                        limit=256,
+                        offset=offset,
+                        with_payload=["chunk_hash", "doc"] if compact else ["chunk_hash"],
+                        with_vectors=True
+                    )
+                    for record in records:
+                        chunk_hash = record.payload["chunk_hash"]
+                        if compact and (self.catalog.get(record.payload.get("doc")) or {}).get(
+                                "embedding_model") != self.embedding_key:
+                            continue
+                        if chunk_hash in pending:
+                            vectors[chunk_hash] = record.vector
+                            pending.discard(chunk_hash)
+                    if offset is None:
+                        break
+        except Exception as e:
+            print(f"❌ Error looking up chunk vectors: {str(e)}")
+        return vectors
+    
+    def _embed_chunks(self, chunks: List[str], chunk_hashes: List[str]) -> np.ndarray:
+        """Embed chunks as a float32 matrix, reusing vectors of identical chunks that are already indexed"""
+        vectors = self._find_chunk_vectors(chunk_hashes)
+        reused = len(vectors)
+        
+        # Encode each unseen chunk text once, even if it repeats within the document
+        missing = {}
+        for chunk, chunk_hash in zip(chunks, chunk_hashes):
+            if chunk_hash not in vectors and chunk_hash not in missing:
+                missing[chunk_hash] = chunk
+        
+        if missing:
+            with span("ingest.embed", chunks=len(chunks), encoded=len(missing), reused=reused):
+                encoded = self.sentence_transformer.encode(list(missing.values()))
+            for chunk_hash, embedding in zip(missing.keys(), encoded):
+                vectors[chunk_hash] = embedding
+        
+        self.encoded_count += len(missing)
+        self.reused_count += reused
+        print(f"✅ Embedded batch of {len(chunks)} ({len(missing)} encoded, {reused} reused)")
+        return np.asarray([vectors[chunk_hash] for chunk_hash in chunk_hashes], dtype=np.float32)
+
+    @traced("ingest.document")
+    def process_pdf_file(self, pdf_path: str, user_id: str, document_category: str, document_id: str,
+                         content_hash: str = None, batch_size: int = None,
+                         progress_callback: Callable = None, parallel_workers: int = None,
+                         pages: Iterable = None) -> List[str]:
+        """Process a PDF (or any format document_extractors supports) from path.
+        
+        Pages are read lazily and chunks are embedded and upserted in batches
+        of batch_size, so peak memory does not grow with document size.
+        progress_callback(pages_done, total_pages, chunks_done) is called after
+        every batch. Files whose content hash is already indexed are skipped
+        and their existing point ids returned; points of an earlier, unfinished
+        ingest of the file are deleted first.
+        
+        With parallel_workers > 1 pages are extracted and split in worker
+        processes while this thread embeds. pages can pass already extracted
+        (page_number, chunks) pairs, e.g. from iter_documents_parallel.
+        """
         try:
             print(f"Processing PDF: {pdf_path}")
+            current_span().set(file_bytes=os.path.getsize(pdf_path))
+            batch_size = batch_size or self.batch_size
+            if parallel_workers is None:
+                parallel_workers = self.parallel_workers
+            
+            content_hash = content_hash or self.compute_file_hash(pdf_path)
+            existing = self.find_document_by_hash(content_hash, user_id)
+            if existing:
+                print(f"✅ Already indexed as document {existing['document_id']}, skipping")
+                return existing["point_ids"]
+            self._discard_partial(content_hash, user_id, document_id)
+            
+            total_pages = self._count_pages(pdf_path)
+            provisional = None
+            if self.payload_schema >= 2:
+                # Provisional entry (0 chunks) so a retry can find and clear an
+                # interrupted ingest; updated_at is refreshed as batches land
+                provisional = catalog_entry(
+                    document_id, os.path.basename(pdf_path), document_category, user_id, content_hash,
+                    self.embedding_key, chunks=0, pages=total_pages
+                )
+                provisional["updated_at"] = time.time()
+                self.catalog.put(provisional)
+            chunk_ids = []
+            batch = []
+            pages_done = 0
             
-            # Extract content
-            chunks, metadata_list = self._extract_pdf_content(
-                pdf_path, os.path.basename(pdf_path), document_id, document_category, user_id
+            chunk_stream = self._iter_pdf_chunks(
+                pdf_path, os.path.basename(pdf_path), document_id, document_category, user_id,
+                parallel_workers=parallel_workers, pages=pages
             )
+            if parallel_workers > 1:
+                # Extraction feeds embedding through a bounded queue
+                chunk_stream = prefetch(chunk_stream, maxsize=batch_size * 4)
             
-            if not chunks:
-                print("❌ No chunks extracted")
-                return []
+            for chunk, metadata in chunk_stream:
+                batch.append((chunk, metadata))
+                pages_done = metadata["page_number"]
+                if len(batch) > batch_size:
+                    # Later batches are ordered after this one, so only the
+                    # final upsert needs to wait for Qdrant to apply it. One
+                    # chunk is held back so that final batch is never empty
+                    chunk_ids.extend(self._upsert_batch(
+                        batch[:batch_size], document_id, content_hash, len(chunk_ids), wait=False
+                    ))
+                    batch = batch[batch_size:]
+                    if provisional and time.time() - provisional["updated_at"] > self.ingest_stale_seconds / 4:
+                        provisional["updated_at"] = time.time()
+                        self.catalog.put(provisional)
+                    if progress_callback:
+                        progress_callback(pages_done, total_pages, len(chunk_ids))
             
-            print(f"✅ Extracted {len(chunks)} chunks")
+            if batch:
+                if self.payload_schema < 2:
+                    # Completion marker: written with the last upsert, which waits
+                    batch[-1][1]["document_chunks"] = len(chunk_ids) + len(batch)
+                chunk_ids.extend(self._upsert_batch(batch, document_id, content_hash, len(chunk_ids), wait=True))
             
-            # Generate embeddings
-            print("Generating embeddings...")
-            embeddings = self.sentence_transformer.encode(chunks)
-            print("✅ Embeddings generated")
+            if progress_callback:
+                total_pages = total_pages or pages_done
+                progress_callback(total_pages, total_pages, len(chunk_ids))
             
-            # Prepare points for Qdrant
-            chunk_ids = [str(uuid.uuid4()) for _ in range(len(chunks))]
-            points = []
+            if not chunk_ids:
+                print("❌ No chunks extracted")
+                if self.payload_schema >= 2:
+                    self.catalog.delete(document_key(document_id))
+                return []
             
-            for i, (chunk, metadata, embedding) in enumerate(zip(chunks, metadata_list, embeddings)):
-                metadata["page_content"] = chunk
-                points.append(models.PointStruct(
-                    id=chunk_ids[i],
-                    vector=embedding.tolist(),
-                    payload=metadata
+            if self.payload_schema >= 2:
+                # Completion marker: a document is only found by hash once all its chunks are stored
+                self.catalog.put(catalog_entry(
+                    document_id, os.path.basename(pdf_path), document_category, user_id, content_hash,
+                    self.embedding_key, chunks=len(chunk_ids), pages=total_pages or pages_done
                 ))
             
-            # Upload to Qdrant
-            print("Uploading to Qdrant...")
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
-            print("✅ Uploaded to Qdrant")
-            
+            current_span().set(pages=total_pages or pages_done, chunks=len(chunk_ids))
+            print(f"✅ Uploaded {len(chunk_ids)} chunks to {self.collection_name}")
+            self._notify_collection_changed()
             return chunk_ids
             
         except Exception as e:
             print(f"❌ Error processing PDF: {str(e)}")
             raise
     
-    def _extract_pdf_content(self, file_path: str, document_name: str, 
-                           document_id: str, document_category: str, user_id: str) -> tuple:
-        chunks = []
-        metadata_list = []
+    def _upsert_batch(self, batch: list, document_id: str, content_hash: str, start_index: int,
+                      wait: bool) -> List[str]:
+        """Embed one batch of (chunk, metadata) pairs and upsert it to the vector store"""
+        chunks = [chunk for chunk, _ in batch]
+        chunk_hashes = [self.compute_text_hash(chunk) for chunk in chunks]
+        embeddings = self._embed_chunks(chunks, chunk_hashes)
+        
+        # Ids are derived from the document and its content so a re-run
+        # overwrites the same points instead of duplicating them, while other
+        # users' copies of the same file keep their own points
+        chunk_ids = [
+            str(uuid.uuid5(uuid.NAMESPACE_OID, f"{document_id}:{content_hash}:{start_index + i}:{chunk_hash}"))
+            for i, chunk_hash in enumerate(chunk_hashes)
+        ]
+        payloads = []
+        
+        for i, (chunk, metadata) in enumerate(batch):
+            if self.payload_schema >= 2:
+                payloads.append(chunk_payload(
+                    document_key(metadata["document_id"]), metadata["page_number"], metadata["chunk_index"],
+                    (metadata["start"], metadata["end"]), chunk, chunk_hashes[i]
+                ))
+                continue
+            metadata["page_content"] = chunk
+            metadata["content_hash"] = content_hash
+            metadata["chunk_hash"] = chunk_hashes[i]
+            # Progress marker for _discard_partial
+            metadata["indexed_at"] = time.time()
+            payloads.append(metadata)
+        
+        sparse_vectors = None
+        if self.vector_store.supports_sparse():
+            sparse_vectors = [self.bm25.encode_document(chunk) for chunk in chunks]
+        
+        with span("qdrant.upsert", points=len(chunk_ids),
+                  payload_bytes=sum(payload_bytes(payload) for payload in payloads)):
+            self.vector_store.upsert(chunk_ids, embeddings, payloads, wait=wait, sparse_vectors=sparse_vectors)
+        return chunk_ids
+    
+    @staticmethod
+    def _count_pages(file_path: str) -> int:
+        """Page count of a PDF; 0 for other formats, whose pages are only known once read"""
+        try:
+            return count_pdf_pages(file_path) if is_pdf(file_path) else 0
+        except Exception:
+            return 0
+    
+    def _iter_pdf_pages(self, file_path: str) -> Iterator[tuple]:
+        """Yield (page_number, text) one page at a time, for any supported document type"""
+        return iter_document_pages(file_path)
+    
+    def _iter_split_pages(self, file_path: str, parallel_workers: int = 0) -> Iterator[tuple]:
+        """Yield (page_number, chunks) in page order, serially or across worker processes"""
+        total_pages = self._count_pages(file_path) if parallel_workers > 1 and is_pdf(file_path) else 0
+        if total_pages:
+            return iter_pages_parallel(
+                file_path, total_pages, parallel_workers, self.chunk_size, self.chunk_overlap
+            )
+        # Serial extraction also covers PDFs whose page count could not be read
+        return (
+            (page_number, self.text_splitter.split_text(text))
+            for page_number, text in self._iter_pdf_pages(file_path)
+        )
+    
+    def _iter_pdf_chunks(self, file_path: str, document_name: str,
+                         document_id: str, document_category: str, user_id: str,
+                         parallel_workers: int = 0, pages: Iterable = None) -> Iterator[tuple]:
+        """Yield (chunk, metadata) pairs, splitting each page as it is read.
         
+        Time spent reading and splitting pages is recorded as one
+        ingest.extract stage once the document is exhausted.
+        """
+        extract_seconds = 0.0
+        page_count = 0
+        characters = 0
         try:
-            loader = PyPDFLoader(file_path)
-            pages = loader.load()
-            print(f"✅ Loaded {len(pages)} pages")
+            if pages is None:
+                pages = self._iter_split_pages(file_path, parallel_workers)
+            pages = iter(pages)
             
-            for i, page in enumerate(pages):
-                page_chunks = self.text_splitter.split_text(page.page_content)
-                chunks.extend(page_chunks)
-                
+            while True:
+                started = time.perf_counter()
+                item = next(pages, None)
+                extract_seconds += time.perf_counter() - started
+                if item is None:
+                    break
+                page_number, page_chunks = item
+                page_count += 1
+                characters += sum(len(chunk) for chunk in page_chunks)
+                offsets = chunk_offsets(page_chunks)
                 for j, chunk in enumerate(page_chunks):
-                    metadata_list.append({
+                    yield chunk, {
                         "document_name": document_name,
                         "document_id": document_id,
                         "document_category": document_category,
                         "user_id": user_id,
-                        "page_number": i + 1,
+                        "page_number": page_number,
                         "chunk_index": j,
                         "total_chunks": len(page_chunks),
-                        "embedding_model": self.model_name
-                    })
+                        "start": offsets[j][0],
+                        "end": offsets[j][1],
+                        "embedding_model": self.embedding_key
+                    }
+            get_tracer().record("ingest.extract", extract_seconds, pages=page_count, characters=characters)
         
         except Exception as e:
             print(f"❌ Error extracting content: {str(e)}")
             raise
+    
+    def _extract_pdf_content(self, file_path: str, document_name: str, 
+                           document_id: str, document_category: str, user_id: str) -> tuple:
+        chunks = []
+        metadata_list = []
+        
+        for chunk, metadata in self._iter_pdf_chunks(
+            file_path, document_name, document_id, document_category, user_id
+        ):
+            chunks.append(chunk)
+            metadata_list.append(metadata)
         
         return chunks, metadata_list
     
-    def search_documents(self, query: str, user_id: str = None, k: int = 5) -> List[dict]:
+    @staticmethod
+    def build_search_filter(user_id: str = None, document_ids: List[str] = None,
+                            document_category: str = None) -> dict:
+        """Payload filter restricting a search to a user, a set of documents and/or a category"""
+        search_filter = {}
+        if user_id:
+            search_filter["user_id"] = user_id
+        if document_ids:
+            search_filter["document_id"] = list(document_ids)
+        if document_category:
+            search_filter["document_category"] = document_category
+        return search_filter or None
+    
+    def _storage_filter(self, user_id: str = None, document_ids: List[str] = None,
+                        document_category: str = None) -> dict:
+        """build_search_filter for the stored points.
+        
+        Schema 2 points only carry a document key, so users and categories
+        are resolved to the matching documents' keys through the catalog. An
+        empty key list means nothing can match.
+        """
+        search_filter = self.build_search_filter(user_id, document_ids, document_category)
+        if not search_filter or self.payload_schema < 2:
+            return search_filter
+        if set(search_filter) == {"document_id"}:
+            return {"doc": [document_key(document_id) for document_id in search_filter["document_id"]]}
+        return {"doc": [document["doc"] for document in self.catalog.find(**search_filter)]}
+    
+    @traced("retrieval.search")
+    def search_documents(self, query: str, user_id: str = None, k: int = None,
+                         document_ids: List[str] = None, document_category: str = None,
+                         hybrid: bool = None, rerank_results: bool = None) -> List[dict]:
+        """Search chunks, optionally only those of user_id and/or the given documents.
+        
+        With hybrid retrieval the dense search and a BM25 keyword search run
+        side by side and are merged with reciprocal rank fusion; a local
+        cross-encoder can then re-order the candidates. The keyword search and
+        the reranker are skipped or cut short when they exceed their latency
+        budgets (see RetrievalSettings). k defaults to RETRIEVAL_TOP_K.
+        """
         try:
-            query_embedding = self.sentence_transformer.encode(query).tolist()
-            
-            search_filter = None
-            # if user_id:
-            #     search_filter = models.Filter(
-            #         must=[
-            #             models.FieldCondition(
-            #                 key="user_id",
-            #                 match=models.MatchValue(value=user_id)
-            #             )
-            #         ]
-            #     )
+            settings = self.retrieval
+            k = k or settings.top_k
+            hybrid = settings.hybrid if hybrid is None else hybrid
+            rerank_results = settings.rerank if rerank_results is None else rerank_results
+            candidates = max(k, settings.candidates) if hybrid or rerank_results else k
+            search_filter = self._storage_filter(user_id, document_ids, document_category)
+            if search_filter and search_filter.get("doc") == []:
+                print("✅ No documents in the search scope")
+                return []
+            timings = {}
             
             print(f"Searching for query: {query} in collection: {self.collection_name}")
-            search_results = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=k,
-                with_payload=True
-            )
-            print(f"✅ Found {len(search_results)} results")
+            started = time.perf_counter()
+            sparse_future = None
+            if hybrid and self.vector_store.supports_sparse():
+                sparse_future = get_retrieval_pool().submit(
+                    self.vector_store.sparse_search, self.bm25.encode_query(query), candidates, search_filter
+                )
             
-            formatted_results = []
-            for result in search_results:
-                formatted_results.append({
-                    "content": result.payload.get("page_content", ""),
-                    "metadata": {k: v for k, v in result.payload.items() if k != "page_content"},
-                    "score": result.score,
-                    "id": result.id
-                })
+            with span("embed.query", query_chars=len(query)):
+                query_embedding = self.query_cache.get_or_compute(
+                    query, self.embedding_key, self.sentence_transformer.encode
+                ).tolist()
+            with span("qdrant.search", limit=candidates) as search_span:
+                dense_results = self.vector_store.search(query_embedding, k=candidates, filter=search_filter)
+                search_span.set(points=len(dense_results))
+            timings["dense_ms"] = round((time.perf_counter() - started) * 1000, 1)
             
-            return formatted_results
+            rankings = [dense_results]
+            if sparse_future is not None:
+                remaining = settings.sparse_budget_ms / 1000 - (time.perf_counter() - started)
+                try:
+                    rankings.append(sparse_future.result(timeout=max(remaining, 0)))
+                    timings["sparse_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                except FutureTimeout:
+                    print("⏱️ Keyword search over budget, using dense results only")
+                except Exception as e:
+                    print(f"❌ Keyword search failed, using dense results only: {str(e)}")
+            
+            if len(rankings) > 1:
+                fused = reciprocal_rank_fusion(rankings)
+            else:
+                fused = [(record, record.score) for record in dense_results]
+            
+            if rerank_results and fused:
+                rerank_started = time.perf_counter()
+                fused, scored = rerank(
+                    query, fused[:candidates], lambda record: chunk_text(record.payload),
+                    settings.reranker_model, settings.rerank_budget_ms
+                )
+                timings["rerank_ms"] = round((time.perf_counter() - rerank_started) * 1000, 1)
+                timings["reranked"] = scored
+            
+            search_results = []
+            for record, score in fused[:k]:
+                record.score = score
+                search_results.append(record)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.last_search_timings = timings
+            current_span().set(results=len(search_results), **timings)
+            print(f"✅ Found {len(search_results)} results {timings}")
+            
+            return self._format_results(search_results)
             
         except Exception as e:
             print(f"❌ Error searching: {str(e)}")
             return []
     
-    def delete_document(self, document_id: str) -> bool:
-        """Delete all chunks of a document from Qdrant"""
+    async def asearch_documents(self, query: str, user_id: str = None, k: int = None,
+                                document_ids: List[str] = None, document_category: str = None) -> List[dict]:
+        """Async search_documents: embeds off the event loop and queries with AsyncQdrantClient (remote store)"""
+        if self.retrieval.hybrid or self.retrieval.rerank:
+            # The fused pipeline already runs its stages side by side on threads
+            return await asyncio.to_thread(
+                self.search_documents, query, user_id, k, document_ids, document_category
+            )
+        k = k or self.retrieval.top_k
         try:
-            # Delete points with matching document_id
-            self.qdrant_client.delete(
-                collection_name=self.collection_name,
-                points_selector=models.FilterSelector(
-                    filter=models.Filter(
-                        must=[
-                            models.FieldCondition(
-                                key="document_id",
-                                match=models.MatchValue(value=document_id)
-                            )
-                        ]
+            with span("retrieval.search") as search_span:
+                with span("embed.query", query_chars=len(query)):
+                    embedding = await asyncio.to_thread(
+                        self.query_cache.get_or_compute, query, self.embedding_key, self.sentence_transformer.encode
                     )
-                )
-            )
+                
+                print(f"Searching for query: {query} in collection: {self.collection_name}")
+                search_filter = await asyncio.to_thread(self._storage_filter, user_id, document_ids, document_category)
+                if search_filter and search_filter.get("doc") == []:
+                    print("✅ No documents in the search scope")
+                    return []
+                with span("qdrant.search", limit=k):
+                    search_results = await self.vector_store.asearch(embedding.tolist(), k=k, filter=search_filter)
+                search_span.set(results=len(search_results))
+                print(f"✅ Found {len(search_results)} results")
+                
+                return self._format_results(search_results)
+            
+        except Exception as e:
+            print(f"❌ Error searching: {str(e)}")
+            return []
+    
+    def _format_results(self, search_results) -> List[dict]:
+        formatted_results = []
+        for result in search_results:
+            # Compact points are joined with their document's catalog entry
+            document = self.catalog.get(result.payload["doc"]) if "doc" in result.payload else None
+            formatted_results.append({
+                "content": chunk_text(result.payload),
+                "metadata": result_metadata(result.payload, document),
+                "score": result.score,
+                "id": result.id
+            })
+        return formatted_results
+    
+    def delete_document(self, document_id: str) -> bool:
+        """Delete all chunks of a document from the vector store"""
+        try:
+            if self.payload_schema >= 2:
+                key = document_key(document_id)
+                self.vector_store.delete({"doc": key})
+                self.catalog.delete(key)
+            else:
+                # Delete points with matching document_id
+                self.vector_store.delete({"document_id": document_id})
+            self._notify_collection_changed()
             return True
             
         except Exception as e:
@@ -212,18 +681,18 @@ class PDFProcessorSimple:
             return False
     
     def get_collection_info(self) -> dict:
-        """Get information about the Qdrant collection"""
+        """Get information about the vector store collection"""
         try:
-            info = self.qdrant_client.get_collection(self.collection_name)
             return {
-                "vectors_count": info.vectors_count,
-                "indexed_vectors_count": info.indexed_vectors_count,
-                "points_count": info.points_count,
-                "segments_count": info.segments_count,
-                "status": info.status,
+                **self.vector_store.info(),
+                "vector_store": type(self.vector_store).__name__,
                 "embedding_model": self.model_name,
+                "embedding_backend": self.embedding_backend,
                 "collection_name": self.collection_name,
-                "qdrant_url": self.qdrant_url
+                "payload_schema": self.payload_schema,
+                "qdrant_url": self.qdrant_url,
+                "query_cache": self.query_cache.get_stats(),
+                "last_search_timings": self.last_search_timings
             }
         except Exception as e:
             print(f"Error getting collection info: {str(e)}")
@@ -231,7 +700,7 @@ class PDFProcessorSimple:
 
 # Test function
 def test_processing():
-    processor = PDFProcessorSimple()
+    processor = PDFProcessorSimple.get_shared()
     
     # Test with your PDF
     pdf_path = "uploads/2025080.pdf"
@@ -251,4 +720,6 @@ def test_processing():
         print(f"❌ File not found: {pdf_path}")
 
 if __name__ == "__main__":
-    test_processing() 
\ No newline at end of file
+    import sys
+    from bulk_ingest import main
+    sys.exit(main()) 
\ No newline at end of file
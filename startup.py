@@ -0,0 +1,144 @@
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from model_registry import registry
+
+# Heavy third-party modules in the order the app needs them. Imports are
+# cumulative, so a shared dependency (e.g. langchain_core) is charged to the
+# first module that pulls it in.
+HEAVY_MODULES = (
+    ("langgraph", "langgraph.graph"),
+    ("langchain_openai", "langchain_openai"),
+    ("qdrant_client", "qdrant_client"),
+    ("torch", "torch"),
+    ("sentence_transformers", "sentence_transformers"),
+    ("pypdfium2", "pypdfium2"),
+)
+
+
+class StartupProfile:
+    """Wall-clock cost of importing and initializing each component in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = []
+        self.done = threading.Event()
+
+    @contextmanager
+    def timed(self, component: str, phase: str):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except Exception as e:
+            status = f"failed: {str(e)}"
+            raise
+        finally:
+            with self._lock:
+                self.timings.append({
+                    "component": component,
+                    "phase": phase,
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "status": status,
+                })
+
+    def step(self, component: str, phase: str, func):
+        """Run func() timed; failures are recorded and printed, not raised"""
+        try:
+            with self.timed(component, phase):
+                func()
+        except Exception as e:
+            print(f"❌ Warm-up of {component} failed: {str(e)}")
+
+    def import_modules(self, modules=HEAVY_MODULES):
+        for component, module in modules:
+            if module in sys.modules:
+                continue
+            self.step(component, "import", lambda: importlib.import_module(module))
+
+    def report(self) -> list:
+        """Timed steps, plus build time per registry resource kind"""
+        with self._lock:
+            rows = list(self.timings)
+        for kind, stats in registry.get_stats().items():
+            if stats.get("build_seconds", 0) >= 0.001:
+                rows.append({"component": kind, "phase": "build", "seconds": round(stats["build_seconds"], 3),
+                             "status": "ok"})
+        return rows
+
+    def format_report(self) -> str:
+        lines = [f"{'component':<28} {'phase':<7} {'seconds':>8}"]
+        for row in self.report():
+            status = "" if row["status"] == "ok" else f"  ({row['status']})"
+            lines.append(f"{row['component']:<28} {row['phase']:<7} {row['seconds']:>8.3f}{status}")
+        return "\n".join(lines)
+
+
+def get_startup_profile() -> StartupProfile:
+    return registry.get_or_create("startup_profile", (), StartupProfile)
+
+
+def warm_up(qdrant_url: str = None, collection_name: str = None, include_llm: bool = True,
+            profile: StartupProfile = None) -> StartupProfile:
+    """Import heavy modules and build the shared models, clients and graphs"""
+    profile = profile or get_startup_profile()
+    profile.import_modules()
+
+    from pdf_processor_simple import PDFProcessorSimple
+    profile.step("document processor", "init",
+                 lambda: PDFProcessorSimple.get_shared(qdrant_url=qdrant_url, collection_name=collection_name))
+
+    from chat_agent import chat_agent
+    profile.step("tokenizer", "init", lambda: chat_agent.history_manager.encoding)
+    if include_llm:
+        profile.step("llm", "init", chat_agent.get_llm_with_tools)
+    profile.step("graph", "init", chat_agent.get_session_graph)
+    profile.done.set()
+    return profile
+
+
+def start_warmup(qdrant_url: str = None, collection_name: str = None) -> threading.Thread:
+    """Warm up once per process in a daemon thread (disable with STARTUP_WARMUP=0).
+
+    Requests that arrive first simply wait on the registry for the resource
+    the warm-up is already building, so nothing is loaded twice.
+    """
+    if os.getenv("STARTUP_WARMUP", "1") == "0":
+        return None
+
+    def factory():
+        started = time.perf_counter()
+
+        def run():
+            profile = warm_up(qdrant_url, collection_name)
+            print(f"✅ Warm-up finished in {time.perf_counter() - started:.1f}s\n{profile.format_report()}")
+
+        thread = threading.Thread(target=run, daemon=True, name="startup-warmup")
+        thread.start()
+        return thread
+
+    return registry.get_or_create("warmup_thread", (), factory)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import and initialization cost")
+    parser.add_argument("--no-llm", action="store_true", help="Skip building the chat model (no OPENAI_API_KEY)")
+    args = parser.parse_args(argv)
+
+    profile = get_startup_profile()
+    started = time.perf_counter()
+    # The app's own modules should be cheap to import; heavy work is deferred
+    profile.step("app modules", "import", lambda: importlib.import_module("chat_agent.chat_agent"))
+    warm_up(include_llm=not args.no_llm, profile=profile)
+    print(profile.format_report())
+    print(f"{'total':<28} {'':<7} {time.perf_counter() - started:>8.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,7 +6,7 @@ def test_pdf_processing():
     try:
         # Initialize processor
         print("Initializing PDF processor...")
-        processor = PDFProcessorSimple()
+        processor = PDFProcessorSimple.get_shared()
         print("✅ Processor initialized")
         
         # Test with existing PDF
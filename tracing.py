@@ -0,0 +1,318 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_registry import registry
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed pipeline stage. Numeric attributes (tokens, bytes, counts) are also summed per stage."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "started_at", "seconds", "status", "attributes")
+
+    def __init__(self, name: str, parent: "Span" = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self.status = "ok"
+        self.attributes = dict(attributes or {})
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        """Add to numeric attributes, e.g. tokens from several LLM calls"""
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": round(self.started_at, 6),
+            "ms": round(self.seconds * 1000, 2),
+            "status": self.status,
+            **self.attributes,
+        }
+
+
+class _NoSpan:
+    """Stand-in returned by current_span() outside any span"""
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, **counts):
+        pass
+
+
+class Tracer:
+    """Collects spans from every session in the process.
+
+    Keeps per-stage latency histograms and attribute totals for the
+    Prometheus text export, the last max_traces complete traces (e.g. chat
+    turns) for the latency panel and, with jsonl_path, appends every
+    finished span to a JSONL file. Spans nest through contextvars, so work
+    done in graph nodes, tools and asyncio.to_thread calls is attributed to
+    the turn that started it. Children of unfinished roots are held for
+    at most max_open_traces traces; children finishing after their root
+    are counted in the stage metrics but left out of the trace.
+    """
+
+    def __init__(self, jsonl_path: str = None, max_traces: int = 20, max_open_traces: int = 256,
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.jsonl_path = jsonl_path
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._open_traces = {}
+        self._max_open_traces = max_open_traces
+        # Roots already recorded, so children finishing after them are dropped
+        self._closed_traces = set()
+        self._closed_order = deque()
+        self._traces = deque(maxlen=max_traces)
+        self._jsonl = None
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        return cls(jsonl_path=os.getenv("TRACE_JSONL") or None,
+                   max_traces=int(os.getenv("TRACE_RECENT", "20")))
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Generator closed from another context (e.g. abandoned stream)
+                pass
+            self._finish(span)
+
+    def record(self, name: str, seconds: float, **attributes) -> Span:
+        """Add a stage timed elsewhere (e.g. summed over a stream) as a child of the current span"""
+        span = Span(name, _current_span.get(), attributes)
+        span.started_at -= seconds
+        span.seconds = seconds
+        self._finish(span)
+        return span
+
+    def traced(self, name: str = None):
+        """Decorator running a function (sync or async) inside a span"""
+        return _traced(lambda: self, name)
+
+    def _stage(self, name: str) -> dict:
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = {
+                "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                "buckets": [0] * len(self.buckets), "recent": deque(maxlen=256), "totals": {},
+            }
+        return stage
+
+    def _finish(self, span: Span):
+        with self._lock:
+            stage = self._stage(span.name)
+            stage["count"] += 1
+            stage["errors"] += span.status != "ok"
+            stage["seconds"] += span.seconds
+            stage["max_seconds"] = max(stage["max_seconds"], span.seconds)
+            stage["recent"].append(span.seconds)
+            for index, bound in enumerate(self.buckets):
+                if span.seconds <= bound:
+                    stage["buckets"][index] += 1
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage["totals"][key] = stage["totals"].get(key, 0) + value
+
+            if span.parent_id is None:
+                self._traces.append([span.to_dict()] + self._open_traces.pop(span.trace_id, []))
+                self._close_trace(span.trace_id)
+            elif span.trace_id not in self._closed_traces:
+                if span.trace_id not in self._open_traces and len(self._open_traces) >= self._max_open_traces:
+                    # Root never finished (e.g. abandoned stream): evict the oldest trace
+                    self._open_traces.pop(next(iter(self._open_traces)))
+                self._open_traces.setdefault(span.trace_id, []).append(span.to_dict())
+            if self.jsonl_path:
+                self._write(span)
+
+    def _close_trace(self, trace_id: str):
+        self._closed_traces.add(trace_id)
+        self._closed_order.append(trace_id)
+        if len(self._closed_order) > self._max_open_traces:
+            self._closed_traces.discard(self._closed_order.popleft())
+
+    def _write(self, span: Span):
+        try:
+            if self._jsonl is None:
+                self._jsonl = open(self.jsonl_path, "a", buffering=1)
+            self._jsonl.write(json.dumps(span.to_dict(), default=str) + "\n")
+        except OSError as e:
+            print(f"❌ Could not write trace to {self.jsonl_path}: {str(e)}")
+            self.jsonl_path = None
+
+    def recent_traces(self, root: str = None) -> list:
+        """Completed traces, newest first, each a list of span dicts with the root span first"""
+        with self._lock:
+            traces = list(self._traces)
+        return [trace for trace in reversed(traces) if root is None or trace[0]["name"] == root]
+
+    def get_stats(self) -> dict:
+        """Per stage: count, errors, mean/p50/p95/max ms and attribute totals"""
+        stats = {}
+        with self._lock:
+            for name, stage in self._stages.items():
+                recent = sorted(stage["recent"])
+                stats[name] = {
+                    "count": stage["count"],
+                    "errors": stage["errors"],
+                    "mean_ms": round(stage["seconds"] / stage["count"] * 1000, 2),
+                    "p50_ms": round(recent[len(recent) // 2] * 1000, 2),
+                    "p95_ms": round(recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000, 2),
+                    "max_ms": round(stage["max_seconds"] * 1000, 2),
+                    **stage["totals"],
+                }
+        return stats
+
+    def prometheus_text(self) -> str:
+        """All stages in the Prometheus text exposition format"""
+        lines = [
+            "# HELP rag_stage_duration_seconds Time spent in each pipeline stage",
+            "# TYPE rag_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, stage in stages:
+                label = f'stage="{_escape(name)}"'
+                # Bucket counts are already cumulative (each span counts in every bucket it fits)
+                for bound, count in zip(self.buckets, stage["buckets"]):
+                    lines.append(f'rag_stage_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'rag_stage_duration_seconds_bucket{{{label},le="+Inf"}} {stage["count"]}')
+                lines.append(f"rag_stage_duration_seconds_sum{{{label}}} {stage['seconds']:.6f}")
+                lines.append(f"rag_stage_duration_seconds_count{{{label}}} {stage['count']}")
+
+            lines += ["# HELP rag_stage_errors_total Stage runs that raised",
+                      "# TYPE rag_stage_errors_total counter"]
+            lines += [f'rag_stage_errors_total{{stage="{_escape(name)}"}} {stage["errors"]}' for name, stage in stages]
+
+            lines += ["# HELP rag_stage_attribute_total Sum of a numeric span attribute (tokens, bytes, items)",
+                      "# TYPE rag_stage_attribute_total counter"]
+            for name, stage in stages:
+                for key, value in sorted(stage["totals"].items()):
+                    lines.append(f'rag_stage_attribute_total{{stage="{_escape(name)}",attribute="{_escape(key)}"}} '
+                                 f'{value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._open_traces.clear()
+            self._closed_traces.clear()
+            self._closed_order.clear()
+            self._traces.clear()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _traced(get: callable, name: str = None):
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get().span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get().span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def get_tracer() -> Tracer:
+    return registry.get_or_create("tracer", (), Tracer.from_env)
+
+
+def span(name: str, **attributes):
+    """Context manager timing a block as a stage of the current trace"""
+    return get_tracer().span(name, **attributes)
+
+
+def traced(name: str = None):
+    """Decorator timing every call of a function (sync or async) as a stage"""
+    return _traced(get_tracer, name)
+
+
+def current_span():
+    """The innermost open span, to attach attributes to (a no-op outside spans)"""
+    return _current_span.get() or _NoSpan()
+
+
+def start_metrics_server(port: int = None, host: str = None) -> ThreadingHTTPServer:
+    """Serve /metrics in the Prometheus text format from a daemon thread, once per process.
+
+    port defaults to METRICS_PORT; returns None when that is unset or 0.
+    """
+    port = int(port if port is not None else os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+
+    def factory():
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = get_tracer().prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+        print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    return registry.get_or_create("metrics_server", (host, port), factory)
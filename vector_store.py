@@ -0,0 +1,758 @@
+import asyncio
+import json
+import os
+import threading
+from typing import List
+
+import numpy as np
+
+# QDRANT_URL values starting with this prefix select the embedded backend,
+# e.g. QDRANT_URL=local:./vector_store
+LOCAL_URL_PREFIX = "local:"
+
+# Name of the BM25 sparse vector stored next to the dense one
+SPARSE_VECTOR_NAME = "bm25"
+
+# Qdrant collection profiles, selected with QDRANT_PROFILE. Quantized profiles
+# keep compressed vectors in RAM for the HNSW walk and the float32 originals on
+# disk, then rescore the oversampled candidates with the originals.
+COLLECTION_PROFILES = {
+    # float32 vectors in RAM, default HNSW (the original settings)
+    "default": {},
+    # int8 per dimension in RAM (~4x smaller)
+    "scalar": {"quantization": "scalar", "on_disk": True, "m": 16, "ef_construct": 128,
+               "hnsw_ef": 128, "oversampling": 2.0},
+    # 1 bit per dimension in RAM (~32x smaller); needs more oversampling for recall
+    "binary": {"quantization": "binary", "on_disk": True, "m": 16, "ef_construct": 128,
+               "hnsw_ef": 128, "oversampling": 3.0},
+}
+
+
+class VectorRecord:
+    """A stored point as returned by search and scroll (score is None for scroll).
+
+    sparse is the (indices, values) BM25 vector when it was requested and exists.
+    """
+
+    __slots__ = ("id", "payload", "vector", "score", "sparse")
+
+    def __init__(self, id, payload: dict, vector=None, score: float = None, sparse: tuple = None):
+        self.id = id
+        self.payload = payload
+        self.vector = vector
+        self.score = score
+        self.sparse = sparse
+
+    def __repr__(self):
+        return f"VectorRecord(id={self.id!r}, score={self.score!r})"
+
+
+class VectorStore:
+    """Operations PDFProcessorSimple needs from a vector database.
+
+    Filters are plain dicts of payload field -> value; a list value matches
+    any of its items. Cosine similarity is used for dense vectors; sparse
+    vectors are (indices, values) pairs scored with BM25 IDF weighting.
+    """
+
+    def collection_exists(self) -> bool:
+        raise NotImplementedError
+
+    def create_collection(self, vector_size: int):
+        raise NotImplementedError
+
+    def create_payload_index(self, field: str, is_tenant: bool = False):
+        """Index a keyword payload field so filters on it avoid a full scan"""
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], vectors: list, payloads: List[dict], wait: bool = True,
+               sparse_vectors: List[tuple] = None):
+        raise NotImplementedError
+
+    def search(self, vector, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        raise NotImplementedError
+
+    def supports_sparse(self) -> bool:
+        return False
+
+    def sparse_search(self, sparse_vector: tuple, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        raise NotImplementedError
+
+    async def asearch(self, vector, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        return await asyncio.to_thread(self.search, vector, k, filter)
+
+    def scroll(self, filter: dict = None, limit: int = 256, offset=None,
+               with_payload=True, with_vectors: bool = False) -> tuple:
+        """Return (records, next_offset); next_offset is None on the last page"""
+        raise NotImplementedError
+
+    def delete(self, filter: dict):
+        raise NotImplementedError
+
+    def info(self) -> dict:
+        raise NotImplementedError
+
+
+class QdrantVectorStore(VectorStore):
+    """Remote Qdrant collection, through the process-wide pooled client.
+
+    profile (a COLLECTION_PROFILES key) sets quantization, HNSW and on-disk
+    storage for collections created here, and the matching search params.
+    """
+
+    def __init__(self, qdrant_url: str, collection_name: str, api_key: str = None, profile: str = None):
+        from model_registry import registry
+        self.qdrant_url = qdrant_url
+        self.collection_name = collection_name
+        self.api_key = api_key
+        self.profile = profile or os.getenv("QDRANT_PROFILE", "default")
+        if self.profile not in COLLECTION_PROFILES:
+            raise ValueError(f"Unknown Qdrant profile {self.profile!r}, expected one of {list(COLLECTION_PROFILES)}")
+        self.settings = COLLECTION_PROFILES[self.profile]
+        self.client = registry.get_qdrant_client(qdrant_url, api_key)
+
+    @staticmethod
+    def _filter(filter: dict):
+        from qdrant_client.http import models
+        if not filter:
+            return None
+        conditions = []
+        for key, value in filter.items():
+            if isinstance(value, (list, tuple, set)):
+                match = models.MatchAny(any=list(value))
+            else:
+                match = models.MatchValue(value=value)
+            conditions.append(models.FieldCondition(key=key, match=match))
+        return models.Filter(must=conditions)
+
+    @staticmethod
+    def _record(point) -> VectorRecord:
+        vector, sparse = getattr(point, "vector", None), None
+        if isinstance(vector, dict):
+            # Collections with a sparse vector return all vectors by name
+            stored_sparse = vector.get(SPARSE_VECTOR_NAME)
+            if stored_sparse is not None:
+                sparse = (list(stored_sparse.indices), list(stored_sparse.values))
+            vector = vector.get("")
+        return VectorRecord(point.id, point.payload or {}, vector, getattr(point, "score", None), sparse)
+
+    def collection_exists(self) -> bool:
+        collections = self.client.get_collections()
+        return self.collection_name in [col.name for col in collections.collections]
+
+    def create_collection(self, vector_size: int):
+        from qdrant_client.http import models
+        settings = self.settings
+        quantization = None
+        if settings.get("quantization") == "scalar":
+            quantization = models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            ))
+        elif settings.get("quantization") == "binary":
+            quantization = models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+
+        hnsw = None
+        if "m" in settings:
+            hnsw = models.HnswConfigDiff(m=settings["m"], ef_construct=settings["ef_construct"])
+
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=models.VectorParams(
+                size=vector_size,
+                distance=models.Distance.COSINE,
+                on_disk=settings.get("on_disk")
+            ),
+            sparse_vectors_config={
+                SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)
+            },
+            hnsw_config=hnsw,
+            quantization_config=quantization
+        )
+        self._sparse = True
+
+    def supports_sparse(self) -> bool:
+        """Whether the collection has the BM25 sparse vector (older collections do not)"""
+        if getattr(self, "_sparse", None) is None:
+            params = self.client.get_collection(self.collection_name).config.params
+            self._sparse = SPARSE_VECTOR_NAME in (params.sparse_vectors or {})
+        return self._sparse
+
+    def create_payload_index(self, field: str, is_tenant: bool = False):
+        from qdrant_client.http import models
+        info = self.client.get_collection(self.collection_name)
+        if field in (info.payload_schema or {}):
+            return
+        # is_tenant co-locates each tenant's points on disk, which keeps
+        # per-user searches fast in a large shared collection
+        schema = models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True) \
+            if is_tenant else models.PayloadSchemaType.KEYWORD
+        self.client.create_payload_index(self.collection_name, field_name=field, field_schema=schema, wait=True)
+        print(f"✅ Created payload index on {field}")
+
+    def _search_params(self):
+        from qdrant_client.http import models
+        settings = self.settings
+        if not settings:
+            return None
+        return models.SearchParams(
+            hnsw_ef=settings.get("hnsw_ef"),
+            quantization=models.QuantizationSearchParams(
+                rescore=True, oversampling=settings.get("oversampling")
+            ) if settings.get("quantization") else None
+        )
+
+    def upsert(self, ids: List[str], vectors, payloads: List[dict], wait: bool = True,
+               sparse_vectors: List[tuple] = None):
+        from qdrant_client.http import models
+        # Column-oriented batch; one tolist() for the whole float32 matrix
+        dense = np.asarray(vectors, dtype=np.float32).tolist()
+        if sparse_vectors is not None and None not in sparse_vectors and self.supports_sparse():
+            batch_vectors = {
+                "": dense,
+                SPARSE_VECTOR_NAME: [
+                    models.SparseVector(indices=indices, values=values) for indices, values in sparse_vectors
+                ],
+            }
+        else:
+            batch_vectors = dense
+        batch = models.Batch(ids=list(ids), vectors=batch_vectors, payloads=payloads)
+        self.client.upsert(collection_name=self.collection_name, points=batch, wait=wait)
+
+    def search(self, vector, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            query=list(vector),
+            query_filter=self._filter(filter),
+            search_params=self._search_params(),
+            limit=k,
+            with_payload=True
+        )
+        return [self._record(point) for point in response.points]
+
+    def sparse_search(self, sparse_vector: tuple, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        from qdrant_client.http import models
+        indices, values = sparse_vector
+        # query_points (Qdrant >= 1.10, same as the IDF modifier) scores sparse vectors server-side
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            query=models.SparseVector(indices=indices, values=values),
+            using=SPARSE_VECTOR_NAME,
+            query_filter=self._filter(filter),
+            limit=k,
+            with_payload=True
+        )
+        return [self._record(point) for point in response.points]
+
+    async def asearch(self, vector, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        from model_registry import MEMORY_URL, registry
+        if self.qdrant_url == MEMORY_URL:
+            # An async client would get its own, empty in-memory instance
+            return await asyncio.to_thread(self.search, vector, k, filter)
+        client = registry.get_async_qdrant_client(self.qdrant_url, self.api_key)
+        response = await client.query_points(
+            collection_name=self.collection_name,
+            query=list(vector),
+            query_filter=self._filter(filter),
+            search_params=self._search_params(),
+            limit=k,
+            with_payload=True
+        )
+        return [self._record(point) for point in response.points]
+
+    def scroll(self, filter: dict = None, limit: int = 256, offset=None,
+               with_payload=True, with_vectors: bool = False) -> tuple:
+        records, next_offset = self.client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=self._filter(filter),
+            limit=limit,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=with_vectors
+        )
+        return [self._record(record) for record in records], next_offset
+
+    def delete(self, filter: dict):
+        from qdrant_client.http import models
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(filter=self._filter(filter))
+        )
+
+    def info(self) -> dict:
+        info = self.client.get_collection(self.collection_name)
+        return {
+            # vectors_count is gone from newer clients; it equals points_count for single-vector collections
+            "vectors_count": getattr(info, "vectors_count", info.points_count),
+            "indexed_vectors_count": info.indexed_vectors_count,
+            "points_count": info.points_count,
+            "segments_count": info.segments_count,
+            "status": info.status,
+            "profile": self.profile,
+        }
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector index for single-node deployments and offline tests.
+
+    Layout under ``<directory>/<collection>/``:
+      vectors.f32     append-only float32 matrix of unit-normalized vectors,
+                      read through a memory map
+      payloads.jsonl  sidecar with one {"row", "id", "payload", "sparse"} line
+                      per vector, plus {"deleted": [rows]} tombstones
+      meta.json       dimension and indexed payload fields
+
+    Indexed payload fields keep an in-memory value -> rows map, so filters on
+    them only touch the matching rows. Sparse vectors are kept as in-memory
+    term -> rows postings for BM25 search.
+
+    Search is an exact vectorized dot product over the live rows. With
+    use_hnsw=True and hnswlib installed, unfiltered and filtered searches go
+    through an HNSW graph instead once the collection has hnsw_min_rows
+    points. Only one process should write to a directory at a time; other
+    processes pick up appended rows on their next read.
+    """
+
+    def __init__(self, directory: str, collection_name: str, use_hnsw: bool = False,
+                 hnsw_min_rows: int = 20000, hnsw_ef: int = 128, compact_ratio: float = 0.5):
+        self.directory = os.path.join(directory, collection_name)
+        self.collection_name = collection_name
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.payloads_path = os.path.join(self.directory, "payloads.jsonl")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.use_hnsw = use_hnsw
+        self.hnsw_min_rows = hnsw_min_rows
+        self.hnsw_ef = hnsw_ef
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._reset()
+        self._load_meta()
+
+    @classmethod
+    def from_url(cls, url: str, collection_name: str) -> "LocalVectorStore":
+        return cls(
+            url[len(LOCAL_URL_PREFIX):] or "vector_store",
+            collection_name,
+            use_hnsw=os.getenv("LOCAL_VECTOR_HNSW", "0") == "1",
+            hnsw_min_rows=int(os.getenv("LOCAL_VECTOR_HNSW_MIN_ROWS", "20000")),
+            hnsw_ef=int(os.getenv("LOCAL_VECTOR_HNSW_EF", "128")),
+        )
+
+    def _reset(self):
+        self.dim = None
+        self._ids = []          # row -> point id
+        self._payloads = []     # row -> payload
+        self._live = np.zeros(0, dtype=bool)
+        self._rows_by_id = {}
+        self._sidecar_offset = 0
+        self._mmap = None
+        self._hnsw = None
+        self._hnsw_rows = 0
+        self._indexes = {}      # field -> value -> [rows]
+        self._sparse = []       # row -> (indices, values) or None
+        self._postings = {}     # term -> ([rows], [weights])
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            for field in meta.get("indexes", []):
+                self._build_index(field)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "distance": "cosine", "indexes": sorted(self._indexes)}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _build_index(self, field: str):
+        if field in self._indexes:
+            return
+        index = self._indexes[field] = {}
+        for row in np.flatnonzero(self._live[:len(self._ids)]):
+            self._index_row(index, field, int(row), self._payloads[row])
+
+    @staticmethod
+    def _index_row(index: dict, field: str, row: int, payload: dict):
+        value = payload.get(field)
+        if isinstance(value, (str, int, bool)):
+            index.setdefault(value, []).append(row)
+
+    # -- reading ---------------------------------------------------------
+
+    def _refresh(self):
+        """Replay sidecar lines written since the last read (by us or another process)"""
+        if self.dim is None:
+            self._load_meta()
+        if not os.path.exists(self.payloads_path):
+            return
+        if os.path.getsize(self.payloads_path) < self._sidecar_offset:
+            # Compacted by another process
+            self._reset()
+            self._load_meta()
+
+        deleted = []
+        with open(self.payloads_path, "r") as f:
+            f.seek(self._sidecar_offset)
+            while True:
+                line = f.readline()
+                if not line.endswith("\n"):
+                    # Partial line still being written
+                    break
+                self._sidecar_offset = f.tell()
+                entry = json.loads(line)
+                if "deleted" in entry:
+                    deleted.extend(entry["deleted"])
+                    continue
+                self._add_row(entry["row"], entry["id"], entry["payload"], entry.get("sparse"))
+        for row in deleted:
+            self._mark_deleted(row)
+
+    @staticmethod
+    def _sidecar_line(row: int, point_id, payload: dict, sparse: tuple = None) -> str:
+        entry = {"row": row, "id": point_id, "payload": payload}
+        if sparse is not None:
+            entry["sparse"] = [list(sparse[0]), list(sparse[1])]
+        return json.dumps(entry) + "\n"
+
+    def _add_row(self, row: int, point_id, payload: dict, sparse: list = None):
+        if row >= len(self._live):
+            self._live = np.concatenate([self._live, np.zeros(max(1024, row + 1 - len(self._live)), dtype=bool)])
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._payloads.append(None)
+            self._sparse.append(None)
+        previous = self._rows_by_id.get(point_id)
+        if previous is not None:
+            self._mark_deleted(previous)
+        self._ids[row] = point_id
+        self._payloads[row] = payload
+        self._live[row] = True
+        self._rows_by_id[point_id] = row
+        # Index entries of deleted rows are left in place; lookups are
+        # masked with _live and compaction rebuilds the maps
+        for field, index in self._indexes.items():
+            self._index_row(index, field, row, payload)
+        if sparse:
+            self._sparse[row] = (sparse[0], sparse[1])
+            for term, weight in zip(*sparse):
+                posting = self._postings.setdefault(term, ([], []))
+                posting[0].append(row)
+                posting[1].append(weight)
+
+    def _mark_deleted(self, row: int):
+        if row < len(self._ids) and self._live[row]:
+            self._live[row] = False
+            self._rows_by_id.pop(self._ids[row], None)
+            self._payloads[row] = None
+            self._sparse[row] = None
+            if self._hnsw is not None and row < self._hnsw_rows:
+                self._hnsw.mark_deleted(row)
+
+    def _matrix(self) -> np.ndarray:
+        rows = len(self._ids)
+        if rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self._mmap is None or self._mmap.shape[0] < rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._mmap[:rows]
+
+    def _matches(self, payload: dict, filter: dict) -> bool:
+        for key, value in filter.items():
+            field = payload.get(key)
+            if isinstance(value, (list, tuple, set)):
+                if field not in value:
+                    return False
+            elif field != value:
+                return False
+        return True
+
+    def _candidate_mask(self, filter: dict) -> np.ndarray:
+        live = self._live[:len(self._ids)]
+        if not filter:
+            return live.copy()
+
+        # Narrow with indexed fields first, then check the rest row by row
+        rows = None
+        remaining = {}
+        for key, value in filter.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if key in self._indexes:
+                matched = np.fromiter(
+                    (row for item in values for row in self._indexes[key].get(item, ())), dtype=np.int64
+                )
+                rows = matched if rows is None else np.intersect1d(rows, matched)
+            else:
+                remaining[key] = set(values) if isinstance(value, (list, tuple, set)) else value
+
+        if rows is None:
+            mask = live.copy()
+        else:
+            mask = np.zeros(len(live), dtype=bool)
+            mask[rows] = True
+            mask &= live
+        if remaining:
+            for row in np.flatnonzero(mask):
+                if not self._matches(self._payloads[row], remaining):
+                    mask[row] = False
+        return mask
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    # -- VectorStore -----------------------------------------------------
+
+    def collection_exists(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def create_collection(self, vector_size: int):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self.dim = vector_size
+            self._write_meta()
+            open(self.vectors_path, "ab").close()
+            open(self.payloads_path, "a").close()
+
+    def create_payload_index(self, field: str, is_tenant: bool = False):
+        with self._lock:
+            self._refresh()
+            if field not in self._indexes:
+                self._build_index(field)
+                self._write_meta()
+
+    def upsert(self, ids: List[str], vectors: list, payloads: List[dict], wait: bool = True,
+               sparse_vectors: List[tuple] = None):
+        vectors = self._normalize(vectors)
+        sparse_vectors = sparse_vectors or [None] * len(ids)
+        with self._lock:
+            self._refresh()
+            # Vectors first: a reader only sees rows once their sidecar line exists
+            with open(self.vectors_path, "ab") as f:
+                # Rows come from the vectors file, not the sidecar: an interrupted
+                # upsert can leave vectors without sidecar lines (orphan rows are
+                # skipped, and dropped by compact()), and a partial row is trimmed
+                row_bytes = 4 * self.dim
+                size = os.fstat(f.fileno()).st_size
+                f.truncate(size - size % row_bytes)
+                start = size // row_bytes
+                f.write(vectors.tobytes())
+            lines = []
+            for i, (point_id, payload, sparse) in enumerate(zip(ids, payloads, sparse_vectors)):
+                lines.append(self._sidecar_line(start + i, point_id, payload, sparse))
+            with open(self.payloads_path, "a") as f:
+                f.write("".join(lines))
+            self._refresh()
+
+    def search(self, vector, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        query = self._normalize(vector).ravel()
+        with self._lock:
+            self._refresh()
+            if not self._ids:
+                return []
+            mask = self._candidate_mask(filter)
+            candidates = int(mask.sum())
+            if not candidates:
+                return []
+
+            hits = self._search_hnsw(query, min(k, candidates), mask)
+            if hits is not None:
+                rows, scores = hits
+            else:
+                rows = np.flatnonzero(mask)
+                if candidates * 4 < len(mask):
+                    # Selective filter: only read the matching rows
+                    scores = self._matrix()[rows] @ query
+                else:
+                    # Score every row in one matrix-vector product straight off
+                    # the memory map, then drop rows outside the filter
+                    scores = (self._matrix() @ query)[rows]
+                if len(rows) > k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    rows, scores = rows[top], scores[top]
+                order = np.argsort(-scores)
+                rows, scores = rows[order], scores[order]
+
+            return [
+                VectorRecord(self._ids[row], self._payloads[row], score=float(score))
+                for row, score in zip(rows, scores)
+            ]
+
+    def supports_sparse(self) -> bool:
+        return True
+
+    def sparse_search(self, sparse_vector: tuple, k: int = 5, filter: dict = None) -> List[VectorRecord]:
+        from hybrid_retrieval import bm25_idf
+        with self._lock:
+            self._refresh()
+            if not self._ids:
+                return []
+            mask = self._candidate_mask(filter)
+            document_count = int(mask.sum())
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            for term, weight in zip(*sparse_vector):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                # A row appears at most once per term, so fancy-index += is safe
+                rows = np.asarray(posting[0])
+                scores[rows] += weight * bm25_idf(document_count, len(rows)) * np.asarray(posting[1], dtype=np.float32)
+            scores[~mask] = 0
+            rows = np.flatnonzero(scores > 0)
+            if len(rows) > k:
+                rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+            rows = rows[np.argsort(-scores[rows])]
+            return [VectorRecord(self._ids[row], self._payloads[row], score=float(scores[row])) for row in rows]
+
+    def scroll(self, filter: dict = None, limit: int = 256, offset=None,
+               with_payload=True, with_vectors: bool = False) -> tuple:
+        with self._lock:
+            self._refresh()
+            mask = self._candidate_mask(filter)
+            rows = np.flatnonzero(mask[offset or 0:]) + (offset or 0)
+            page, rest = rows[:limit], rows[limit:]
+            matrix = self._matrix() if with_vectors else None
+
+            records = []
+            for row in page:
+                payload = self._payloads[row]
+                if isinstance(with_payload, (list, tuple)):
+                    payload = {key: payload[key] for key in with_payload if key in payload}
+                elif not with_payload:
+                    payload = {}
+                vector = matrix[row].tolist() if with_vectors else None
+                sparse = self._sparse[row] if with_vectors else None
+                records.append(VectorRecord(self._ids[row], payload, vector, sparse=sparse))
+            return records, (int(rest[0]) if len(rest) else None)
+
+    def delete(self, filter: dict):
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._candidate_mask(filter)).tolist()
+            if not rows:
+                return
+            with open(self.payloads_path, "a") as f:
+                f.write(json.dumps({"deleted": rows}) + "\n")
+            self._refresh()
+            dead = len(self._ids) - int(self._live.sum())
+            if dead > self.compact_ratio * len(self._ids):
+                self.compact()
+
+    def compact(self):
+        """Rewrite the files without deleted rows"""
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._live[:len(self._ids)])
+            vectors = np.array(self._matrix()[rows]) if len(rows) else np.zeros((0, self.dim), np.float32)
+            ids = [self._ids[row] for row in rows]
+            payloads = [self._payloads[row] for row in rows]
+            sparse = [self._sparse[row] for row in rows]
+
+            self._mmap = None
+            for path, data in ((self.vectors_path, vectors.tobytes()), (self.payloads_path, None)):
+                tmp_path = path + ".tmp"
+                if data is not None:
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                else:
+                    with open(tmp_path, "w") as f:
+                        f.writelines(
+                            self._sidecar_line(i, point_id, payload, sparse_vector)
+                            for i, (point_id, payload, sparse_vector) in enumerate(zip(ids, payloads, sparse))
+                        )
+                os.replace(tmp_path, path)
+            self._reset()
+            self._load_meta()
+            self._refresh()
+            print(f"✅ Compacted {self.collection_name}: {len(ids)} live vectors")
+
+    def info(self) -> dict:
+        with self._lock:
+            self._refresh()
+            points = int(self._live[:len(self._ids)].sum())
+            return {
+                "vectors_count": points,
+                "indexed_vectors_count": self._hnsw_rows if self._hnsw is not None else 0,
+                "points_count": points,
+                "segments_count": 1,
+                "status": "green",
+            }
+
+    # -- HNSW ------------------------------------------------------------
+
+    def _search_hnsw(self, query: np.ndarray, k: int, mask: np.ndarray):
+        """(rows, scores) from the HNSW graph, or None to fall back to exact search"""
+        hnsw = self._get_hnsw()
+        if hnsw is None:
+            return None
+        try:
+            labels, distances = hnsw.knn_query(query, k=k, filter=lambda row: bool(mask[row]))
+        except RuntimeError:
+            # Very selective filters can leave the graph walk short of k hits
+            return None
+        return labels[0], 1.0 - distances[0]
+
+    def _get_hnsw(self):
+        """HNSW graph over all rows, extended incrementally as rows are appended"""
+        rows = len(self._ids)
+        if not self.use_hnsw or rows < self.hnsw_min_rows:
+            return None
+        try:
+            import hnswlib
+        except ImportError:
+            print("❌ hnswlib is not installed, using exact search")
+            self.use_hnsw = False
+            return None
+
+        if self._hnsw is None:
+            self._hnsw = hnswlib.Index(space="ip", dim=self.dim)
+            self._hnsw.init_index(max_elements=max(rows * 2, 1024), ef_construction=200, M=16)
+            self._hnsw.set_ef(self.hnsw_ef)
+            self._hnsw_rows = 0
+        if rows > self._hnsw_rows:
+            if rows > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(rows * 2)
+            new_rows = np.arange(self._hnsw_rows, rows)
+            self._hnsw.add_items(np.asarray(self._matrix()[self._hnsw_rows:rows]), new_rows)
+            for row in new_rows[~self._live[self._hnsw_rows:rows]]:
+                self._hnsw.mark_deleted(int(row))
+            self._hnsw_rows = rows
+        return self._hnsw
+
+
+def create_vector_store(qdrant_url: str, collection_name: str, api_key: str = None,
+                        profile: str = None) -> VectorStore:
+    """Qdrant for http(s) URLs (or in-memory for :memory:), LocalVectorStore for local:<directory>"""
+    if qdrant_url.startswith(LOCAL_URL_PREFIX):
+        return LocalVectorStore.from_url(qdrant_url, collection_name)
+    return QdrantVectorStore(qdrant_url, collection_name, api_key, profile)
+
+
+def copy_collection(source: VectorStore, target: VectorStore, vector_size: int,
+                    batch_size: int = 256, sparse_encoder=None) -> int:
+    """Copy every point (id, vector, payload) from source into target; returns the point count.
+
+    Creates target if needed, so copying into a store with a different
+    profile rebuilds the collection under that profile. Points without a
+    sparse vector get one from sparse_encoder(chunk text) when given.
+    """
+    if not target.collection_exists():
+        target.create_collection(vector_size)
+    copied = 0
+    offset = None
+    while True:
+        records, offset = source.scroll(limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+        if records:
+            sparse = [
+                record.sparse if record.sparse is not None or sparse_encoder is None
+                else sparse_encoder(record.payload.get("text", record.payload.get("page_content", "")))
+                for record in records
+            ]
+            target.upsert([record.id for record in records], [record.vector for record in records],
+                          [record.payload for record in records], wait=offset is None, sparse_vectors=sparse)
+            copied += len(records)
+            print(f"✅ Copied {copied} points")
+        if offset is None:
+            return copied